@@ -1,7 +1,9 @@
+import argparse
 import asyncio
-import base64
 import logging
+import os
 import re
+import time
 import traceback
 from configparser import ConfigParser
 from importlib import metadata
@@ -12,38 +14,40 @@ import discord
 from discord.ext import commands
 
 from fuzzy import cogs
-from fuzzy.customizations import Fuzzy
-from fuzzy.databases import Database
+from fuzzy.cluster import Supervisor
+from fuzzy.customizations import FieldFormatter, Fuzzy
+from fuzzy.databases import Database, open_database
 from fuzzy.errors import AnticipatedError, PleaseRestate, Unauthorized
 from fuzzy.models import DurationType, GuildSettings
+from fuzzy.transfer import (
+    EXPORT_FORMATS,
+    IMPORT_FORMATS,
+    export_infractions,
+    guess_import_format,
+    import_infractions,
+)
 
 config = ConfigParser()
 config.read("./fuzzy.cfg")
+# the cluster supervisor tells each of its workers which shards to run
+if "FUZZY_SHARD_IDS" in os.environ:
+    config["discord"]["shard_count"] = os.environ["FUZZY_SHARD_COUNT"]
+    config["discord"]["shard_ids"] = os.environ["FUZZY_SHARD_IDS"]
 
-logging.basicConfig(
-    format="%(levelname)s %(name)s: %(message)s", level=config["log"]["level"]
-)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(FieldFormatter("%(levelname)s %(name)s: %(message)s"))
+logging.basicConfig(level=config["log"]["level"], handlers=[log_handler])
 
 for source in config["log"]["suppress"].split(","):
     logging.getLogger(source).addFilter(
         lambda row: row.levelno > getattr(logging, config["log"]["level"])
     )
 
-intents = discord.Intents.default()
-intents.members = True
-intents.message_content = True
+log = logging.getLogger("Fuzzy")
 
+# created by main, so the maintenance commands don't have to set up a whole bot
 # noinspection PyTypeChecker
-database: Database = Database(config)
-
-bot = Fuzzy(
-    config,
-    database,
-    case_insensitive=True,
-    activity=Fuzzy.random_status(),
-    help_command=None,
-    intents=intents,
-)
+bot: Fuzzy = None
 
 
 def process_docstrings(text) -> str:
@@ -62,7 +66,6 @@ def process_docstrings(text) -> str:
 ONCE_LOCK = False
 
 
-@bot.event
 async def on_ready():
     """Hello world."""
     bot.log.info(f"Logged in as {bot.user}")
@@ -77,39 +80,46 @@ async def on_ready():
 
         ONCE_LOCK = True
         for guild in bot.guilds:
-            guild_settings = bot.db.guilds.find_by_id(guild.id)
-            if not guild_settings:
-                # noinspection PyTypeChecker
-                bot.db.guilds.save(
-                    GuildSettings(
-                        guild.id,
-                        None,
-                        None,
-                        DurationType.YEARS,
-                        30,
-                        None,
-                    )
-                )
+            setup_guild(bot.db, guild.id)
 
 
-@bot.command()
+@commands.command()
 async def ping(ctx):
-    """Pings the bot. Mostly used to check bot status."""
-    embed = discord.Embed(
-        title="**Ping**", description=f"Pong! {round(bot.latency * 1000)}ms"
-    )
+    """Pings the bot. Mostly used to check bot status. Lists the latency of every shard if there
+    is more than one."""
+    description = f"Pong! {round(bot.latency * 1000)}ms"
+    try:
+        statuses = await bot.cluster_status()
+    except (ConnectionError, asyncio.TimeoutError):
+        statuses = [await bot.worker_status()]
+        description += "\nCould not reach the other workers of the cluster."
+    latencies = [
+        (shard_id, latency)
+        for status in statuses
+        for shard_id, latency in status["latencies"]
+    ]
+    if len(latencies) > 1:
+        description += "\n" + "\n".join(
+            f"Shard {shard_id}: {latency * 1000:.0f}ms"
+            for shard_id, latency in sorted(latencies)
+        )
+    embed = discord.Embed(title="**Ping**", description=description[:4096])
     embed.set_author(name=f"{bot.user.name}", icon_url=bot.user.display_avatar.url)
     await ctx.send(embed=embed)
 
 
-@bot.event
 async def on_guild_join(guild: discord.Guild):
-    guild_settings = bot.db.guilds.find_by_id(guild.id)
+    setup_guild(bot.db, guild.id)
+
+
+def setup_guild(database: Database, guild_id: int) -> GuildSettings:
+    """Save the default settings for a guild if it has none yet."""
+    guild_settings = database.guilds.find_by_id(guild_id)
     if not guild_settings:
         # noinspection PyTypeChecker
-        bot.db.guilds.save(
+        guild_settings = database.guilds.save(
             GuildSettings(
-                guild.id,
+                guild_id,
                 None,
                 None,
                 DurationType.YEARS,
@@ -117,9 +127,10 @@ async def on_guild_join(guild: discord.Guild):
                 None,
             )
         )
+    return guild_settings
 
 
-@bot.command(name="help")
+@commands.command(name="help")
 async def _help(ctx: Fuzzy.Context, *, subject: Optional[str]):
     """Display the usage of commands."""
 
@@ -186,24 +197,62 @@ async def _help(ctx: Fuzzy.Context, *, subject: Optional[str]):
     await ctx.send(embed=embed)
 
 
-@bot.event
+def log_fields(ctx: Fuzzy.Context, **fields) -> dict:
+    """Build the structured fields attached to command log records."""
+    return {
+        "fields": {
+            "guild": ctx.guild.id if ctx.guild else None,
+            "command": ctx.command.qualified_name if ctx.command else None,
+            **fields,
+        }
+    }
+
+
 async def on_command(ctx: Fuzzy.Context):
     """Log when we invoke commands"""
+    bot.metrics.count("fuzzy_commands_total", command=ctx.command.qualified_name)
+    if not ctx.log.isEnabledFor(logging.INFO):
+        return
     args = [
         arg
         for arg in ctx.args
         if not isinstance(arg, Fuzzy.Cog) and not isinstance(arg, Fuzzy.Context)
     ]
     args.extend(list(ctx.kwargs.values()))
-    ctx.log.info(f"{ctx.author} invoked with {args}")
+    ctx.log.info("%s invoked with %s", ctx.author, args, extra=log_fields(ctx))
+
+
+async def before_invoke(ctx: Fuzzy.Context):
+    """Start profiling right before the command runs. on_command is dispatched as a separate
+    task, so it could start after the command already did its first synchronous work."""
+    bot.profiler.start(ctx)
+
+
+async def on_command_completion(ctx: Fuzzy.Context):
+    """Record and log how long commands took"""
+    latency = time.perf_counter() - ctx.started_at
+    bot.profiler.stop(ctx)
+    bot.metrics.observe(
+        "fuzzy_command_seconds", latency, command=ctx.command.qualified_name
+    )
+    if ctx.log.isEnabledFor(logging.DEBUG):
+        ctx.log.debug(
+            "completed", extra=log_fields(ctx, latency=f"{latency * 1000:.1f}ms")
+        )
 
 
-@bot.event
 async def on_command_error(ctx: Fuzzy.Context, error):
     """
     Handle errors, delegating all "internal errors" (exceptions foreign to
     discordpy) to stderr and discordpy (i.e. high-level) errors to the user.
     """
+    bot.profiler.stop(ctx)
+    if ctx.command:
+        bot.metrics.count(
+            "fuzzy_command_errors_total",
+            command=ctx.command.qualified_name,
+            error=type(error).__name__,
+        )
     if isinstance(error, commands.CommandInvokeError) and isinstance(
         error.original, AnticipatedError
     ):
@@ -227,18 +276,14 @@ async def on_command_error(ctx: Fuzzy.Context, error):
     elif isinstance(error, commands.MissingPermissions):
         pass
     else:
-        error_int = int(ctx.author.id) + int(ctx.message.id)
-        error_bytes = error_int.to_bytes(
-            (error_int.bit_length() + 7) // 8, byteorder="little"
-        )
-        error_id = str(
-            base64.urlsafe_b64encode(error_bytes),
-            encoding="utf-8",
-        ).replace("=", "")
+        error_id = ctx.error_id
 
         ctx.log.error(
-            f"Encountered exception while executing {ctx.command} [ID {error_id}]",
+            "Encountered exception while executing %s [ID %s]",
+            ctx.command,
+            error_id,
             exc_info=error,
+            extra=log_fields(ctx),
         )
 
         try:
@@ -263,10 +308,141 @@ async def on_command_error(ctx: Fuzzy.Context, error):
         )
 
 
+def create_bot() -> Fuzzy:
+    """Open the database and set up the bot with the events and commands of this module."""
+    intents = discord.Intents.default()
+    intents.members = True
+    intents.message_content = True
+
+    fuzzy = Fuzzy(
+        config,
+        open_database(config),
+        case_insensitive=True,
+        activity=Fuzzy.random_status(),
+        help_command=None,
+        intents=intents,
+    )
+    for event in (
+        on_ready,
+        on_guild_join,
+        on_command,
+        on_command_completion,
+        on_command_error,
+    ):
+        fuzzy.event(event)
+    fuzzy.before_invoke(before_invoke)
+    fuzzy.add_command(ping)
+    fuzzy.add_command(_help)
+    return fuzzy
+
+
 async def main():  # pylint: disable=missing-function-docstring
+    global bot  # pylint: disable=global-statement
+    bot = create_bot()
     async with bot:
         await bot.start(config["discord"]["token"])
 
 
+def export(args):
+    """Export the infractions of a guild to a file without starting the bot."""
+    output = args.output or f"infractions-{args.guild_id}.{args.format}.gz"
+    start = time.perf_counter()
+    rows = 0
+    with open(output, "wb") as out:
+        for rows in export_infractions(
+            open_database(config), args.guild_id, out, args.format
+        ):
+            pass
+    log.info(
+        f"Exported {rows} infractions to {output} in {time.perf_counter() - start:.1f}s"
+    )
+
+
+def import_(args):
+    """Import a dump of infractions into a guild without starting the bot."""
+    import_format = args.format or guess_import_format(args.path)
+    database = open_database(config)
+    report = None
+    last_update = time.perf_counter()
+    with open(args.path, "rb") as source:
+        for report in import_infractions(
+            database,
+            setup_guild(database, args.guild_id),
+            source,
+            import_format,
+            defer_indexes=args.defer_indexes,
+        ):
+            if time.perf_counter() - last_update > 5:
+                last_update = time.perf_counter()
+                log.info(
+                    f"Imported {report.imported} rows ({report.rows_per_second:.0f} rows/s)"
+                )
+    for error in report.errors:
+        log.warning(error)
+    log.info(
+        f"Imported {report.imported} infractions ({report.rows_per_second:.0f} rows/s), "
+        f"skipped {report.skipped} invalid rows"
+        + (f", resumed after row {report.resumed_from}" if report.resumed_from else "")
+    )
+
+
+def cluster(args):
+    """Run the bot as several supervised processes."""
+    asyncio.run(Supervisor(config, args.workers).run())
+
+
+def cli():
+    """Run the bot, or one of the maintenance commands."""
+    parser = argparse.ArgumentParser(prog="python -m fuzzy")
+    subcommands = parser.add_subparsers(dest="subcommand")
+
+    export_parser = subcommands.add_parser(
+        "export",
+        help="export the infractions of a guild as gzip-compressed JSONL or CSV",
+    )
+    export_parser.add_argument("guild_id", type=int)
+    export_parser.add_argument("-o", "--output", help="the file to write to")
+    export_parser.add_argument(
+        "-f", "--format", choices=EXPORT_FORMATS, default="jsonl"
+    )
+    export_parser.set_defaults(run=export)
+
+    import_parser = subcommands.add_parser(
+        "import", help="import a JSON, JSONL or CSV dump of infractions into a guild"
+    )
+    import_parser.add_argument("guild_id", type=int)
+    import_parser.add_argument("path")
+    import_parser.add_argument(
+        "-f", "--format", choices=IMPORT_FORMATS, help="guessed from the file name"
+    )
+    import_parser.add_argument(
+        "--defer-indexes",
+        action="store_true",
+        help="drop the indexes of infractions until the import is done, which is faster for "
+        "large dumps; only use this while the bot is stopped",
+    )
+    import_parser.set_defaults(run=import_)
+
+    cluster_parser = subcommands.add_parser(
+        "cluster",
+        help="run the bot as several processes, each running some of its shards",
+    )
+    cluster_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=int(config.get("cluster", "workers", fallback="") or 0)
+        or os.cpu_count(),
+        help="how many processes to start, by default one per CPU core",
+    )
+    cluster_parser.set_defaults(run=cluster)
+
+    args = parser.parse_args()
+    if args.subcommand:
+        args.run(args)
+    else:
+        asyncio.run(main())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli()
@@ -0,0 +1,128 @@
+import gzip
+import logging
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+
+@dataclass()
+class Snapshot(object):
+    """A finished backup."""
+
+    path: Path
+    pages: int
+    size: int
+    seconds: float
+
+
+# how often a stepped copy may start over before the rest is copied in a single step
+MAX_RESTARTS = 3
+
+
+class Restarted(Exception):
+    """Aborts a stepped copy that keeps starting over."""
+
+
+class Backups:
+    """
+    Online backups of the database. Snapshots are taken with SQLite's backup API through a
+    separate connection, so the bot can keep reading and writing in the meantime; they are then
+    gzip-compressed into the backup directory and the oldest are deleted. Taking a snapshot
+    blocks, so run it in a thread.
+    """
+
+    def __init__(self, config):
+        self.log = logging.getLogger("Fuzzy").getChild("Backups")
+        self.supported = config["database"].get("backend", "sqlite") == "sqlite"
+        self.database = Path(config["database"].get("path", "./fuzzy.db"))
+        interval = config.get("backup", "interval_hours", fallback=None)
+        self.interval: Optional[float] = float(interval) if interval else None
+        self.directory = Path(config.get("backup", "dir", fallback="./backups"))
+        self.keep = int(config.get("backup", "keep", fallback="14"))
+        self.pages_per_step = int(
+            config.get("backup", "pages_per_step", fallback="256")
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether scheduled backups have been configured."""
+        return self.supported and self.interval is not None
+
+    def snapshot(self) -> Snapshot:
+        """Copy the database into a new compressed snapshot and delete old ones."""
+        start = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{self.database.stem}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.db"
+        copy = self.directory / f"{name}.part"
+        path = self.directory / f"{name}.gz"
+
+        source = sqlite3.connect(self.database)
+        target = sqlite3.connect(copy)
+        pages = 0
+        restarts = 0
+        try:
+
+            def progress(_status, remaining, total):
+                nonlocal pages, restarts
+                if total - remaining < pages:
+                    restarts += 1
+                    if restarts > MAX_RESTARTS:
+                        raise Restarted()
+                pages = total - remaining
+
+            if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                # a single step reads a snapshot, which doesn't keep the bot from writing
+                source.backup(target, progress=progress)
+            else:
+                # the source is only locked during a step, so the bot can write in between;
+                # a write restarts the copy, so under steady writes it is finished in one step
+                try:
+                    source.backup(
+                        target,
+                        pages=self.pages_per_step,
+                        progress=progress,
+                        sleep=0.005,
+                    )
+                except Restarted:
+                    self.log.info(
+                        "Backup restarted %d times, copying it in one step", restarts
+                    )
+                    pages = 0
+                    source.backup(target, progress=progress)
+        finally:
+            target.close()
+            source.close()
+
+        try:
+            with copy.open("rb") as raw, gzip.open(path, "wb") as compressed:
+                shutil.copyfileobj(raw, compressed, 1 << 20)
+        finally:
+            copy.unlink(missing_ok=True)
+
+        for old in self.snapshots()[self.keep :]:
+            old.unlink(missing_ok=True)
+        snapshot = Snapshot(
+            path, pages, path.stat().st_size, time.perf_counter() - start
+        )
+        self.log.info(
+            "Saved backup %s (%d pages, %d bytes, %.2fs)",
+            path.name,
+            snapshot.pages,
+            snapshot.size,
+            snapshot.seconds,
+        )
+        return snapshot
+
+    def snapshots(self) -> List[Path]:
+        """All saved snapshots, newest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            self.directory.glob(f"{self.database.stem}-*.db.gz"),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
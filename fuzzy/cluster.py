@@ -0,0 +1,291 @@
+"""
+Running Fuzzy as several processes. `python -m fuzzy cluster` starts a supervisor that splits the
+shards between worker processes, restarts workers that exit and relays queries between them, so
+commands like ping can report on the whole bot and not just the worker that received them.
+
+Workers and the supervisor talk over a unix socket, one JSON object per line:
+    worker -> supervisor  {"op": "hello", "worker": 0}
+    worker -> supervisor  {"op": "gather", "id": 1, "query": "status", "timeout": 5}
+    supervisor -> worker  {"op": "query", "id": 7, "query": "status"}
+    worker -> supervisor  {"op": "reply", "id": 7, "data": {...}}
+    supervisor -> worker  {"op": "result", "id": 1, "data": [{...}, ...]}
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+# how long Discord wants between two shards identifying, see max_concurrency
+IDENTIFY_INTERVAL = 5
+
+
+def split_shards(shard_count: int, workers: int) -> List[List[int]]:
+    """Split the shards into one contiguous range per worker, as even as possible."""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def recommended_shard_count(token: str) -> int:
+    """Ask Discord how many shards the bot should have."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def send(writer: asyncio.StreamWriter, message: Dict):
+    """Write one message to the socket."""
+    writer.write(json.dumps(message).encode() + b"\n")
+
+
+class ClusterHub:
+    """The supervisor's end of the socket: forwards every query to every connected worker."""
+
+    def __init__(self, path: Path):
+        self.log = logging.getLogger("Fuzzy").getChild("Cluster")
+        self.path = path
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.workers: Dict[int, asyncio.StreamWriter] = {}
+        self.replies: Dict[int, asyncio.Queue] = {}
+        self.ids = itertools.count(1)
+
+    async def start(self):
+        self.path.unlink(missing_ok=True)
+        self.server = await asyncio.start_unix_server(self.handle, self.path)
+
+    async def stop(self):
+        self.server.close()
+        for writer in list(self.workers.values()):
+            writer.close()
+        await self.server.wait_closed()
+        self.path.unlink(missing_ok=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = None
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message["op"] == "hello":
+                    worker = message["worker"]
+                    self.workers[worker] = writer
+                elif message["op"] == "gather":
+                    asyncio.create_task(self.gather(writer, message))
+                elif message["op"] == "reply" and message["id"] in self.replies:
+                    self.replies[message["id"]].put_nowait(message["data"])
+        except (ConnectionError, json.JSONDecodeError) as ex:
+            self.log.warning("Lost connection to worker %s: %s", worker, ex)
+        finally:
+            if worker is not None and self.workers.get(worker) is writer:
+                del self.workers[worker]
+            writer.close()
+
+    async def gather(self, requester: asyncio.StreamWriter, message: Dict):
+        """Ask every worker, and answer with the replies that arrive before the timeout."""
+        query_id = next(self.ids)
+        self.replies[query_id] = asyncio.Queue()
+        workers = list(self.workers.values())
+        for worker in workers:
+            send(worker, {"op": "query", "id": query_id, "query": message["query"]})
+
+        data = []
+        deadline = asyncio.get_running_loop().time() + message.get("timeout", 5)
+        try:
+            while len(data) < len(workers):
+                remaining = deadline - asyncio.get_running_loop().time()
+                data.append(
+                    await asyncio.wait_for(self.replies[query_id].get(), remaining)
+                )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            del self.replies[query_id]
+        send(requester, {"op": "result", "id": message["id"], "data": data})
+
+
+class ClusterClient:
+    """A worker's end of the socket: answers queries and asks all workers."""
+
+    def __init__(self, path: Path, worker: int):
+        self.log = logging.getLogger("Fuzzy").getChild("Cluster")
+        self.path = path
+        self.worker = worker
+        self.handlers: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.ids = itertools.count(1)
+        self.listener: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.path)
+        send(self.writer, {"op": "hello", "worker": self.worker})
+        self.listener = asyncio.create_task(self.listen(reader))
+
+    async def close(self):
+        if self.listener:
+            self.listener.cancel()
+        if self.writer:
+            self.writer.close()
+
+    async def listen(self, reader: asyncio.StreamReader):
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message["op"] == "query":
+                    asyncio.create_task(self.answer(message))
+                elif message["op"] == "result" and message["id"] in self.pending:
+                    self.pending[message["id"]].set_result(message["data"])
+        except (ConnectionError, json.JSONDecodeError) as ex:
+            self.log.warning("Lost connection to the cluster supervisor: %s", ex)
+        finally:
+            self.writer = None
+            for future in self.pending.values():
+                future.set_exception(ConnectionError("not connected to the cluster"))
+            self.pending.clear()
+
+    async def answer(self, message: Dict):
+        handler = self.handlers.get(message["query"])
+        data = None
+        try:
+            data = await handler() if handler else None
+        except Exception:  # pylint: disable=broad-except
+            self.log.exception("Failed to answer cluster query %s", message["query"])
+        if self.writer:
+            send(self.writer, {"op": "reply", "id": message["id"], "data": data})
+
+    async def gather(self, query: str, timeout: float = 5) -> List[Any]:
+        """Run a query on every worker, including this one, and return their answers.
+        Workers that fail to answer, or don't within the timeout, are left out."""
+        if not self.writer:
+            raise ConnectionError("not connected to the cluster")
+        request_id = next(self.ids)
+        self.pending[request_id] = asyncio.get_running_loop().create_future()
+        send(
+            self.writer,
+            {"op": "gather", "id": request_id, "query": query, "timeout": timeout},
+        )
+        try:
+            replies = await asyncio.wait_for(self.pending[request_id], timeout + 1)
+            # workers whose handler failed answer with None
+            return [reply for reply in replies if reply is not None]
+        finally:
+            self.pending.pop(request_id, None)
+
+    @classmethod
+    def from_environment(cls) -> Optional["ClusterClient"]:
+        """The client for this process if it was started by the cluster supervisor."""
+        if "FUZZY_CLUSTER_SOCKET" not in os.environ:
+            return None
+        return cls(
+            Path(os.environ["FUZZY_CLUSTER_SOCKET"]), int(os.environ["FUZZY_WORKER"])
+        )
+
+
+class Supervisor:
+    """Starts a worker process per shard range and restarts workers that exit."""
+
+    def __init__(self, config, workers: int):
+        self.log = logging.getLogger("Fuzzy").getChild("Cluster")
+        self.config = config
+        self.workers = workers
+        self.socket = Path(config.get("cluster", "socket", fallback="./fuzzy.sock"))
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        shard_count = self.config["discord"].get("shard_count")
+        shard_count = (
+            int(shard_count)
+            if shard_count
+            else await recommended_shard_count(self.config["discord"]["token"])
+        )
+        ranges = split_shards(shard_count, self.workers)
+        self.log.info(
+            "Running %d shards in %d workers: %s", shard_count, len(ranges), ranges
+        )
+
+        hub = ClusterHub(self.socket)
+        await hub.start()
+        for stop_signal in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(
+                stop_signal, self.stopping.set
+            )
+
+        supervised = []
+        for worker, shard_ids in enumerate(ranges):
+            supervised.append(
+                asyncio.create_task(self.supervise(worker, shard_count, shard_ids))
+            )
+            # workers identify their shards one after another, like a single process would
+            if await self.sleep(IDENTIFY_INTERVAL * len(shard_ids)):
+                break
+
+        await self.stopping.wait()
+        self.log.info("Stopping workers")
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*supervised)
+        await hub.stop()
+
+    async def supervise(self, worker: int, shard_count: int, shard_ids: List[int]):
+        """Keep a worker running until the cluster stops, backing off if it keeps exiting."""
+        env = dict(
+            os.environ,
+            FUZZY_SHARD_COUNT=str(shard_count),
+            FUZZY_SHARD_IDS=",".join(str(shard_id) for shard_id in shard_ids),
+            FUZZY_WORKER=str(worker),
+            FUZZY_CLUSTER_SOCKET=str(self.socket.resolve()),
+        )
+        backoff = 1
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "fuzzy", env=env
+            )
+            self.processes[worker] = process
+            self.log.info(
+                "Started worker %d (pid %d) for shards %s",
+                worker,
+                process.pid,
+                shard_ids,
+            )
+            code = await process.wait()
+            if self.stopping.is_set():
+                break
+            if time.monotonic() - started > 600:
+                backoff = 1
+            self.log.warning(
+                "Worker %d exited with code %d, restarting it in %ds",
+                worker,
+                code,
+                backoff,
+            )
+            if await self.sleep(backoff):
+                break
+            backoff = min(backoff * 2, 300)
+
+    async def sleep(self, seconds: float) -> bool:
+        """Wait, unless the cluster stops first. Returns whether it is stopping."""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self.stopping.is_set()
@@ -1,8 +1,15 @@
 from .admin import Admin
+from .antiraid import AntiRaid
+from .antispam import AntiSpam
 from .bans import Bans
+from .escalations import Escalations
+from .filters import Filters
 from .infraction_admin import InfractionAdmin
 from .locks import Locks
 from .logs import Logs
+from .maintenance import Maintenance
 from .mutes import Mutes
+from .owner import Owner
 from .purge import Purges
+from .transfer import Transfer
 from .warns import Warns
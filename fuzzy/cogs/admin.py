@@ -4,7 +4,8 @@ import discord
 from discord.ext import commands
 
 from fuzzy import Fuzzy
-from fuzzy.models import DurationType
+from fuzzy.errors import UnableToComply
+from fuzzy.models import DurationType, GuildSettings, MuteBackend
 
 
 class Admin(Fuzzy.Cog):
@@ -22,6 +23,8 @@ class Admin(Fuzzy.Cog):
             channel = ctx.channel
         guild = ctx.db.guilds.find_by_id(ctx.guild.id)
         guild.mod_log = channel.id
+        if guild.mod_log_webhook:
+            await self._replace_webhook(guild, "mod_log_webhook", channel)
         ctx.db.guilds.save(guild)
         await ctx.reply(f"Updated the mod log channel to {channel.mention}")
 
@@ -36,6 +39,8 @@ class Admin(Fuzzy.Cog):
             channel = ctx.channel
         guild = ctx.db.guilds.find_by_id(ctx.guild.id)
         guild.public_log = channel.id
+        if guild.public_log_webhook:
+            await self._replace_webhook(guild, "public_log_webhook", channel)
         ctx.db.guilds.save(guild)
         await ctx.reply(f"Updated the public log channel to {channel.mention}")
         await self.bot.post_log(
@@ -43,6 +48,55 @@ class Admin(Fuzzy.Cog):
             msg=f"{ctx.author.name}#{ctx.author.discriminator} updated public log channel to {channel.mention}",
         )
 
+    @commands.command(parent=admin)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def webhooks(self, ctx: Fuzzy.Context, enabled: bool):
+        """Chooses whether the mod log and public log are posted through webhooks.
+        `enabled` is `on` or `off`. Webhooks are rate limited apart from Fuzzy, so a busy mod log
+        doesn't slow down its replies, and log entries posted close together are sent as one
+        message. Fuzzy needs the Manage Webhooks permission to create them. Turning them off
+        deletes the webhooks, so entries published through them can't be updated by later reason
+        changes or pardons anymore."""
+        guild = ctx.db.guilds.find_by_id(ctx.guild.id)
+        for attribute, channel_id in (
+            ("mod_log_webhook", guild.mod_log),
+            ("public_log_webhook", guild.public_log),
+        ):
+            await self._replace_webhook(
+                guild, attribute, ctx.guild.get_channel(channel_id) if enabled else None
+            )
+            ctx.db.guilds.save(guild)
+        state = "through webhooks" if enabled else "by Fuzzy itself"
+        await ctx.reply(f"The logs will now be posted {state}.")
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} turned log webhooks "
+            f"{'on' if enabled else 'off'}",
+        )
+
+    async def _replace_webhook(
+        self,
+        guild: GuildSettings,
+        attribute: str,
+        channel: Optional[discord.TextChannel],
+    ):
+        """Points the webhook a log is posted through to a channel, deleting the old one. Without
+        a channel, the log is posted by Fuzzy itself again."""
+        url = getattr(guild, attribute)
+        try:
+            setattr(
+                guild,
+                attribute,
+                await self.bot.create_log_webhook(channel) if channel else None,
+            )
+        except discord.Forbidden:
+            raise UnableToComply(
+                f"{self.bot.user.display_name} needs the Manage Webhooks permission in "
+                f"{channel.mention}."
+            )
+        if url:
+            await self.bot.log_webhooks.delete(url)
+
     @commands.command(parent=admin)
     @commands.has_guild_permissions(manage_guild=True)
     async def auto_pardon(self, ctx: Fuzzy.Context, time: str):
@@ -88,6 +142,30 @@ class Admin(Fuzzy.Cog):
             msg=f"{ctx.author.name}#{ctx.author.discriminator} updated mute role to {role.name}",
         )
 
+    @commands.command(parent=mutes)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def backend(self, ctx: Fuzzy.Context, backend: str):
+        """Chooses how members are muted.
+        `backend` is either `role`, to give muted members the mute role, or `timeout`, to use
+        Discord's timeouts. Timeouts don't need the mute role's channel permissions and end on
+        their own, but can't be longer than 28 days; longer mutes still use the mute role."""
+        try:
+            mute_backend = MuteBackend[backend.upper()]
+        except KeyError:
+            raise commands.BadArgument("The mute backend must be `role` or `timeout`.")
+        guild = ctx.db.guilds.find_by_id(ctx.guild.id)
+        guild.mute_backend = mute_backend
+        ctx.db.guilds.save(guild)
+        await ctx.reply(
+            f"{self.bot.user.display_name} will now use the {backend.lower()} backend "
+            "when muting someone."
+        )
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} updated the mute backend to "
+            f"{backend.lower()}",
+        )
+
     @commands.command(parent=mutes)
     @commands.has_guild_permissions(manage_guild=True)
     async def create(self, ctx: Fuzzy.Context):
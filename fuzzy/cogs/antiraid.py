@@ -0,0 +1,229 @@
+import dataclasses
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from fuzzy import Fuzzy
+from fuzzy.customizations import ParseableTimedelta
+from fuzzy.detection import SlidingWindowCounter
+from fuzzy.models import DBUser, RaidAction, RaidSettings
+
+# the longest window joins are counted in, in seconds
+MAX_WINDOW = 300
+
+
+class RaidFlags(commands.FlagConverter):
+    """The settings accepted by the antiraid command."""
+
+    enabled: Optional[bool] = None
+    joins: Optional[int] = None
+    seconds: Optional[int] = None
+    age: Optional[ParseableTimedelta] = None
+    avatar: Optional[bool] = None
+    action: Optional[str] = None
+    duration: Optional[ParseableTimedelta] = None
+
+
+class AntiRaid(Fuzzy.Cog):
+    def __init__(self, *args):
+        super().__init__(*args)
+        # everything on_member_join needs is kept in memory, so joins cause no queries
+        self.settings: Dict[int, RaidSettings] = {
+            settings.guild_id: settings for settings in self.bot.db.raids.find_all()
+        }
+        self.joins: Dict[int, SlidingWindowCounter] = {}
+        # the members who joined most recently and counted towards a raid, by guild
+        self.recent: Dict[int, Deque[Tuple[float, discord.Member]]] = {}
+        self.raid_until: Dict[int, float] = {}
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        """Counts joins and responds when there are too many of them too quickly. During raid
+        mode every join is muted if the action is mute, whether it would count or not."""
+        settings = self.settings.get(member.guild.id)
+        if not settings or not settings.enabled:
+            return
+        guild_id = member.guild.id
+        now = time.monotonic()
+        raid_until = self.raid_until.get(guild_id)
+        if raid_until is not None:
+            if now < raid_until:
+                if settings.action == RaidAction.MUTE:
+                    await self._mute(member.guild, [member], settings)
+                return
+            # raid mode is over, so the joins counted before it can't start another raid
+            del self.raid_until[guild_id]
+            self.joins.pop(guild_id, None)
+            self.recent.pop(guild_id, None)
+        if not self._counts(member, settings):
+            return
+
+        if guild_id not in self.joins:
+            self.joins[guild_id] = SlidingWindowCounter(settings.seconds)
+            self.recent[guild_id] = deque(maxlen=settings.joins)
+        self.recent[guild_id].append((now, member))
+        if self.joins[guild_id].add(now) >= settings.joins:
+            self.raid_until[guild_id] = now + settings.duration.total_seconds()
+            raiders = [
+                raider
+                for joined, raider in self.recent[guild_id]
+                if joined > now - settings.seconds
+            ]
+            self.recent[guild_id].clear()
+            await self._respond(member.guild, settings, raiders)
+
+    @staticmethod
+    def _counts(member: discord.Member, settings: RaidSettings) -> bool:
+        """Whether a join counts towards a raid. Without heuristics every join counts."""
+        if not settings.account_age and not settings.require_avatar:
+            return True
+        return bool(
+            settings.account_age
+            and discord.utils.utcnow() - member.created_at < settings.account_age
+        ) or bool(settings.require_avatar and member.avatar is None)
+
+    async def _respond(
+        self,
+        guild: discord.Guild,
+        settings: RaidSettings,
+        raiders: List[discord.Member],
+    ):
+        self.log.warning("Raid detected on %s: %d joins", guild.id, len(raiders))
+        msg = (
+            f"**{len(raiders)} joins** within {settings.seconds} seconds. "
+            f"Raid mode lasts {settings.duration}.\n"
+        )
+        if settings.action == RaidAction.LOCK:
+            everyone_role = guild.default_role
+            channels = [
+                channel
+                for channel in guild.text_channels
+                if channel.permissions_for(everyone_role).send_messages
+            ]
+            failed = await self.bot.get_cog("Locks").lock_channels(
+                guild,
+                channels,
+                self._moderator(),
+                datetime.now(timezone.utc) + settings.duration,
+                "Raid detected",
+            )
+            msg += f"Locked {len(channels) - len(failed)} channels.\n"
+            if failed:
+                msg += f"Could not lock {', '.join(channel.mention for channel in failed)}\n"
+        elif settings.action == RaidAction.MUTE:
+            muted = await self._mute(guild, raiders, settings)
+            msg += (
+                f"Muted {' '.join(member.mention for member in muted)}, "
+                "and will mute everyone else who joins during raid mode.\n"
+                if muted
+                else "Could not mute them, check the mute settings.\n"
+            )
+        await self.bot.post_log(
+            guild,
+            title="Raid detected",
+            msg=msg[:4096],
+            color=self.bot.Context.Color.BAD,
+        )
+
+    async def _mute(
+        self,
+        guild: discord.Guild,
+        members: List[discord.Member],
+        settings: RaidSettings,
+    ) -> List[discord.Member]:
+        mutes = self.bot.get_cog("Mutes")
+        if not mutes.can_mute(guild, settings.duration):
+            return []
+        muted = []
+        for member in members:
+            try:
+                await mutes.mute_member(
+                    guild, member, self._moderator(), settings.duration, "Raid detected"
+                )
+                muted.append(member)
+            except discord.HTTPException as ex:
+                self.log.warning("Could not mute raider %s: %s", member.id, ex)
+        return muted
+
+    def _moderator(self) -> DBUser:
+        return DBUser(
+            self.bot.user.id, f"{self.bot.user.name}#{self.bot.user.discriminator}"
+        )
+
+    @commands.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def antiraid(self, ctx: Fuzzy.Context, *, flags: RaidFlags):
+        """Shows or changes how join raids are detected. Without options it shows the current
+        settings, i.e. `${pfx}antiraid enabled: yes joins: 10 seconds: 10 action: lock`.
+        `enabled:` yes or no.
+        `joins:` and `seconds:` how many joins within how many seconds are a raid. At most 300
+        seconds.
+        `age:` and `avatar:` only count joins of accounts younger than `age`, i.e. `7d`, and with
+        `avatar: yes` of accounts without an avatar. `age: 0s` and `avatar: no` count every join.
+        `action:` alert to only post in the mod log, lock to lock every channel, or mute to mute
+        everyone who joins during the raid.
+        `duration:` how long raid mode lasts, and with it the locks and mutes."""
+        settings = dataclasses.replace(
+            self.settings.get(ctx.guild.id) or RaidSettings(ctx.guild.id)
+        )
+        if flags.joins is not None:
+            if flags.joins < 2:
+                raise commands.BadArgument("A raid needs at least 2 joins.")
+            settings.joins = flags.joins
+        if flags.seconds is not None:
+            if not 1 <= flags.seconds <= MAX_WINDOW:
+                raise commands.BadArgument(
+                    f"Joins can be counted over 1 to {MAX_WINDOW} seconds."
+                )
+            settings.seconds = flags.seconds
+        if flags.age is not None:
+            settings.account_age = timedelta(seconds=flags.age.total_seconds())
+        if flags.avatar is not None:
+            settings.require_avatar = flags.avatar
+        if flags.action is not None:
+            try:
+                settings.action = RaidAction[flags.action.upper()]
+            except KeyError:
+                raise commands.BadArgument("The action must be alert, lock or mute.")
+        if flags.duration is not None:
+            if not flags.duration:
+                raise commands.BadArgument("The duration may not be zero.")
+            settings.duration = timedelta(seconds=flags.duration.total_seconds())
+        if flags.enabled is not None:
+            settings.enabled = flags.enabled
+
+        changed = any(value is not None for _, value in flags)
+        if changed:
+            self.settings[ctx.guild.id] = ctx.db.raids.save(settings)
+            # start counting again with the new window
+            self.joins.pop(ctx.guild.id, None)
+            self.recent.pop(ctx.guild.id, None)
+            self.raid_until.pop(ctx.guild.id, None)
+            await self.bot.post_log(
+                ctx.guild,
+                msg=f"{ctx.author.name}#{ctx.author.discriminator} updated the anti-raid settings",
+            )
+
+        counted = []
+        if settings.account_age:
+            counted.append(f"younger than {settings.account_age}")
+        if settings.require_avatar:
+            counted.append("without an avatar")
+        await ctx.reply(
+            title="Anti-raid",
+            msg=f"**Enabled:** {'yes' if settings.enabled else 'no'}\n"
+            f"**Raid:** {settings.joins} joins within {settings.seconds} seconds\n"
+            f"**Counted joins:** "
+            + (f"accounts {' or '.join(counted)}" if counted else "all")
+            + f"\n**Action:** {settings.action.name.lower()}\n"
+            f"**Duration:** {settings.duration}",
+            color=ctx.Color.GOOD if changed else ctx.Color.AUTOMATIC_BLUE,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(AntiRaid(bot))
@@ -0,0 +1,198 @@
+import dataclasses
+import time
+from datetime import timedelta
+from typing import Dict, Optional, Set, Tuple
+
+import discord
+from discord.ext import commands
+
+from fuzzy import Fuzzy
+from fuzzy.customizations import ParseableTimedelta
+from fuzzy.detection import LRUDict, TokenBucket
+from fuzzy.models import DBUser, InfractionType, SpamSettings
+
+# how many members' recent messages are remembered; the least recently active are forgotten first
+MAX_TRACKED = 50000
+# the longest window messages and mentions are counted in, in seconds
+MAX_WINDOW = 60
+# a message only counts as repeated if the previous one was posted this many seconds before
+DUPLICATE_WINDOW = 30
+
+
+class SpamFlags(commands.FlagConverter):
+    """The settings accepted by the antispam command."""
+
+    enabled: Optional[bool] = None
+    messages: Optional[int] = None
+    mentions: Optional[int] = None
+    seconds: Optional[int] = None
+    duplicates: Optional[int] = None
+    duration: Optional[ParseableTimedelta] = None
+
+
+class Activity:
+    """What a member posted recently in a guild."""
+
+    __slots__ = ("messages", "mentions", "last_hash", "last_time", "repeats")
+
+    def __init__(self, settings: SpamSettings, now: float):
+        self.messages = TokenBucket(
+            settings.messages, settings.messages / settings.seconds, now
+        )
+        self.mentions = TokenBucket(
+            settings.mentions, settings.mentions / settings.seconds, now
+        )
+        self.last_hash = None
+        self.last_time = now
+        self.repeats = 0
+
+    def check(
+        self, message: discord.Message, settings: SpamSettings, now: float
+    ) -> Optional[str]:
+        """Counts the message and returns why it's spam, if it is."""
+        if not self.messages.take(now):
+            return "too many messages"
+        mentions = len(message.mentions) + len(message.role_mentions)
+        if mentions and not self.mentions.take(now, mentions):
+            return "too many mentions"
+        if message.content:
+            content_hash = hash(message.content.casefold())
+            if (
+                content_hash == self.last_hash
+                and now - self.last_time < DUPLICATE_WINDOW
+            ):
+                self.repeats += 1
+            else:
+                self.last_hash = content_hash
+                self.repeats = 1
+            self.last_time = now
+            if self.repeats >= settings.duplicates:
+                return "repeated messages"
+        return None
+
+
+class AntiSpam(Fuzzy.Cog):
+    def __init__(self, *args):
+        super().__init__(*args)
+        # every message passes through on_message, so it only uses what's in memory
+        self.settings: Dict[int, SpamSettings] = {
+            settings.guild_id: settings for settings in self.bot.db.spam.find_all()
+        }
+        self.activity: LRUDict[Tuple[int, int], Activity] = LRUDict(MAX_TRACKED)
+        self.muting: Set[Tuple[int, int]] = set()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Mutes members who post too much, too many mentions or the same message repeatedly."""
+        if not message.guild or message.author.bot:
+            return
+        settings = self.settings.get(message.guild.id)
+        if not settings or not settings.enabled:
+            return
+        now = time.monotonic()
+        key = (message.guild.id, message.author.id)
+        reason = self.activity.get_or_create(
+            key, lambda: Activity(settings, now)
+        ).check(message, settings, now)
+        if reason and key not in self.muting:
+            self.activity.pop(key)
+            if (
+                isinstance(message.author, discord.Member)
+                and not message.author.guild_permissions.manage_messages
+            ):
+                self.muting.add(key)
+                try:
+                    await self._mute(message.author, settings, reason)
+                finally:
+                    self.muting.discard(key)
+
+    async def _mute(self, member: discord.Member, settings: SpamSettings, reason: str):
+        mutes = self.bot.get_cog("Mutes")
+        if not mutes.can_mute(member.guild, settings.duration):
+            self.log.warning(
+                "Could not mute %s for spam, %s has no way to mute",
+                member.id,
+                member.guild.id,
+            )
+            return
+        infraction = await mutes.mute_member(
+            member.guild,
+            member,
+            DBUser(
+                self.bot.user.id, f"{self.bot.user.name}#{self.bot.user.discriminator}"
+            ),
+            settings.duration,
+            f"Spam: {reason}",
+        )
+        await self.bot.post_log(
+            member.guild,
+            title="Spam",
+            msg=f"Muted {member.mention} for {settings.duration} for {reason}: "
+            f"Mute **ID {infraction.id}**",
+            color=self.bot.Context.Color.BAD,
+        )
+        if escalations := self.bot.get_cog("Escalations"):
+            await escalations.escalate(member.guild, member, InfractionType.MUTE)
+
+    @commands.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def antispam(self, ctx: Fuzzy.Context, *, flags: SpamFlags):
+        """Shows or changes when members are muted for spamming. Moderators are never muted.
+        Without options it shows the current settings, i.e.
+        `${pfx}antispam enabled: yes messages: 8 mentions: 10 seconds: 5 duplicates: 4`.
+        `enabled:` yes or no.
+        `messages:` and `mentions:` how many messages and mentions are allowed within `seconds:`.
+        At most 60 seconds.
+        `duplicates:` how many times in a row the same message may be posted.
+        `duration:` how long spammers are muted for."""
+        settings = dataclasses.replace(
+            self.settings.get(ctx.guild.id) or SpamSettings(ctx.guild.id)
+        )
+        if flags.messages is not None:
+            if flags.messages < 2:
+                raise commands.BadArgument("At least 2 messages must be allowed.")
+            settings.messages = flags.messages
+        if flags.mentions is not None:
+            if flags.mentions < 1:
+                raise commands.BadArgument("At least 1 mention must be allowed.")
+            settings.mentions = flags.mentions
+        if flags.seconds is not None:
+            if not 1 <= flags.seconds <= MAX_WINDOW:
+                raise commands.BadArgument(
+                    f"Messages can be counted over 1 to {MAX_WINDOW} seconds."
+                )
+            settings.seconds = flags.seconds
+        if flags.duplicates is not None:
+            if flags.duplicates < 2:
+                raise commands.BadArgument("At least 2 duplicates must be allowed.")
+            settings.duplicates = flags.duplicates
+        if flags.duration is not None:
+            if not flags.duration:
+                raise commands.BadArgument("The duration may not be zero.")
+            settings.duration = timedelta(seconds=flags.duration.total_seconds())
+        if flags.enabled is not None:
+            settings.enabled = flags.enabled
+
+        changed = any(value is not None for _, value in flags)
+        if changed:
+            self.settings[ctx.guild.id] = ctx.db.spam.save(settings)
+            # the guild's counters were made for the old settings
+            self.activity.pop_where(lambda key: key[0] == ctx.guild.id)
+            await self.bot.post_log(
+                ctx.guild,
+                msg=f"{ctx.author.name}#{ctx.author.discriminator} updated the anti-spam settings",
+            )
+
+        await ctx.reply(
+            title="Anti-spam",
+            msg=f"**Enabled:** {'yes' if settings.enabled else 'no'}\n"
+            f"**Limit:** {settings.messages} messages and {settings.mentions} mentions "
+            f"within {settings.seconds} seconds\n"
+            f"**Duplicates:** {settings.duplicates} in a row\n"
+            f"**Mute duration:** {settings.duration}",
+            color=ctx.Color.GOOD if changed else ctx.Color.AUTOMATIC_BLUE,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(AntiSpam(bot))
@@ -1,16 +1,133 @@
 import asyncio
 import typing
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Dict, List, Optional
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from fuzzy import Fuzzy
-from fuzzy.models import DBUser, Infraction, InfractionType
+from fuzzy.customizations import ParseableTimedelta
+from fuzzy.models import DBUser, Infraction, InfractionType, Pardon, TempBan
+
+# how many expired bans of a guild are lifted at once
+UNBAN_CONCURRENCY = 5
+# how many seconds a ban waits for its direct message, which can't be sent once the user is banned
+BAN_DM_TIMEOUT = 5
+# how long to wait before trying again to lift bans that couldn't be
+UNBAN_RETRY_DELAY = timedelta(minutes=1)
 
 
 class Bans(Fuzzy.Cog):
+    def __init__(self, *args):
+        self.execute_expired_bans.start()  # pylint: disable=no-member
+        super().__init__(*args)
+
+    @tasks.loop(seconds=0.5)
+    async def execute_expired_bans(self):
+        """Finds expired temporary bans and lifts them. Each guild's bans are lifted together,
+        with one log entry, and pardoned so they stop counting against the user."""
+        temp_bans: List[TempBan] = self.bot.db.temp_bans.find_expired(
+            self.bot.shard_count or 1, self.bot.shard_ids
+        )
+        now = datetime.now(timezone.utc)
+        batches: Dict[int, List[TempBan]] = defaultdict(list)
+        for temp_ban in temp_bans:
+            self.bot.metrics.observe(
+                "fuzzy_expiry_lag_seconds",
+                (now - temp_ban.end_time).total_seconds(),
+                loop="bans",
+            )
+            batches[temp_ban.guild_id].append(temp_ban)
+        moderator = None
+        for guild_id, batch in batches.items():
+            guild: discord.Guild = self.bot.get_guild(guild_id)
+            # the bans of a guild that isn't available are kept until it is
+            if guild:
+                moderator = moderator or DBUser(
+                    self.bot.user.id,
+                    f"{self.bot.user.name}#{self.bot.user.discriminator}",
+                )
+                failed = await self._unban_all(
+                    guild, [temp_ban.user for temp_ban in batch]
+                )
+                unbanned = [
+                    temp_ban for temp_ban in batch if temp_ban.user not in failed
+                ]
+                for temp_ban in unbanned:
+                    self.bot.db.pardons.save(
+                        Pardon(
+                            temp_ban.infraction_id,
+                            moderator,
+                            now,
+                            "Temporary ban expired",
+                        )
+                    )
+                msg = ""
+                if unbanned:
+                    msg += "\n".join(
+                        f"{temp_ban.user.name}: Ban ID {temp_ban.infraction_id}"
+                        for temp_ban in unbanned
+                    )
+                if failed:
+                    msg += (
+                        "\n**Could not unban:** "
+                        + ", ".join(user.name for user in failed)
+                        + f", trying again in {UNBAN_RETRY_DELAY}"
+                    )
+                await self.bot.post_log(
+                    guild,
+                    title="Temporary bans expired",
+                    msg=msg.strip()[:4096],
+                    color=self.bot.Context.Color.I_GUESS
+                    if failed
+                    else self.bot.Context.Color.AUTOMATIC_BLUE,
+                )
+                for temp_ban in batch:
+                    if temp_ban.user in failed:
+                        temp_ban.end_time = now + UNBAN_RETRY_DELAY
+                        self.bot.db.temp_bans.save(temp_ban)
+                self.bot.db.temp_bans.delete_all(
+                    guild_id, [temp_ban.user.id for temp_ban in unbanned]
+                )
+
+    @execute_expired_bans.before_loop
+    async def before_expired_bans(self):
+        # the guild cache is empty until the bot is ready
+        await self.bot.wait_until_ready()
+
+    async def _unban_all(
+        self, guild: discord.Guild, users: List[DBUser]
+    ) -> List[DBUser]:
+        """Unbans users a few at a time, so a mass ban expiring at once doesn't wait on one
+        request after another. Returns the users that could not be unbanned."""
+        semaphore = asyncio.Semaphore(UNBAN_CONCURRENCY)
+
+        async def unban(user):
+            async with semaphore:
+                try:
+                    await guild.unban(
+                        discord.Object(user.id), reason="Temporary ban expired"
+                    )
+                except discord.NotFound:
+                    # unbanned by hand already
+                    pass
+
+        results = await asyncio.gather(
+            *(unban(user) for user in users), return_exceptions=True
+        )
+        failed = []
+        for user, result in zip(users, results):
+            if isinstance(result, discord.HTTPException):
+                self.log.warning(
+                    "Could not unban %s on %s: %s", user.id, guild.id, result
+                )
+                failed.append(user)
+            elif isinstance(result, BaseException):
+                raise result
+        return failed
+
     @commands.Cog.listener()
     async def on_member_ban(self, guild: discord.Guild, user: discord.User):
         """Posts a ban to the Log channel. Checks to see if Fuzzy was used for ban and if not, creates a new
@@ -21,6 +138,8 @@ class Bans(Fuzzy.Cog):
             user.id, guild.id
         )
         if not infraction:
+            # a permanent ban from outside Fuzzy replaces a temporary ban from it
+            self.bot.db.temp_bans.delete_all(guild.id, [user.id])
             try:
                 async for entry in guild.audit_logs(
                     limit=10,
@@ -92,6 +211,7 @@ class Bans(Fuzzy.Cog):
     @commands.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: discord.User):
         """Posts an unban to the Log channel."""
+        self.bot.db.temp_bans.delete_all(guild.id, [user.id])
         infraction = self.bot.db.infractions.find_recent_ban_by_id(user.id, guild.id)
 
         await self.bot.post_log(
@@ -119,23 +239,14 @@ class Bans(Fuzzy.Cog):
         insufficient_permissions = []
         if await self.check_if_can_ban(who):
             if who.id != ctx.author.id:
-                infraction = Infraction.create(ctx, who, reason, InfractionType.BAN)
-                infraction = ctx.db.infractions.save(infraction)
-                if infraction:
-                    try:
-                        await self.bot.direct_message(
-                            who,
-                            title=f"Ban ID {infraction.id}",
-                            msg=f"You have been banned from {ctx.guild.name} "
-                            + (f'for "{reason}"' if reason else ""),
-                        )
-                    except discord.Forbidden or discord.HTTPException:
-                        pass
-                try:
-                    await ctx.guild.ban(who, reason=reason, delete_message_days=0)
-                except discord.Forbidden:
-                    pass
-
+                infraction = await self.ban_user(
+                    ctx.guild,
+                    who,
+                    DBUser(
+                        ctx.author.id, f"{ctx.author.name}#{ctx.author.discriminator}"
+                    ),
+                    reason,
+                )
             else:
                 await ctx.reply("You cant ban yourself.")
         else:
@@ -153,6 +264,43 @@ class Bans(Fuzzy.Cog):
                 f"{' '.join(user.mention for user in insufficient_permissions)}"
             )
 
+    @commands.command()
+    @commands.has_guild_permissions(manage_messages=True)
+    async def tempban(
+        self,
+        ctx: Fuzzy.Context,
+        who: typing.Union[discord.Member, discord.User],
+        time: ParseableTimedelta,
+        *,
+        reason: Optional[str] = "",
+    ):
+        """Bans a user from the server for the specified amount of time. The ban is pardoned when
+        it expires.
+        `who` is the user to ban. This can be a mention, id or name.
+        `time` is a time delta in (d)ays (h)ours (m)inutes (s)econds, i.e. `7d` for 7 days.
+        `reason` is the reason for the ban. This can be updated later with ${pfx}reason"""
+        if not time:
+            raise commands.BadArgument("Time difference may not be zero.")
+        if who.id == ctx.author.id:
+            await ctx.reply("You cant ban yourself.")
+            return
+        if not await self.check_if_can_ban(who):
+            await ctx.reply(f"Insufficient permissions to ban {who.mention}")
+            return
+        infraction = await self.ban_user(
+            ctx.guild,
+            who,
+            DBUser(ctx.author.id, f"{ctx.author.name}#{ctx.author.discriminator}"),
+            reason,
+            time,
+        )
+        await ctx.reply(
+            title="Banned",
+            msg=(f"**Reason:** {reason}\n" if reason else "")
+            + f"**Length:** {time}\n{infraction.user.name}: Ban ID {infraction.id}",
+            color=ctx.Color.BAD,
+        )
+
     @commands.command()
     @commands.has_guild_permissions(manage_messages=True)
     async def unban(self, ctx: Fuzzy.Context, who: commands.Greedy[discord.User]):
@@ -174,14 +322,11 @@ class Bans(Fuzzy.Cog):
                     unbanned_users.append(
                         f"{infraction.user.name}: Ban ID {infraction.id}"
                     )
-                    try:
-                        await self.bot.direct_message(
-                            user,
-                            title=f"Unban ID {infraction.id}",
-                            msg=f"You have been unbanned from {ctx.guild.name}",
-                        )
-                    except discord.Forbidden or discord.HTTPException:
-                        pass
+                    await self.bot.direct_messages.enqueue(
+                        user,
+                        title=f"Unban ID {infraction.id}",
+                        msg=f"You have been unbanned from {ctx.guild.name}",
+                    )
 
         if errors:
             msg = ""
@@ -196,6 +341,58 @@ class Bans(Fuzzy.Cog):
                 color=ctx.Color.GOOD,
             )
 
+    async def ban_user(
+        self,
+        guild: discord.Guild,
+        who: typing.Union[discord.Member, discord.User],
+        moderator: DBUser,
+        reason: str,
+        time: Optional[timedelta] = None,
+    ) -> Infraction:
+        """Saves a ban infraction, tells the user and bans them, until `time` has passed if it is
+        given. Used by the ban commands and by automatic moderation, so it needs no command
+        context. Check `check_if_can_ban` first."""
+        # noinspection PyTypeChecker
+        infraction = self.bot.db.infractions.save(
+            Infraction(
+                None,
+                DBUser(who.id, f"{who.name}#{who.discriminator}"),
+                moderator,
+                self.bot.db.guilds.find_by_id(guild.id),
+                reason,
+                datetime.now(timezone.utc),
+                InfractionType.BAN,
+                None,
+                None,
+                None,
+            )
+        )
+        if infraction:
+            if time:
+                self.bot.db.temp_bans.save(
+                    TempBan(
+                        infraction.id,
+                        guild.id,
+                        infraction.user,
+                        infraction.infraction_on + time,
+                    )
+                )
+            else:
+                self.bot.db.temp_bans.delete_all(guild.id, [who.id])
+            await self.bot.direct_messages.deliver(
+                who,
+                BAN_DM_TIMEOUT,
+                title=f"Ban ID {infraction.id}",
+                msg=f"You have been banned from {guild.name} "
+                + (f'for "{reason}" ' if reason else "")
+                + (f"for {time}" if time else ""),
+            )
+        try:
+            await guild.ban(who, reason=reason, delete_message_days=0)
+        except discord.Forbidden:
+            pass
+        return infraction
+
     async def check_if_can_ban(
         self, member: typing.Union[discord.Member, discord.User]
     ):
@@ -0,0 +1,196 @@
+import typing
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from fuzzy import Fuzzy
+from fuzzy.customizations import ParseableTimedelta
+from fuzzy.models import DBUser, EscalationRule, Infraction, InfractionType
+
+
+def parse_type(argument: str) -> InfractionType:
+    """Reads warn, warns, mute, mutes, ban or bans as an infraction type."""
+    try:
+        return InfractionType(argument.lower().rstrip("s").capitalize())
+    except ValueError:
+        raise commands.BadArgument(f"{argument} is not warns, mutes or bans.")
+
+
+class Escalations(Fuzzy.Cog):
+    def __init__(self, *args):
+        super().__init__(*args)
+        # each guild's rules by counted type and count, loaded when they are first needed
+        self.rules: Dict[int, Dict[Tuple[InfractionType, int], EscalationRule]] = {}
+
+    def _rules(self, guild_id: int) -> Dict[Tuple[InfractionType, int], EscalationRule]:
+        rules = self.rules.get(guild_id)
+        if rules is None:
+            rules = self.rules[guild_id] = {
+                (rule.infraction_type, rule.count): rule
+                for rule in self.bot.db.escalations.find_by_guild(guild_id)
+            }
+        return rules
+
+    async def escalate(
+        self,
+        guild: discord.Guild,
+        user: typing.Union[discord.Member, discord.User],
+        infraction_type: InfractionType,
+    ) -> Optional[Infraction]:
+        """Mutes or bans a user who just reached the count of active infractions of a rule. Called
+        after every warn and mute. A mute that would end before the user's active mute is skipped.
+        Returns the new infraction, if there is one."""
+        rules = self._rules(guild.id)
+        if not any(rule_type == infraction_type for rule_type, _ in rules):
+            return None
+        count = self.bot.db.infractions.count_active(user.id, guild.id, infraction_type)
+        rule = rules.get((infraction_type, count))
+        if not rule:
+            return None
+
+        reason = f"Reached {count} active {infraction_type.value.lower()}s"
+        moderator = DBUser(
+            self.bot.user.id, f"{self.bot.user.name}#{self.bot.user.discriminator}"
+        )
+        if rule.action == InfractionType.MUTE:
+            mutes = self.bot.get_cog("Mutes")
+            if not mutes.can_mute(guild, rule.duration):
+                self.log.warning(
+                    "Could not escalate to a mute, %s has no way to mute", guild.id
+                )
+                return None
+            # replacing a longer mute would shorten it
+            active_mute = self.bot.db.mutes.find_active_mute(user.id, guild.id)
+            if (
+                active_mute
+                and active_mute.end_time >= datetime.now(timezone.utc) + rule.duration
+            ):
+                return None
+            infraction = await mutes.mute_member(
+                guild, user, moderator, rule.duration, reason
+            )
+            await self.bot.direct_messages.enqueue(
+                user,
+                title=f"Mute ID {infraction.id}",
+                msg=f"You have been muted on {guild.name} for {rule.duration} "
+                f'for "{reason}"',
+            )
+            action = f"Muted for {rule.duration}"
+        else:
+            bans = self.bot.get_cog("Bans")
+            if not await bans.check_if_can_ban(user):
+                self.log.warning(
+                    "Could not escalate to a ban of %s on %s", user.id, guild.id
+                )
+                return None
+            infraction = await bans.ban_user(
+                guild, user, moderator, reason, rule.duration
+            )
+            action = f"Banned for {rule.duration}" if rule.duration else "Banned"
+
+        await self.bot.post_log(
+            guild,
+            title="Escalation",
+            msg=f"{action} {user.mention} for reaching {count} active "
+            f"{infraction_type.value.lower()}s: {infraction.infraction_type.value} "
+            f"**ID {infraction.id}**",
+            color=self.bot.Context.Color.BAD,
+        )
+        if rule.action == InfractionType.MUTE:
+            await self.escalate(guild, user, InfractionType.MUTE)
+        return infraction
+
+    @commands.group()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def escalations(self, ctx: Fuzzy.Context):
+        """Manages the rules that mute or ban users automatically once they have a number of
+        active warns or mutes. Pardoned and expired infractions don't count."""
+
+    @commands.command(parent=escalations)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def add(
+        self,
+        ctx: Fuzzy.Context,
+        counted: str,
+        count: int,
+        action: str,
+        duration: Optional[ParseableTimedelta] = None,
+    ):
+        """Adds a rule, replacing the one for the same count, i.e.
+        `${pfx}escalations add warns 3 mute 1d` or `${pfx}escalations add warns 5 ban`.
+        `counted` is warns or mutes.
+        `count` is how many active infractions trigger the rule.
+        `action` is mute or ban.
+        `duration` is how long the mute lasts. Bans with a duration are temporary."""
+        infraction_type = parse_type(counted)
+        action = parse_type(action)
+        if infraction_type == InfractionType.BAN:
+            raise commands.BadArgument("Only warns and mutes can be counted.")
+        if action == InfractionType.WARN:
+            raise commands.BadArgument("The action must be mute or ban.")
+        if count < 1:
+            raise commands.BadArgument("The count must be at least 1.")
+        if action == InfractionType.MUTE and not duration:
+            raise commands.BadArgument("Give how long the mute lasts, i.e. `1d`.")
+
+        rule = ctx.db.escalations.save(
+            EscalationRule(
+                ctx.guild.id,
+                infraction_type,
+                count,
+                action,
+                timedelta(seconds=duration.total_seconds()) if duration else None,
+            )
+        )
+        self.rules.pop(ctx.guild.id, None)
+        await ctx.reply(f"Added the rule: {self._describe(rule)}", color=ctx.Color.GOOD)
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} added the escalation rule: "
+            f"{self._describe(rule)}",
+        )
+
+    @commands.command(parent=escalations)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def remove(self, ctx: Fuzzy.Context, counted: str, count: int):
+        """Removes a rule, i.e. `${pfx}escalations remove warns 3`.
+        `counted` is warns or mutes.
+        `count` is the count of the rule."""
+        infraction_type = parse_type(counted)
+        ctx.db.escalations.delete(ctx.guild.id, infraction_type, count)
+        self.rules.pop(ctx.guild.id, None)
+        await ctx.reply(
+            f"Removed the rule for {count} {infraction_type.value.lower()}s.",
+            color=ctx.Color.GOOD,
+        )
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} removed the escalation rule for "
+            f"{count} {infraction_type.value.lower()}s",
+        )
+
+    @commands.command(parent=escalations, name="list")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def list_(self, ctx: Fuzzy.Context):
+        """Lists the rules."""
+        await ctx.reply(
+            "\n".join(
+                self._describe(rule) for rule in self._rules(ctx.guild.id).values()
+            )
+            or "There are no escalation rules.",
+            title="Escalation rules",
+            color=ctx.Color.AUTOMATIC_BLUE,
+        )
+
+    @staticmethod
+    def _describe(rule: EscalationRule) -> str:
+        action = rule.action.value.lower()
+        if rule.duration:
+            action += f" for {rule.duration}"
+        return f"{rule.count} {rule.infraction_type.value.lower()}s → {action}"
+
+
+async def setup(bot):
+    await bot.add_cog(Escalations(bot))
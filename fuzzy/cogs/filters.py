@@ -0,0 +1,240 @@
+import re
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import discord
+from discord.ext import commands
+
+from fuzzy import Fuzzy
+from fuzzy.filters import ANY_DOMAIN, DomainFilter, WordFilter
+from fuzzy.models import DBUser, Infraction, InfractionType
+
+DOMAIN_PATTERN = re.compile(r"^[\w-]+(\.[\w-]+)*$")
+
+
+def parse_domains(domains: List[str]) -> List[str]:
+    """Reads domains as moderators write them, i.e. `*.evil.com` or `https://evil.com/path`."""
+    parsed = []
+    for domain in domains:
+        domain = domain.strip().lower().split("://")[-1].split("/")[0].rstrip(".")
+        if domain.startswith("*."):
+            domain = domain[2:]
+        if domain != ANY_DOMAIN and not DOMAIN_PATTERN.match(domain):
+            raise commands.BadArgument(f"{domain} is not a domain.")
+        parsed.append(domain)
+    if not parsed:
+        raise commands.BadArgument("Give at least one domain.")
+    return parsed
+
+
+class Filters(Fuzzy.Cog):
+    def __init__(self, *args):
+        super().__init__(*args)
+        # compiled when a guild's first message arrives, and again only when its lists change
+        self.word_filters: Dict[int, WordFilter] = {}
+        self.domain_filters: Dict[int, DomainFilter] = {}
+
+    def _word_filter(self, guild_id: int) -> WordFilter:
+        word_filter = self.word_filters.get(guild_id)
+        if word_filter is None:
+            word_filter = self.word_filters[guild_id] = WordFilter(
+                self.bot.db.filters.find_words(guild_id)
+            )
+        return word_filter
+
+    def _domain_filter(self, guild_id: int) -> DomainFilter:
+        domain_filter = self.domain_filters.get(guild_id)
+        if domain_filter is None:
+            domain_filter = self.domain_filters[guild_id] = DomainFilter(
+                self.bot.db.filters.find_domains(guild_id)
+            )
+        return domain_filter
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Deletes messages containing filtered words or links and warns their authors."""
+        if not message.guild or message.author.bot or not message.content:
+            return
+        reason = None
+        word_filter = self._word_filter(message.guild.id)
+        if word_filter:
+            word = word_filter.find(message.content)
+            if word:
+                reason, detail = "Used a filtered word", f"||{word}||"
+        if not reason:
+            domain_filter = self._domain_filter(message.guild.id)
+            if domain_filter:
+                domain = domain_filter.find(message.content)
+                if domain:
+                    reason, detail = "Posted a filtered link", f"`{domain}`"
+        if (
+            reason
+            and not message.channel.permissions_for(message.author).manage_messages
+        ):
+            await self._punish(message, reason, detail)
+
+    async def _punish(self, message: discord.Message, reason: str, detail: str):
+        """Deletes the message and records a warning for its author."""
+        try:
+            await message.delete()
+        except discord.NotFound:
+            return
+        author = message.author
+        infraction = self.bot.db.infractions.save(
+            Infraction(
+                None,
+                DBUser(author.id, f"{author.name}#{author.discriminator}"),
+                DBUser(
+                    self.bot.user.id,
+                    f"{self.bot.user.name}#{self.bot.user.discriminator}",
+                ),
+                self.bot.db.guilds.find_by_id(message.guild.id),
+                reason,
+                datetime.now(timezone.utc),
+                InfractionType.WARN,
+                None,
+                None,
+                None,
+            )
+        )
+        await self.bot.direct_messages.enqueue(
+            author,
+            title=f"Warning ID {infraction.id}",
+            msg=f'You have been warned on {message.guild.name} for "{reason}"',
+        )
+        await self.bot.post_log(
+            message.guild,
+            title="Warn",
+            msg=f"**Mod:** {self.bot.user.mention}\n"
+            f"**Reason:** {reason} in {message.channel.mention}: {detail}\n"
+            f"{author.mention}: Warning **ID {infraction.id}**",
+            color=self.bot.Context.Color.I_GUESS,
+        )
+        if escalations := self.bot.get_cog("Escalations"):
+            await escalations.escalate(message.guild, author, InfractionType.WARN)
+
+    @commands.group(name="filter")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def filter_(self, ctx: Fuzzy.Context):
+        """Manages the words, phrases and links whose messages are deleted. Their authors are
+        warned, unless they are moderators."""
+
+    @commands.group(parent=filter_)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def words(self, ctx: Fuzzy.Context):
+        """Manages the filtered words and phrases. Only whole words are matched and case is
+        ignored, so `ass` doesn't filter `class`."""
+
+    @commands.command(parent=words)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def add(self, ctx: Fuzzy.Context, *words: str):
+        """Adds words to the filter.
+        `words` is a space-separated list of words. Put phrases in quotes."""
+        words = [word.strip().casefold() for word in words if word.strip()]
+        if not words:
+            raise commands.BadArgument("Give at least one word to filter.")
+        ctx.db.filters.add_words(ctx.guild.id, words)
+        self.word_filters.pop(ctx.guild.id, None)
+        await ctx.reply(f"Added {len(words)} words to the filter.")
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} added "
+            f"{', '.join(f'||{word}||' for word in words)} to the word filter",
+        )
+
+    @commands.command(parent=words)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def remove(self, ctx: Fuzzy.Context, *words: str):
+        """Removes words from the filter.
+        `words` is a space-separated list of words. Put phrases in quotes."""
+        words = [word.strip().casefold() for word in words if word.strip()]
+        if not words:
+            raise commands.BadArgument("Give at least one word to remove.")
+        ctx.db.filters.remove_words(ctx.guild.id, words)
+        self.word_filters.pop(ctx.guild.id, None)
+        await ctx.reply(f"Removed {len(words)} words from the filter.")
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} removed "
+            f"{', '.join(f'||{word}||' for word in words)} from the word filter",
+        )
+
+    @commands.command(parent=words, name="list")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def list_(self, ctx: Fuzzy.Context):
+        """Lists the filtered words."""
+        words = ctx.db.filters.find_words(ctx.guild.id)
+        await ctx.reply(
+            "\n".join(f"||{word}||" for word in words) or "No words are filtered.",
+            title="Filtered words",
+            color=ctx.Color.AUTOMATIC_BLUE,
+        )
+
+    @commands.group(parent=filter_)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def links(self, ctx: Fuzzy.Context):
+        """Manages which links and invites may be posted. A domain covers its subdomains, and the
+        most specific domain listed wins, so `${pfx}filter links deny *` followed by
+        `${pfx}filter links allow youtube.com` only allows YouTube links. Every Discord invite
+        counts as `discord.gg`."""
+
+    @commands.command(parent=links)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def allow(self, ctx: Fuzzy.Context, *domains: str):
+        """Allows links to domains.
+        `domains` is a space-separated list of domains."""
+        await self._save_domains(ctx, parse_domains(domains), True)
+
+    @commands.command(parent=links)
+    @commands.has_guild_permissions(manage_guild=True)
+    async def deny(self, ctx: Fuzzy.Context, *domains: str):
+        """Denies links to domains. `*` denies every domain that isn't allowed.
+        `domains` is a space-separated list of domains."""
+        await self._save_domains(ctx, parse_domains(domains), False)
+
+    async def _save_domains(
+        self, ctx: Fuzzy.Context, domains: List[str], allowed: bool
+    ):
+        ctx.db.filters.save_domains(ctx.guild.id, domains, allowed)
+        self.domain_filters.pop(ctx.guild.id, None)
+        action = "allowed" if allowed else "denied"
+        await ctx.reply(f"{action.capitalize()} {', '.join(domains)}.")
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} {action} links to "
+            f"{', '.join(domains)}",
+        )
+
+    @commands.command(parent=links, name="remove")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def remove_domains(self, ctx: Fuzzy.Context, *domains: str):
+        """Removes domains from both lists.
+        `domains` is a space-separated list of domains."""
+        domains = parse_domains(domains)
+        ctx.db.filters.remove_domains(ctx.guild.id, domains)
+        self.domain_filters.pop(ctx.guild.id, None)
+        await ctx.reply(f"Removed {', '.join(domains)} from the link filter.")
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} removed "
+            f"{', '.join(domains)} from the link filter",
+        )
+
+    @commands.command(parent=links, name="list")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def list_domains(self, ctx: Fuzzy.Context):
+        """Lists the allowed and denied domains."""
+        domains = ctx.db.filters.find_domains(ctx.guild.id)
+        await ctx.reply(
+            "\n".join(
+                f"{'Allowed' if allowed else 'Denied'}: {domain}"
+                for domain, allowed in domains.items()
+            )
+            or "No domains are filtered.",
+            title="Filtered links",
+            color=ctx.Color.AUTOMATIC_BLUE,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(Filters(bot))
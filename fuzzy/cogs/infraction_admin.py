@@ -34,15 +34,11 @@ class InfractionAdmin(Fuzzy.Cog):
             infraction.infraction_type.value == InfractionType.BAN.value
             and infraction.published_unban
         ):
-            channel: discord.TextChannel = ctx.guild.get_channel(
-                ctx.db.guilds.find_by_id(ctx.guild.id).public_log
-            )
-            message: discord.Message = await channel.fetch_message(
-                infraction.published_unban.message_id
-            )
-            if message:
-                await message.edit(embed=InfractionAdmin.create_unban_embed(infraction))
-            else:
+            if not await self.bot.edit_published(
+                ctx.guild,
+                infraction.published_unban.message_id,
+                InfractionAdmin.create_unban_embed(infraction),
+            ):
                 ctx.db.published_messages.delete_with_type(
                     infraction.id, infraction.published_unban.publish_type
                 )
@@ -137,15 +133,11 @@ class InfractionAdmin(Fuzzy.Cog):
             infraction.infraction_type.value == InfractionType.BAN.value
             and infraction.published_ban
         ):
-            channel: discord.TextChannel = ctx.guild.get_channel(
-                ctx.db.guilds.find_by_id(ctx.guild.id).public_log
-            )
-            try:
-                message: discord.Message = await channel.fetch_message(
-                    infraction.published_ban.message_id
-                )
-                await message.edit(embed=InfractionAdmin.create_ban_embed(infraction))
-            except discord.NotFound or discord.Forbidden:
+            if not await self.bot.edit_published(
+                ctx.guild,
+                infraction.published_ban.message_id,
+                InfractionAdmin.create_ban_embed(infraction),
+            ):
                 ctx.db.published_messages.delete_with_type(
                     infraction.id, infraction.published_ban.publish_type
                 )
@@ -206,7 +198,7 @@ class InfractionAdmin(Fuzzy.Cog):
         # noinspection PyTypeChecker
         channel: discord.TextChannel = None
         if guild.public_log:
-            channel = await ctx.bot.fetch_channel(guild.public_log)
+            channel = ctx.guild.get_channel(guild.public_log)
         if channel is None:
             await ctx.reply(msg="Error Fetching Public Log Channel")
             return
@@ -214,7 +206,9 @@ class InfractionAdmin(Fuzzy.Cog):
         all_published_bans = []
         all_message_errors = []
         for ban in all_bans:
-            message = await channel.send(embed=InfractionAdmin.create_ban_embed(ban))
+            message = await self.bot.publish(
+                ctx.guild, InfractionAdmin.create_ban_embed(ban)
+            )
             if message:
                 all_published_bans.append(
                     ctx.db.published_messages.save(
@@ -299,7 +293,7 @@ class InfractionAdmin(Fuzzy.Cog):
         # noinspection PyTypeChecker
         channel: discord.TextChannel = None
         if guild.public_log:
-            channel = await ctx.bot.fetch_channel(guild.public_log)
+            channel = ctx.guild.get_channel(guild.public_log)
         if channel is None:
             await ctx.reply(msg="Error Fetching Public Log Channel")
             return
@@ -307,7 +301,9 @@ class InfractionAdmin(Fuzzy.Cog):
         all_published_unbans = []
         all_message_errors = []
         for ban in all_unbans:
-            message = await channel.send(embed=InfractionAdmin.create_unban_embed(ban))
+            message = await self.bot.publish(
+                ctx.guild, InfractionAdmin.create_unban_embed(ban)
+            )
             if message:
                 all_published_unbans.append(
                     ctx.db.published_messages.save(
@@ -1,5 +1,7 @@
-from datetime import datetime, timezone
-from typing import List, Optional
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
 import typing
 
 import discord
@@ -7,50 +9,124 @@ from discord.ext import commands, tasks
 
 from fuzzy import Fuzzy
 from fuzzy.customizations import ParseableTimedelta
+from fuzzy.detection import LRUDict
 from fuzzy.models import DBUser, Lock, ThreadLock
 
+# how many channels' permissions are changed at the same time
+OVERWRITE_CONCURRENCY = 5
+# how long messages in a locked thread are collected before they are deleted together
+DELETE_BATCH_DELAY = 1
+# how long to wait before trying again to unlock channels whose permissions couldn't be changed
+UNLOCK_RETRY_DELAY = timedelta(minutes=1)
+# how many threads' lock state is cached for on_message
+MAX_CACHED_THREADS = 10000
+
 
 class Locks(Fuzzy.Cog):
     def __init__(self, *args):
+        # whether a thread has a lock, so not every message needs a database query
+        self.locked_threads: LRUDict[int, bool] = LRUDict(MAX_CACHED_THREADS)
+        # messages waiting to be deleted, by thread
+        self.pending_deletes: Dict[int, List[discord.Message]] = {}
+        self.delete_tasks: Set[asyncio.Task] = set()
         self.execute_expired_locks.start()  # pylint: disable=no-member
         super().__init__(*args)
 
     @tasks.loop(seconds=0.5)
     async def execute_expired_locks(self):
-        """Finds expired locks and unlocks them."""
-        locks: List[Lock] = self.bot.db.locks.find_expired_locks()
+        """Finds expired locks and unlocks them. Channels that were locked together are
+        unlocked together, with one log entry."""
+        locks: List[Lock] = self.bot.db.locks.find_expired_locks(
+            self.bot.shard_count or 1, self.bot.shard_ids
+        )
+        now = datetime.now(timezone.utc)
+        batches: Dict[Tuple[int, datetime], List[Lock]] = defaultdict(list)
         for lock in locks:
-            guild: discord.Guild = self.bot.get_guild(lock.guild.id)
-            # noinspection PyTypeChecker
-            channel: discord.TextChannel = None
-            # noinspection PyTypeChecker
-            everyone_role: discord.Role = None
+            self.bot.metrics.observe(
+                "fuzzy_expiry_lag_seconds",
+                (now - lock.end_time).total_seconds(),
+                loop="locks",
+            )
+            batches[(lock.guild.id, lock.end_time)].append(lock)
+        for (guild_id, _), batch in batches.items():
+            guild: discord.Guild = self.bot.get_guild(guild_id)
             if guild:
-                channel = guild.get_channel(lock.channel_id)
-                everyone_role = guild.get_role(lock.guild.id)
-            if channel and everyone_role:
-                overwrite = channel.overwrites_for(everyone_role)
-                overwrite.update(send_messages=lock.previous_value)
-                await channel.set_permissions(everyone_role, overwrite=overwrite)
-                await self.bot.post_log(
-                    guild,
-                    msg=f"{channel.mention} was unlocked by {self.bot.user.display_name}",
-                    color=self.bot.Context.Color.GOOD,
-                )
-            self.bot.db.locks.delete(lock.channel_id)
+                everyone_role: discord.Role = guild.get_role(guild_id)
+                overwrites = []
+                for lock in batch:
+                    channel = guild.get_channel(lock.channel_id)
+                    if channel:
+                        overwrite = channel.overwrites_for(everyone_role)
+                        overwrite.update(send_messages=lock.previous_value)
+                        overwrites.append((channel, overwrite))
+                failed = await self._set_overwrites(everyone_role, overwrites)
+                unlocked = [
+                    channel for channel, _ in overwrites if channel not in failed
+                ]
+                msg = ""
+                if unlocked:
+                    msg += (
+                        f"{', '.join(channel.mention for channel in unlocked)} "
+                        f"{'was' if len(unlocked) == 1 else 'were'} unlocked by "
+                        f"{self.bot.user.display_name}\n"
+                    )
+                if failed:
+                    msg += (
+                        f"Could not unlock {', '.join(channel.mention for channel in failed)}, "
+                        f"trying again in {UNLOCK_RETRY_DELAY}"
+                    )
+                if msg:
+                    await self.bot.post_log(
+                        guild,
+                        msg=msg.strip(),
+                        color=self.bot.Context.Color.I_GUESS
+                        if failed
+                        else self.bot.Context.Color.GOOD,
+                    )
+                failed_ids = {channel.id for channel in failed}
+                retried = [lock for lock in batch if lock.channel_id in failed_ids]
+                if retried:
+                    for lock in retried:
+                        lock.end_time = now + UNLOCK_RETRY_DELAY
+                    self.bot.db.locks.save_all(retried)
+                batch = [lock for lock in batch if lock.channel_id not in failed_ids]
+            self.bot.db.locks.delete_all([lock.channel_id for lock in batch])
 
-        thread_locks = self.bot.db.thread_locks.find_expired_locks()
+        thread_locks = self.bot.db.thread_locks.find_expired_locks(
+            self.bot.shard_count or 1, self.bot.shard_ids
+        )
         for thread_lock in thread_locks:
+            self.bot.metrics.observe(
+                "fuzzy_expiry_lag_seconds",
+                (now - thread_lock.end_time).total_seconds(),
+                loop="thread_locks",
+            )
             guild: discord.Guild = self.bot.get_guild(thread_lock.guild.id)
-            # noinspection PyTypeChecker
-            channel: discord.Thread = None
             if guild:
-                channel = guild.get_thread(thread_lock.channel_id)
-                await self.bot.post_log(
-                    guild,
-                    msg=f"{channel.mention} was unlocked by {self.bot.user.display_name}",
-                    color=self.bot.Context.Color.GOOD,
-                )
+                thread = await self._find_thread(guild, thread_lock.channel_id)
+                if thread:
+                    if thread.locked:
+                        try:
+                            await thread.edit(locked=False)
+                        except discord.HTTPException as ex:
+                            self.log.warning(
+                                "Could not unlock thread %s: %s", thread.id, ex
+                            )
+                            await self.bot.post_log(
+                                guild,
+                                msg=f"Could not unlock {thread.mention}, "
+                                f"trying again in {UNLOCK_RETRY_DELAY}",
+                                color=self.bot.Context.Color.I_GUESS,
+                            )
+                            thread_lock.end_time = now + UNLOCK_RETRY_DELAY
+                            self.bot.db.thread_locks.save(thread_lock)
+                            continue
+                    await self.bot.post_log(
+                        guild,
+                        msg=f"{thread.mention} was unlocked by {self.bot.user.display_name}",
+                        color=self.bot.Context.Color.GOOD,
+                    )
+            self.locked_threads.pop(thread_lock.channel_id, None)
             self.bot.db.thread_locks.delete(thread_lock.channel_id)
 
     @commands.has_permissions(manage_messages=True)
@@ -58,127 +134,272 @@ class Locks(Fuzzy.Cog):
     async def lock(
         self,
         ctx: Fuzzy.Context,
-        channel: Optional[typing.Union[discord.TextChannel, discord.Thread]],
+        channels: commands.Greedy[
+            typing.Union[discord.TextChannel, discord.CategoryChannel, discord.Thread]
+        ],
         time: ParseableTimedelta,
         *,
         reason: Optional[str] = "",
     ):
-        """Prevents users from being able to speak in a channel.
-        `channel` is the channel to lock. If left empty the current channel will be used.
+        """Prevents users from being able to speak in one or more channels.
+        `channels` are the channels to lock, separated by spaces. A category locks every text
+        channel in it. If left empty the current channel will be used.
 
         `time` is a time delta in (d)ays (h)ours (m)inutes (s)econds.
         Number first, and type second i.e.`5h` for 5 hours
 
         `reason` is the reason for the mute. This is optional."""
-        lock = None
-
-        if not channel:
-            channel = ctx.channel
-        # if not channel.permissions_for(ctx.author).manage_messages:
-        #     await ctx.reply("Insufficient permissions to lock channel.")
-        #     return
-        if channel in ctx.guild.channels:
-            lock = await self._lock_channel(ctx, channel, time, reason)
-        elif channel in ctx.guild.threads:
-            lock = self._lock_thread_channel(ctx, channel, time, reason)
-        if not lock:
+        channels = self._expand_categories(channels or [ctx.channel])
+        text_channels = [
+            channel for channel in channels if channel in ctx.guild.channels
+        ]
+        threads = [channel for channel in channels if channel in ctx.guild.threads]
+        if not text_channels and not threads:
             try:
                 await ctx.reply("Could not find a channel with those IDs.")
             except discord.Forbidden:
                 pass
             return
+
+        failed = await self.lock_channels(
+            ctx.guild,
+            text_channels,
+            DBUser(ctx.author.id, f"{ctx.author.name}#{ctx.author.discriminator}"),
+            datetime.now(timezone.utc) + time,
+            reason,
+        )
+        for thread in threads:
+            await self._lock_thread_channel(ctx, thread, time, reason)
+        locked = [
+            channel for channel in text_channels if channel not in failed
+        ] + threads
+
+        msg = ""
+        if locked:
+            msg += f"Locked {', '.join(channel.mention for channel in locked)} for {time}\n"
+        if failed:
+            msg += f"Could not lock {', '.join(channel.mention for channel in failed)}"
         try:
-            await ctx.reply(f"Locked {channel.mention} for {time}")
+            await ctx.reply(msg.strip())
         except discord.Forbidden:
             pass
-        await self.bot.post_log(
-            ctx.guild,
-            msg=f"{ctx.author.name}#{ctx.author.discriminator} "
-            f"locked {channel.mention} for {time} for {reason}",
-        )
+        if locked:
+            await self.bot.post_log(
+                ctx.guild,
+                msg=f"{ctx.author.name}#{ctx.author.discriminator} "
+                f"locked {', '.join(channel.mention for channel in locked)} "
+                f"for {time} for {reason}",
+            )
 
-    async def _lock_channel(
+    async def lock_channels(
         self,
-        ctx: Fuzzy.Context,
-        channel: discord.TextChannel,
-        time: ParseableTimedelta,
+        guild: discord.Guild,
+        channels: List[discord.TextChannel],
+        moderator: DBUser,
+        end_time: datetime,
         reason: str,
-    ):
-        everyone_role: discord.Role = ctx.guild.get_role(ctx.guild.id)
-        overwrite = channel.overwrites_for(everyone_role)
-        lock = ctx.db.locks.save(
-            Lock(
-                channel.id or ctx.channel.id,
-                overwrite.send_messages,
-                DBUser(ctx.author.id, f"{ctx.author.name}#{ctx.author.discriminator}"),
-                ctx.db.guilds.find_by_id(ctx.guild.id),
-                reason,
-                datetime.now(timezone.utc) + time,
+    ) -> List[discord.TextChannel]:
+        """Locks the channels, saving all their locks at once. Returns the channels whose
+        permissions could not be changed; their new locks are removed again, and locks they
+        already had are restored."""
+        if not channels:
+            return []
+        everyone_role: discord.Role = guild.get_role(guild.id)
+        settings = self.bot.db.guilds.find_by_id(guild.id)
+        existing: Dict[int, Lock] = {}
+        for channel in channels:
+            lock = self.bot.db.locks.find_by_id(channel.id)
+            if lock:
+                existing[channel.id] = lock
+        locks = []
+        overwrites = []
+        for channel in channels:
+            overwrite = channel.overwrites_for(everyone_role)
+            locks.append(
+                Lock(
+                    channel.id,
+                    overwrite.send_messages,
+                    moderator,
+                    settings,
+                    reason,
+                    end_time,
+                )
             )
-        )
-        overwrite.update(send_messages=False)
-        await channel.set_permissions(everyone_role, overwrite=overwrite)
-        return lock
+            overwrite.update(send_messages=False)
+            overwrites.append((channel, overwrite))
+        self.bot.db.locks.save_all(locks)
+        failed = await self._set_overwrites(everyone_role, overwrites)
+        if failed:
+            self.bot.db.locks.delete_all(
+                [channel.id for channel in failed if channel.id not in existing]
+            )
+            restored = [
+                existing[channel.id] for channel in failed if channel.id in existing
+            ]
+            if restored:
+                self.bot.db.locks.save_all(restored)
+        return failed
 
-    def _lock_thread_channel(
+    async def _lock_thread_channel(
         self,
         ctx: Fuzzy.Context,
-        channel: discord.TextChannel,
+        channel: discord.Thread,
         time: ParseableTimedelta,
         reason: str,
     ):
-
+        """Locks the thread through Discord, so only moderators can post in it. If Fuzzy isn't
+        allowed to, messages posted in the thread get deleted instead."""
         lock = ctx.db.thread_locks.save(
             ThreadLock(
-                channel.id or ctx.channel.id,
+                channel.id,
                 DBUser(ctx.author.id, f"{ctx.author.name}#{ctx.author.discriminator}"),
                 ctx.db.guilds.find_by_id(ctx.guild.id),
                 reason,
                 datetime.now(timezone.utc) + time,
             )
         )
+        # the next message in the thread reads the new lock
+        self.locked_threads.pop(channel.id)
+        try:
+            await channel.edit(locked=True)
+        except discord.HTTPException as ex:
+            self.log.warning(
+                "Could not lock thread %s, deleting its messages instead: %s",
+                channel.id,
+                ex,
+            )
         return lock
 
+    @staticmethod
+    async def _find_thread(
+        guild: discord.Guild, thread_id: int
+    ) -> Optional[discord.Thread]:
+        """Archived threads aren't cached, so they have to be fetched."""
+        thread = guild.get_thread(thread_id)
+        if not thread:
+            try:
+                thread = await guild.fetch_channel(thread_id)
+            except discord.HTTPException:
+                pass
+        return thread
+
     @commands.command()
     async def unlock(
         self,
         ctx: Fuzzy.Context,
-        channel: Optional[discord.TextChannel],
+        channels: commands.Greedy[
+            typing.Union[discord.TextChannel, discord.CategoryChannel]
+        ],
     ):
-        """Prevents users from being able to speak in a channel.
-        channel` is the channel to lock. If left empty the current channel will be used."""
-        lock = None
+        """Allows users to speak in locked channels again.
+        `channels` are the channels to unlock, separated by spaces. A category unlocks every text
+        channel in it. If left empty the current channel will be used."""
         everyone_role: discord.Role = ctx.guild.get_role(ctx.guild.id)
-        if not channel:
-            channel = ctx.channel
-        if not channel.permissions_for(ctx.author).manage_messages:
+        channels = self._expand_categories(channels or [ctx.channel])
+        if not all(
+            channel.permissions_for(ctx.author).manage_messages for channel in channels
+        ):
             await ctx.reply("Insufficient permissions to unlock channel.")
             return
-        if channel in ctx.guild.channels:
+        overwrites = []
+        for channel in channels:
             lock = ctx.db.locks.find_by_id(channel.id)
-            overwrite = channel.overwrites_for(everyone_role)
-            overwrite.update(send_messages=lock.previous_value)
-            await channel.set_permissions(everyone_role, overwrite=overwrite)
-            ctx.db.locks.delete(lock.channel_id)
-        if not lock:
+            if lock and channel in ctx.guild.channels:
+                overwrite = channel.overwrites_for(everyone_role)
+                overwrite.update(send_messages=lock.previous_value)
+                overwrites.append((channel, overwrite))
+        if not overwrites:
             await ctx.reply("Could not find a locked channel with that ID.")
             return
-        await ctx.reply(f"Unlocked {channel.mention}")
-        await self.bot.post_log(
-            ctx.guild,
-            msg=f"{ctx.author.name}#{ctx.author.discriminator} "
-            f"unlocked {channel.mention}",
+        failed = await self._set_overwrites(everyone_role, overwrites)
+        unlocked = [channel for channel, _ in overwrites if channel not in failed]
+        ctx.db.locks.delete_all([channel.id for channel in unlocked])
+
+        msg = ""
+        if unlocked:
+            msg += f"Unlocked {', '.join(channel.mention for channel in unlocked)}\n"
+        if failed:
+            msg += (
+                f"Could not unlock {', '.join(channel.mention for channel in failed)}"
+            )
+        await ctx.reply(msg.strip())
+        if unlocked:
+            await self.bot.post_log(
+                ctx.guild,
+                msg=f"{ctx.author.name}#{ctx.author.discriminator} "
+                f"unlocked {', '.join(channel.mention for channel in unlocked)}",
+            )
+
+    @staticmethod
+    def _expand_categories(channels: List[discord.abc.GuildChannel]) -> List:
+        """Replaces categories with their text channels, dropping duplicates."""
+        expanded = []
+        for channel in channels:
+            if isinstance(channel, discord.CategoryChannel):
+                expanded.extend(channel.text_channels)
+            else:
+                expanded.append(channel)
+        return list(dict.fromkeys(expanded))
+
+    async def _set_overwrites(
+        self,
+        role: discord.Role,
+        overwrites: List[Tuple[discord.abc.GuildChannel, discord.PermissionOverwrite]],
+    ) -> List[discord.abc.GuildChannel]:
+        """Applies the overwrites a few channels at a time. discord.py already waits out rate
+        limits, this keeps a whole category from queueing up behind them at once.
+        Returns the channels that could not be updated."""
+        semaphore = asyncio.Semaphore(OVERWRITE_CONCURRENCY)
+
+        async def set_overwrite(channel, overwrite):
+            async with semaphore:
+                await channel.set_permissions(role, overwrite=overwrite)
+
+        results = await asyncio.gather(
+            *(set_overwrite(channel, overwrite) for channel, overwrite in overwrites),
+            return_exceptions=True,
         )
+        failed = []
+        for (channel, _), result in zip(overwrites, results):
+            if isinstance(result, discord.HTTPException):
+                self.log.warning(
+                    "Could not change the permissions of %s: %s", channel.id, result
+                )
+                failed.append(channel)
+            elif isinstance(result, BaseException):
+                raise result
+        return failed
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        """Deletes any messages sent in a locked thread."""
-        thread: ThreadLock = self.bot.db.thread_locks.find_by_id(message.channel.id)
-        if (
-            thread
-            and not message.channel.permissions_for(message.author).manage_messages
-        ):
-            await message.delete()
+        """Deletes any messages sent in a locked thread Discord isn't enforcing the lock for."""
+        thread = message.channel
+        if not isinstance(thread, discord.Thread) or thread.locked:
+            return
+        locked = self.locked_threads.get_or_create(
+            thread.id,
+            lambda: self.bot.db.thread_locks.find_by_id(thread.id) is not None,
+        )
+        if locked and not thread.permissions_for(message.author).manage_messages:
+            pending = self.pending_deletes.setdefault(thread.id, [])
+            pending.append(message)
+            if len(pending) == 1:
+                task = asyncio.create_task(self._delete_pending(thread))
+                # the event loop only keeps weak references to tasks
+                self.delete_tasks.add(task)
+                task.add_done_callback(self.delete_tasks.discard)
+
+    async def _delete_pending(self, thread: discord.Thread):
+        """Waits for more messages to come in, then deletes them in bulk."""
+        await asyncio.sleep(DELETE_BATCH_DELAY)
+        messages = self.pending_deletes.pop(thread.id, [])
+        for start in range(0, len(messages), 100):
+            try:
+                await thread.delete_messages(messages[start : start + 100])
+            except discord.HTTPException as ex:
+                self.log.warning(
+                    "Could not delete messages in thread %s: %s", thread.id, ex
+                )
 
 
 async def setup(bot):
@@ -1,10 +1,24 @@
-from typing import List
+from datetime import timedelta
+from typing import Callable, List, Optional
 
 import discord
 from discord.ext import commands
 
 from fuzzy import Fuzzy
-from fuzzy.models import Infraction
+from fuzzy.customizations import ParseableDate
+from fuzzy.models import Infraction, InfractionSearch, InfractionType
+
+
+class SearchFlags(commands.FlagConverter):
+    """The filters accepted by the search command."""
+
+    reason: Optional[str] = None
+    user: Optional[discord.User] = None
+    mod: Optional[discord.User] = None
+    infraction_type: Optional[str] = commands.flag(name="type", default=None)
+    since: Optional[ParseableDate] = None
+    until: Optional[ParseableDate] = None
+    pardoned: Optional[bool] = None
 
 
 class Logs(Fuzzy.Cog):
@@ -20,23 +34,17 @@ class Logs(Fuzzy.Cog):
             await ctx.reply("Insufficient permissions to access someone else's log.")
             return
 
-        all_infraction: List[Infraction] = ctx.db.infractions.find_all_for_user(
-            who.id, ctx.guild.id
+        pages = InfractionPages(
+            ctx,
+            f"Infractions for {who.name}#{who.discriminator}",
+            lambda after_id, limit: ctx.db.infractions.find_page_for_user(
+                who.id, ctx.guild.id, None, after_id, limit
+            ),
         )
-        if not all_infraction:
+        if not await pages.start():
             await ctx.reply(
                 f"{who.name}#{who.discriminator} does not have any infractions."
             )
-            return
-        fields = await Logs.create_infraction_text(self, all_infraction)
-        msgs = Logs.compile_text(fields)
-        for msg in msgs:
-            embed = discord.Embed(
-                title=f"Infractions for {who.name}#{who.discriminator}",
-                description=msg,
-                color=self.bot.Context.Color.AUTOMATIC_BLUE,
-            )
-            await ctx.send(embed=embed)
 
     @commands.command(parent=logs, aliases=["warn"])
     async def warns(self, ctx: Fuzzy.Context, who: discord.User):
@@ -46,21 +54,15 @@ class Logs(Fuzzy.Cog):
             await ctx.reply("Insufficient permissions to access someone else's log.")
             return
 
-        all_infraction: List[Infraction] = ctx.db.infractions.find_warns_for_user(
-            who.id, ctx.guild.id
+        pages = InfractionPages(
+            ctx,
+            f"Warns for {who.name}#{who.discriminator}",
+            lambda after_id, limit: ctx.db.infractions.find_page_for_user(
+                who.id, ctx.guild.id, InfractionType.WARN, after_id, limit
+            ),
         )
-        if not all_infraction:
+        if not await pages.start():
             await ctx.reply(f"{who.name}#{who.discriminator} does not have any warns.")
-            return
-        fields = await Logs.create_infraction_text(self, all_infraction)
-        msgs = Logs.compile_text(fields)
-        for msg in msgs:
-            embed = discord.Embed(
-                title=f"Warns for {who.name}#{who.discriminator}",
-                description=msg,
-                color=self.bot.Context.Color.AUTOMATIC_BLUE,
-            )
-            await ctx.send(embed=embed)
 
     @commands.command(parent=logs, aliases=["mute"])
     async def mutes(self, ctx: Fuzzy.Context, who: discord.User):
@@ -70,21 +72,15 @@ class Logs(Fuzzy.Cog):
             await ctx.reply("Insufficient permissions to access someone else's log.")
             return
 
-        all_infraction: List[Infraction] = ctx.db.infractions.find_mutes_for_user(
-            who.id, ctx.guild.id
+        pages = InfractionPages(
+            ctx,
+            f"Mutes for {who.name}#{who.discriminator}",
+            lambda after_id, limit: ctx.db.infractions.find_page_for_user(
+                who.id, ctx.guild.id, InfractionType.MUTE, after_id, limit
+            ),
         )
-        if not all_infraction:
+        if not await pages.start():
             await ctx.reply(f"{who.name}#{who.discriminator} does not have any mutes.")
-            return
-        fields = await Logs.create_infraction_text(self, all_infraction)
-        msgs = Logs.compile_text(fields)
-        for msg in msgs:
-            embed = discord.Embed(
-                title=f"Mutes for {who.name}#{who.discriminator}",
-                description=msg,
-                color=self.bot.Context.Color.AUTOMATIC_BLUE,
-            )
-            await ctx.send(embed=embed)
 
     @commands.command(parent=logs, aliases=["ban"])
     async def bans(self, ctx: Fuzzy.Context, who: discord.User):
@@ -94,21 +90,15 @@ class Logs(Fuzzy.Cog):
             await ctx.reply("Insufficient permissions to access someone else's log.")
             return
 
-        all_infraction: List[Infraction] = ctx.db.infractions.find_bans_for_user(
-            who.id, ctx.guild.id
+        pages = InfractionPages(
+            ctx,
+            f"Bans for {who.name}#{who.discriminator}",
+            lambda after_id, limit: ctx.db.infractions.find_page_for_user(
+                who.id, ctx.guild.id, InfractionType.BAN, after_id, limit
+            ),
         )
-        if not all_infraction:
+        if not await pages.start():
             await ctx.reply(f"{who.name}#{who.discriminator} does not have any bans.")
-            return
-        fields = await Logs.create_infraction_text(self, all_infraction)
-        msgs = Logs.compile_text(fields)
-        for msg in msgs:
-            embed = discord.Embed(
-                title=f"Bans for {who.name}#{who.discriminator}",
-                description=msg,
-                color=self.bot.Context.Color.AUTOMATIC_BLUE,
-            )
-            await ctx.send(embed=embed)
 
     @commands.command(parent=logs)
     async def mod(self, ctx: Fuzzy.Context, who: discord.User):
@@ -126,46 +116,138 @@ class Logs(Fuzzy.Cog):
             f"Warns: {mod_actions['warns']}",
         )
 
-    async def create_infraction_text(self, infractions: List[Infraction]) -> List[str]:
-        """creates a list of formatted messages of each infraction given."""
-        fields = []
-        for infraction in infractions:
-            moderator: discord.User = await self.bot.fetch_user(infraction.moderator.id)
-            msg = (
-                f"**{infraction.id} : {infraction.infraction_type.value}** : "
-                f"{infraction.infraction_on.strftime('%b %d, %y at %I:%m %p')}\n"
-                f"Reason: {infraction.reason}\n"
-                f"Moderator: {moderator.mention}\n"
-            )
-            if infraction.pardon:
-                pardoner: discord.User = await self.bot.fetch_user(
-                    infraction.pardon.moderator.id
-                )
-                msg = (
-                    f"~~{msg}~~"
-                    f"**Pardoned by: {pardoner.mention} on "
-                    f"{infraction.pardon.pardon_on.strftime('%b %d, %y at %I:%m %p')}**\n"
-                )
-                if infraction.pardon.reason:
-                    msg += f"**Reason: {infraction.pardon.reason}**\n"
-            fields.append(msg)
-        return fields
+    @commands.command()
+    @commands.has_guild_permissions(manage_messages=True)
+    async def search(self, ctx: Fuzzy.Context, *, flags: SearchFlags):
+        """Searches all infractions on this server. Every filter is optional and they can be combined,
+        i.e. `${pfx}search reason: spam links type: warn since: 2022-01-01`.
+        `reason:` words that must all appear in the reason.
+        `user:` the user who received the infraction.
+        `mod:` the moderator who issued the infraction.
+        `type:` warn, mute or ban.
+        `since:` and `until:` dates in the form YYYY-MM-DD. Both days are included.
+        `pardoned:` yes or no."""
+        infraction_type = None
+        if flags.infraction_type:
+            types = {member.value.casefold(): member for member in InfractionType}
+            infraction_type = types.get(flags.infraction_type.casefold().rstrip("s"))
+            if not infraction_type:
+                raise commands.BadArgument("`type:` must be one of warn, mute or ban.")
+
+        query = InfractionSearch(
+            ctx.guild.id,
+            flags.reason,
+            flags.user.id if flags.user else None,
+            flags.mod.id if flags.mod else None,
+            infraction_type,
+            flags.since,
+            flags.until + timedelta(days=1) if flags.until else None,
+            flags.pardoned,
+        )
+        pages = InfractionPages(
+            ctx,
+            "Search results",
+            lambda after_id, limit: ctx.db.infractions.search(query, after_id, limit),
+        )
+        if not await pages.start():
+            await ctx.reply("No infractions match that search.")
 
     @staticmethod
-    def compile_text(incoming_list: List[str]) -> List[str]:
-        """takes a list of strings and combines them till the max message size it hit,
-        and then creates a new msg."""
-        list_to_return = []
-        msg = ""
-        while incoming_list:
-            if len(msg) + len(incoming_list[0]) < 2048:
-                msg += incoming_list.pop(0)
-            else:
-                list_to_return.append(msg)
-                msg = ""
-            if not incoming_list:
-                list_to_return.append(msg)
-        return list_to_return
+    def infraction_text(infraction: Infraction) -> str:
+        """Formats a single infraction for display in a log."""
+        reason = infraction.reason
+        if reason and len(reason) > InfractionPages.REASON_LENGTH:
+            reason = reason[: InfractionPages.REASON_LENGTH] + "…"
+        msg = (
+            f"**{infraction.id} : {infraction.infraction_type.value}** : "
+            f"{infraction.infraction_on.strftime('%b %d, %y at %I:%m %p')}\n"
+            f"Reason: {reason}\n"
+            f"Moderator: <@{infraction.moderator.id}>\n"
+        )
+        if infraction.pardon:
+            msg = (
+                f"~~{msg}~~"
+                f"**Pardoned by: <@{infraction.pardon.moderator.id}> on "
+                f"{infraction.pardon.pardon_on.strftime('%b %d, %y at %I:%m %p')}**\n"
+            )
+            if infraction.pardon.reason:
+                msg += f"**Reason: {infraction.pardon.reason}**\n"
+        return msg
+
+
+class InfractionPages(discord.ui.View):
+    """
+    Shows infractions one page at a time with buttons to flip through them. Only the page being
+    viewed is fetched, using the ID of the last infraction on the previous page as the key.
+    """
+
+    PAGE_SIZE = 8
+    REASON_LENGTH = 300
+
+    def __init__(
+        self,
+        ctx: Fuzzy.Context,
+        title: str,
+        fetch: Callable[[int, int], List[Infraction]],
+    ):
+        super().__init__(timeout=180)
+        self.ctx = ctx
+        self.title = title
+        self.fetch = fetch
+        self.page_starts = [0]
+        self.infractions: List[Infraction] = []
+        # noinspection PyTypeChecker
+        self.message: discord.Message = None
+
+    async def start(self) -> bool:
+        """Send the first page. Returns False if there is nothing to show."""
+        self.load()
+        if not self.infractions:
+            return False
+        self.message = await self.ctx.send(
+            embed=self.embed(), view=self if not self.next.disabled else None
+        )
+        return True
+
+    def load(self):
+        """Fetch the current page, plus one row to find out if there is a next page."""
+        infractions = self.fetch(self.page_starts[-1], self.PAGE_SIZE + 1)
+        self.infractions = infractions[: self.PAGE_SIZE]
+        self.previous.disabled = len(self.page_starts) == 1
+        self.next.disabled = len(infractions) <= self.PAGE_SIZE
+
+    def embed(self) -> discord.Embed:
+        """Render the current page."""
+        return discord.Embed(
+            title=self.title,
+            description="".join(
+                Logs.infraction_text(infraction) for infraction in self.infractions
+            ),
+            color=self.ctx.Color.AUTOMATIC_BLUE,
+        ).set_footer(text=f"Page {len(self.page_starts)}")
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.ctx.author.id
+
+    async def on_timeout(self):
+        try:
+            await self.message.edit(view=None)
+        except discord.HTTPException:
+            pass
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, _button):
+        """Show the previous page."""
+        self.page_starts.pop()
+        self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, _button):
+        """Show the next page."""
+        self.page_starts.append(self.infractions[-1].id)
+        self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
 
 
 async def setup(bot):
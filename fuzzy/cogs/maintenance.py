@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from discord.ext import commands, tasks
+
+from fuzzy import Fuzzy
+from fuzzy.backups import Backups
+from fuzzy.errors import UnableToComply
+
+
+class Maintenance(Fuzzy.Cog):
+    """Background jobs that keep the database small."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        database = self.bot.config["database"]
+        archive_after = database.get("archive_after_days")
+        self.archive_after = (
+            timedelta(days=int(archive_after)) if archive_after else None
+        )
+        self.archive_batch_size = int(database.get("archive_batch_size", "500"))
+        self.incremental_vacuum = database.getboolean("incremental_vacuum", False)
+        # with several processes, only one of them runs these jobs
+        if self.archive_after and self.bot.runs_global_jobs:
+            self.archive_old_infractions.start()  # pylint: disable=no-member
+
+        self.backups = Backups(self.bot.config)
+        self.backup_lock = asyncio.Lock()
+        if self.backups.enabled and self.bot.runs_global_jobs:
+            # pylint: disable=no-member
+            self.scheduled_backup.change_interval(hours=self.backups.interval)
+            self.scheduled_backup.start()
+
+    def cog_unload(self):
+        self.archive_old_infractions.cancel()  # pylint: disable=no-member
+        self.scheduled_backup.cancel()  # pylint: disable=no-member
+
+    @tasks.loop(hours=1)
+    async def archive_old_infractions(self):
+        """Moves infractions past the archival horizon into the archive, a small batch at a time
+        so the write lock is never held for long."""
+        before = datetime.now(timezone.utc) - self.archive_after
+        archived = 0
+        while True:
+            moved = self.bot.db.archives.archive_batch(before, self.archive_batch_size)
+            archived += moved
+            if moved < self.archive_batch_size:
+                break
+            # give commands a chance to write in between batches
+            await asyncio.sleep(0.1)
+        orphans = self.bot.db.archives.delete_orphans()
+        self.bot.metrics.count("fuzzy_archived_infractions_total", archived)
+
+        if archived or orphans:
+            self.log.info(
+                "Archived %d infractions, deleted %d orphaned rows", archived, orphans
+            )
+            if self.incremental_vacuum and not self.bot.db.archives.reclaim_space(1000):
+                self.log.warning(
+                    "incremental_vacuum is enabled, but the database isn't in incremental "
+                    "auto_vacuum mode. Stop the bot and run `PRAGMA auto_vacuum = INCREMENTAL; "
+                    "VACUUM;` on it once to switch."
+                )
+
+    @archive_old_infractions.before_loop
+    async def before_archive(self):
+        await self.bot.wait_until_ready()
+
+    async def take_backup(self):
+        """Takes a snapshot in a thread, one at a time."""
+        async with self.backup_lock:
+            return await asyncio.to_thread(self.backups.snapshot)
+
+    @tasks.loop(hours=24)
+    async def scheduled_backup(self):
+        """Takes a snapshot of the database every `interval_hours`."""
+        try:
+            snapshot = await self.take_backup()
+        except (OSError, sqlite3.Error):
+            # keep the schedule going, the next snapshot may well succeed
+            self.log.exception("Scheduled backup failed")
+            return
+        self.bot.metrics.observe("fuzzy_backup_seconds", snapshot.seconds)
+
+    @commands.group()
+    @commands.is_owner()
+    async def backup(self, ctx: Fuzzy.Context):
+        """Takes backups of the database. Scheduled backups are configured in the `[backup]`
+        section of the config file."""
+
+    @commands.command(parent=backup)
+    @commands.is_owner()
+    async def now(self, ctx: Fuzzy.Context):
+        """Takes a compressed snapshot of the database right away, without stopping the bot."""
+        if not self.backups.supported:
+            raise UnableToComply(
+                "Back up a PostgreSQL database with `pg_dump` instead."
+            )
+        try:
+            snapshot = await self.take_backup()
+        except (OSError, sqlite3.Error) as ex:
+            raise UnableToComply(f"Could not take a backup: {ex}") from ex
+        await ctx.reply(
+            f"**File:** `{snapshot.path.name}`\n"
+            f"**Size:** {snapshot.size / 1024 / 1024:.1f} MiB ({snapshot.pages} pages)\n"
+            f"**Took:** {snapshot.seconds:.2f}s",
+            title="Backup complete",
+            color=ctx.Color.GOOD,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(Maintenance(bot))
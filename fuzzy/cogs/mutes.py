@@ -1,25 +1,64 @@
+import asyncio
 import typing
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 
 import discord
 from discord.ext import commands, tasks
 
 from fuzzy import Fuzzy
-from fuzzy.models import DBUser, Infraction, InfractionType, Mute
+from fuzzy.models import (
+    ActiveMute,
+    DBUser,
+    GuildSettings,
+    Infraction,
+    InfractionType,
+    Mute,
+    MuteBackend,
+)
 from ..customizations import ParseableTimedelta
 
+# the longest a member can be timed out for
+MAX_TIMEOUT = timedelta(days=28)
+
 
 class Mutes(Fuzzy.Cog):
+    # how many role changes the mute audit makes at once, and how long it waits in between
+    AUDIT_BATCH_SIZE = 5
+    AUDIT_BATCH_DELAY = 2
+
     def __init__(self, *args):
         self.execute_expired_mutes.start()  # pylint: disable=no-member
+        self.audit_mutes.start()  # pylint: disable=no-member
         super().__init__(*args)
+        # members each guild's audit found with the mute role but no active mute, so every one
+        # is only reported once
+        self.unexpected_roles: Dict[int, Set[int]] = {}
 
     @tasks.loop(seconds=0.5)
     async def execute_expired_mutes(self):
         """Finds expired mutes and unmutes the user"""
-        mutes: List[Mute] = self.bot.db.mutes.find_expired_mutes()
+        mutes: List[Mute] = self.bot.db.mutes.find_expired_mutes(
+            self.bot.shard_count or 1, self.bot.shard_ids
+        )
+        now = datetime.now(timezone.utc)
         for mute in mutes:
+            self.bot.metrics.observe(
+                "fuzzy_expiry_lag_seconds",
+                (now - mute.end_time).total_seconds(),
+                loop="mutes",
+            )
+            if mute.timeout:
+                # Discord ends timeouts by itself
+                self.bot.db.mutes.delete(mute.infraction.id)
+                guild = self.bot.get_guild(mute.infraction.guild.id)
+                if guild:
+                    await self.bot.post_log(
+                        guild,
+                        msg=f"{mute.user.name} mute expired.",
+                        color=self.bot.Context.Color.AUTOMATIC_BLUE,
+                    )
+                continue
             guild: discord.Guild = await self.bot.fetch_guild(mute.infraction.guild.id)
             # noinspection PyTypeChecker
             user: discord.Member = None
@@ -33,12 +72,9 @@ class Mutes(Fuzzy.Cog):
                 mute_role = guild.get_role(mute.infraction.guild.mute_role)
             if user and mute_role:
                 await user.remove_roles(mute_role)
-                try:
-                    await self.bot.direct_message(
-                        user, msg=f"Your mute on {guild.name} has expired."
-                    )
-                except discord.Forbidden or discord.HTTPException:
-                    pass
+                await self.bot.direct_messages.enqueue(
+                    user, msg=f"Your mute on {guild.name} has expired."
+                )
             self.bot.db.mutes.delete(mute.infraction.id)
             if user:
                 await self.bot.post_log(
@@ -47,6 +83,174 @@ class Mutes(Fuzzy.Cog):
                     color=self.bot.Context.Color.AUTOMATIC_BLUE,
                 )
 
+    @tasks.loop(minutes=15)
+    async def audit_mutes(self):
+        """Compares active mutes with the roles and timeouts members actually have, for example
+        after the bot was down or someone removed a mute by hand. Muted members who aren't muted
+        anymore get their mute back; members with the mute role but no active mute are only
+        reported, once. Members are read from the cache, so only the mutes themselves cost REST
+        calls."""
+        for guild in self.bot.guilds:
+            settings = self.bot.db.guilds.find_by_id(guild.id)
+            if not settings:
+                continue
+            mute_role = guild.get_role(settings.mute_role)
+
+            muted_ids = set()
+            missing_role = []
+            after_id = 0
+            while True:
+                mutes = self.bot.db.mutes.find_active_mutes_for_guild(
+                    guild.id, after_id
+                )
+                for mute in mutes:
+                    muted_ids.add(mute.user.id)
+                    member = guild.get_member(mute.user.id)
+                    if not member:
+                        continue
+                    if mute.timeout and not member.is_timed_out():
+                        missing_role.append((member, mute))
+                    elif (
+                        not mute.timeout and mute_role and mute_role not in member.roles
+                    ):
+                        missing_role.append((member, mute))
+                if len(mutes) < 100:
+                    break
+                after_id = mutes[-1].infraction_id
+                await asyncio.sleep(0)
+            unexpected_role = (
+                [member for member in mute_role.members if member.id not in muted_ids]
+                if mute_role
+                else []
+            )
+            reported = self.unexpected_roles.get(guild.id, set())
+            self.unexpected_roles[guild.id] = {member.id for member in unexpected_role}
+            unexpected_role = [
+                member for member in unexpected_role if member.id not in reported
+            ]
+
+            failed = []
+            for start in range(0, len(missing_role), self.AUDIT_BATCH_SIZE):
+                batch = missing_role[start : start + self.AUDIT_BATCH_SIZE]
+                results = await asyncio.gather(
+                    *(
+                        self._apply_mute(
+                            member, mute, mute_role, reason="Reapplying an active mute"
+                        )
+                        for member, mute in batch
+                    ),
+                    return_exceptions=True,
+                )
+                failed += [
+                    member
+                    for (member, _), result in zip(batch, results)
+                    if isinstance(result, discord.HTTPException)
+                ]
+                await asyncio.sleep(self.AUDIT_BATCH_DELAY)
+
+            if missing_role or unexpected_role:
+                self.log.info(
+                    "Mute audit of %s: reapplied %d mutes, %d members muted without an active mute",
+                    guild.id,
+                    len(missing_role) - len(failed),
+                    len(unexpected_role),
+                )
+                msg = ""
+                if missing_role:
+                    msg += (
+                        "**Reapplied the mute of:** "
+                        f"{' '.join(member.mention for member, _ in missing_role)}\n"
+                    )
+                if failed:
+                    msg += (
+                        "**Could not reapply it to:** "
+                        f"{' '.join(member.mention for member in failed)}\n"
+                    )
+                if unexpected_role:
+                    msg += (
+                        "**Have the mute role without an active mute:** "
+                        f"{' '.join(member.mention for member in unexpected_role)}\n"
+                    )
+                await self.bot.post_log(
+                    guild,
+                    title="Mute audit",
+                    msg=msg[:4096],
+                    color=self.bot.Context.Color.AUTOMATIC_BLUE,
+                )
+
+    @audit_mutes.before_loop
+    async def before_audit(self):
+        await self.bot.wait_until_ready()
+
+    def can_mute(self, guild: discord.Guild, time: timedelta) -> bool:
+        """Whether the guild has a way to mute someone for this long."""
+        settings = self.bot.db.guilds.find_by_id(guild.id)
+        return self._uses_timeout(settings, time) or bool(
+            guild.get_role(settings.mute_role)
+        )
+
+    @staticmethod
+    def _uses_timeout(settings: GuildSettings, time: timedelta) -> bool:
+        # timeouts can't be longer than 28 days, longer mutes fall back to the role
+        return settings.mute_backend == MuteBackend.TIMEOUT and time <= MAX_TIMEOUT
+
+    async def mute_member(
+        self,
+        guild: discord.Guild,
+        member: typing.Union[discord.Member, discord.User],
+        moderator: DBUser,
+        time: timedelta,
+        reason: str,
+    ) -> Infraction:
+        """Saves a mute infraction and mutes the member, replacing their active mute. Used by the
+        mute command and by automatic moderation, so it needs no command context. Check
+        `can_mute` first."""
+        active_mute = self.bot.db.mutes.find_active_mute(member.id, guild.id)
+        if active_mute:
+            self.bot.db.mutes.delete(active_mute.infraction.id)
+
+        settings = self.bot.db.guilds.find_by_id(guild.id)
+        infraction = self.bot.db.infractions.save(
+            Infraction(
+                None,
+                DBUser(member.id, f"{member.name}#{member.discriminator}"),
+                moderator,
+                settings,
+                reason,
+                datetime.now(timezone.utc),
+                InfractionType.MUTE,
+                None,
+                None,
+                None,
+            )
+        )
+        if infraction.id:
+            mute = Mute(
+                infraction,
+                datetime.now(timezone.utc) + time,
+                DBUser(member.id, f"{member.name}#{member.discriminator}"),
+                self._uses_timeout(settings, time),
+            )
+            self.bot.db.mutes.save(mute)
+            if isinstance(member, discord.Member):
+                await self._apply_mute(
+                    member, mute, guild.get_role(settings.mute_role), reason=reason
+                )
+        return infraction
+
+    @staticmethod
+    async def _apply_mute(
+        member: discord.Member,
+        mute: typing.Union[Mute, ActiveMute],
+        mute_role: Optional[discord.Role],
+        reason: Optional[str] = None,
+    ):
+        """Times the member out or gives them the mute role, depending on how the mute was made."""
+        if mute.timeout:
+            await member.timeout(mute.end_time, reason=reason)
+        elif mute_role:
+            await member.add_roles(mute_role, reason=reason)
+
     @commands.command()
     @commands.has_guild_permissions(manage_messages=True)
     async def mute(
@@ -72,55 +276,39 @@ class Mutes(Fuzzy.Cog):
                 raise commands.BadArgument("Time difference may not be zero.")
 
         muted_members = []
-        error_sending_dm = []
-        mute_role: discord.Role = ctx.guild.get_role(
-            ctx.db.guilds.find_by_id(ctx.guild.id).mute_role
-        )
-        if not mute_role:
+        muted = []
+        if not self.can_mute(ctx.guild, time):
             await ctx.reply(
                 "Could not find a mute role for this server.", color=ctx.Color.I_GUESS
             )
             return
+        moderator = DBUser(
+            ctx.author.id, f"{ctx.author.name}#{ctx.author.discriminator}"
+        )
         for member in who:  # type: discord.User
             if member.id != ctx.author.id:
-                active_mute = ctx.db.mutes.find_active_mute(member.id, ctx.guild.id)
-                if active_mute:
-                    ctx.db.mutes.delete(active_mute.infraction.id)
-
-                infraction = Infraction.create(ctx, member, reason, InfractionType.MUTE)
-                infraction = ctx.db.infractions.save(infraction)
+                infraction = await self.mute_member(
+                    ctx.guild, member, moderator, time, reason
+                )
 
                 if infraction.id:
-                    end_time = datetime.now(timezone.utc) + time
-                    mute = Mute(
-                        infraction,
-                        end_time,
-                        DBUser(member.id, f"{member.name}#{member.discriminator}"),
-                    )
-                    ctx.db.mutes.save(mute)
-
-                    if isinstance(member, discord.Member):
-                        await member.add_roles(mute_role)
+                    muted.append(member)
                     muted_members.append(
                         f"{member.mention}: Mute **ID {infraction.id}**"
                     )
-                    try:
-                        await self.bot.direct_message(
-                            member,
-                            title=f"Mute ID {infraction.id}",
-                            msg=f"You have been muted on {ctx.guild.name} "
-                            + (f'for "{reason}"' if reason else "")
-                            + f"for {time}",
-                        )
-                    except discord.Forbidden or discord.HTTPException:
-                        error_sending_dm.append(member)
+                    await self.bot.direct_messages.enqueue(
+                        member,
+                        # bound now, the loop moves on before the message is sent
+                        lambda member=member: ctx.reply(
+                            f"Could not send direct message to {member.mention}"
+                        ),
+                        title=f"Mute ID {infraction.id}",
+                        msg=f"You have been muted on {ctx.guild.name} "
+                        + (f'for "{reason}"' if reason else "")
+                        + f"for {time}",
+                    )
             else:
                 await ctx.reply("You cant mute yourself.")
-        if error_sending_dm:
-            await ctx.reply(
-                f"Could not send direct message to the following users: "
-                f"{' '.join(member.mention for member in error_sending_dm)}"
-            )
         if muted_members:
             mute_string = "\n".join(muted_members)
             await ctx.reply(
@@ -137,6 +325,9 @@ class Mutes(Fuzzy.Cog):
                 + f"**Length:** {time}\n{mute_string}",
                 color=ctx.Color.BAD,
             )
+        if escalations := self.bot.get_cog("Escalations"):
+            for member in muted:
+                await escalations.escalate(ctx.guild, member, InfractionType.MUTE)
 
     @commands.command()
     @commands.has_guild_permissions(manage_messages=True)
@@ -156,22 +347,23 @@ class Mutes(Fuzzy.Cog):
                 ctx.db.mutes.delete(active_mute.infraction.id)
             else:
                 all_errors.append(member.mention)
-            mute_role: discord.Role = ctx.guild.get_role(
-                ctx.db.guilds.find_by_id(ctx.guild.id).mute_role
-            )
+            settings = ctx.db.guilds.find_by_id(ctx.guild.id)
+            mute_role: discord.Role = ctx.guild.get_role(settings.mute_role)
 
-            if mute_role is None:
+            if mute_role is None and settings.mute_backend == MuteBackend.ROLE:
                 await ctx.reply("Error fetching mute role:")
                 return
             if isinstance(member, discord.Member):
-                if mute_role in member.roles:
+                timed_out = member.is_timed_out()
+                if timed_out:
+                    await member.timeout(None)
+                has_role = mute_role in member.roles
+                if has_role:
                     await member.remove_roles(mute_role)
-                    try:
-                        await self.bot.direct_message(
-                            member, msg=f"Your mute on {ctx.guild.name} was removed."
-                        )
-                    except discord.Forbidden or discord.HTTPException:
-                        pass
+                if timed_out or has_role:
+                    await self.bot.direct_messages.enqueue(
+                        member, msg=f"Your mute on {ctx.guild.name} was removed."
+                    )
             unmuted_members.append(member.mention)
 
         msg = ""
@@ -195,8 +387,7 @@ class Mutes(Fuzzy.Cog):
             mute_role: discord.Role = member.guild.get_role(
                 self.bot.db.guilds.find_by_id(member.guild.id).mute_role
             )
-            if mute_role:
-                await member.add_roles(mute_role)
+            await self._apply_mute(member, active_mute, mute_role)
 
 
 async def setup(bot):
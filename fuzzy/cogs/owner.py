@@ -0,0 +1,117 @@
+import asyncio
+import io
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord.ext import commands
+
+from fuzzy import Fuzzy
+from fuzzy.errors import UnableToComply
+
+
+class Owner(Fuzzy.Cog):
+    @commands.command()
+    @commands.is_owner()
+    async def stats(self, ctx: Fuzzy.Context):
+        """Displays where Fuzzy spends its time: command latencies, database queries,
+        expiry loop lag and REST calls since startup. When Fuzzy runs as a cluster, these are of
+        the worker that received the command, followed by a summary of every worker."""
+        metrics = self.bot.metrics
+        uptime = timedelta(seconds=int(time.time() - metrics.started_at))
+
+        msg = f"**Uptime:** {uptime}\n\n**Commands** (count, mean, p95)\n"
+        for labels, histogram in metrics.top("fuzzy_command_seconds"):
+            msg += (
+                f"`{labels['command']}` {histogram.count}, "
+                f"{histogram.mean() * 1000:.1f}ms, "
+                f"≤{histogram.quantile(0.95) * 1000:.0f}ms\n"
+            )
+
+        msg += "\n**Database** (calls, total, mean)\n"
+        for labels, histogram in metrics.top("fuzzy_db_query_seconds"):
+            msg += (
+                f"`{labels['repository']}.{labels['method']}` {histogram.count}, "
+                f"{histogram.total * 1000:.0f}ms, {histogram.mean() * 1000:.2f}ms\n"
+            )
+
+        msg += "\n**Expiry lag** (count, mean, p95)\n"
+        for labels, histogram in metrics.top("fuzzy_expiry_lag_seconds"):
+            msg += (
+                f"`{labels['loop']}` {histogram.count}, "
+                f"{histogram.mean():.2f}s, ≤{histogram.quantile(0.95):.2f}s\n"
+            )
+
+        rest = sorted(
+            metrics.counters["fuzzy_rest_requests_total"].items(),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        msg += f"\n**REST calls** ({sum(count for _, count in rest)} total)\n"
+        for labels, count in rest[:10]:
+            labels = dict(labels)
+            msg += f"`{labels['method']} {labels['route']}` {count}\n"
+
+        if self.bot.cluster:
+            msg += "\n**Cluster** (guilds, commands, errors, uptime)\n"
+            try:
+                statuses = await self.bot.cluster_status()
+            except (ConnectionError, asyncio.TimeoutError):
+                statuses = [await self.bot.worker_status()]
+                msg += "Could not reach the other workers of the cluster.\n"
+            for status in statuses:
+                shards = [shard_id for shard_id, _ in status["latencies"]]
+                shards = (
+                    f"shards {min(shards)}-{max(shards)}" if shards else "connecting"
+                )
+                msg += (
+                    f"`worker {status['worker']}` {shards}, "
+                    f"{status['guilds']}, {status['commands']}, {status['errors']}, "
+                    f"{timedelta(seconds=int(status['uptime']))}\n"
+                )
+
+        await ctx.reply(msg[:4096], title="Statistics", color=ctx.Color.AUTOMATIC_BLUE)
+
+    @commands.group()
+    @commands.is_owner()
+    async def profiles(self, ctx: Fuzzy.Context):
+        """Lists and fetches the profiles of slow commands. Profiling is configured in the `[log]`
+        section of the config file."""
+
+    @commands.command(parent=profiles, name="list")
+    @commands.is_owner()
+    async def list_(self, ctx: Fuzzy.Context):
+        """Lists the most recent profiles of slow commands."""
+        profiler = self.bot.profiler
+        if not profiler.enabled:
+            raise UnableToComply("Profiling is not enabled.")
+        saved = profiler.profiles()[:20]
+        if not saved:
+            await ctx.reply("No slow commands have been profiled yet.")
+            return
+        msg = ""
+        for path in saved:
+            saved_on = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+            msg += f"`{path.stem}` {discord.utils.format_dt(saved_on, 'R')}\n"
+        await ctx.reply(msg, title="Profiles", color=ctx.Color.AUTOMATIC_BLUE)
+
+    @commands.command(parent=profiles)
+    @commands.is_owner()
+    async def fetch(self, ctx: Fuzzy.Context, profile_id: str):
+        """Uploads a profile together with a text summary of its most expensive calls.
+        `profile_id` is the log ID shown by `${pfx}profiles list`."""
+        path = self.bot.profiler.find(profile_id)
+        if not path:
+            raise UnableToComply("Could not find a profile with that ID.")
+        summary = self.bot.profiler.summary(path)
+        await ctx.send(
+            f"Profile `{path.stem}`",
+            files=[
+                discord.File(path),
+                discord.File(io.BytesIO(summary.encode()), f"{path.stem}.txt"),
+            ],
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(Owner(bot))
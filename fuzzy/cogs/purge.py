@@ -1,24 +1,220 @@
+import re
+import time
+from datetime import timedelta
+from typing import List, Optional
+
+import discord
 from discord.ext import commands
 
 from fuzzy import Fuzzy
 
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python 3.10
+    import sre_parse
+
+# Discord only bulk deletes messages younger than 14 days, keep a margin for slow scans
+BULK_DELETE_AGE = timedelta(days=14) - timedelta(minutes=5)
+# the most messages a filtered purge looks at before giving up
+SCAN_LIMIT = 10000
+# how often the progress message is updated, in seconds
+PROGRESS_INTERVAL = 3
+
+LINK = re.compile(r"https?://\S+")
+
+# regular expressions are matched on the event loop, so the ones that could backtrack for long
+# are refused: they are kept short, with few unbounded repeats, and repeated parts can't contain
+# repeats or alternatives
+MAX_REGEX_LENGTH = 100
+MAX_REGEX_REPEATS = 3
+REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+
+
+def _walk(parsed):
+    """Yields every (op, argument) pair in a parsed regular expression, outermost first."""
+    for op, av in parsed:
+        yield op, av
+        for arg in av if isinstance(av, (list, tuple)) else [av]:
+            if isinstance(arg, sre_parse.SubPattern):
+                yield from _walk(arg)
+            elif isinstance(arg, list):
+                for branch in arg:
+                    if isinstance(branch, sre_parse.SubPattern):
+                        yield from _walk(branch)
+
+
+def compile_regex(pattern: str) -> re.Pattern:
+    """Compiles a moderator's regular expression, refusing ones that could take too long to
+    match."""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise commands.BadArgument(
+            f"Regular expressions can be at most {MAX_REGEX_LENGTH} characters long."
+        )
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as ex:
+        raise commands.BadArgument(f"That regular expression is invalid: {ex}")
+    repeats = 0
+    for op, av in _walk(parsed):
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            raise commands.BadArgument("Regular expressions can't use backreferences.")
+        if op in REPEATS:
+            if av[1] == sre_parse.MAXREPEAT:
+                repeats += 1
+            if any(
+                inner in REPEATS or inner == sre_parse.BRANCH
+                for inner, _ in _walk(av[2])
+            ):
+                raise commands.BadArgument(
+                    "Repeated parts of a regular expression can't contain repeats or `|`."
+                )
+    if repeats > MAX_REGEX_REPEATS:
+        raise commands.BadArgument(
+            f"Regular expressions can have at most {MAX_REGEX_REPEATS} unbounded repeats."
+        )
+    return re.compile(pattern)
+
+
+class PurgeFlags(commands.FlagConverter):
+    """The filters accepted by the purge command."""
+
+    users: List[discord.User] = commands.flag(name="user", default=lambda ctx: [])
+    bots: bool = False
+    contains: Optional[str] = None
+    regex: Optional[str] = None
+    attachments: bool = False
+    links: bool = False
+    before: Optional[int] = None
+    after: Optional[int] = None
+
 
 class Purges(Fuzzy.Cog):
     @commands.command()
     @commands.has_permissions(manage_messages=True)
-    async def purge(self, ctx: Fuzzy.Context, amount: int):
-        """Deletes the most recent messages in a channel.
-        `amount` is the number of messages to delete."""
-        amount += 1
-        deleted = await ctx.channel.purge(
-            limit=amount,
-            bulk=True,
+    @commands.max_concurrency(1, per=commands.BucketType.channel)
+    async def purge(
+        self, ctx: Fuzzy.Context, amount: Optional[int] = None, *, flags: PurgeFlags
+    ):
+        """Deletes the most recent messages in a channel, optionally only the ones matching every
+        filter given, i.e. `${pfx}purge 50 user: @someone links: yes`.
+        `amount` is the number of messages to delete. It can be left out if `after:` is given, to
+        delete everything after that message.
+        `user:` only messages by this user. Can be given more than once.
+        `bots:` yes to only delete messages by bots.
+        `contains:` only messages containing this text, ignoring case.
+        `regex:` only messages matching this regular expression. Ones that could take long to
+        match, like `(a+)+`, are refused.
+        `attachments:` yes to only delete messages with attachments.
+        `links:` yes to only delete messages with links.
+        `before:` and `after:` message IDs; only messages between them are deleted."""
+        if amount is None and flags.after is None:
+            raise commands.BadArgument(
+                "Give a number of messages or an `after:` message ID."
+            )
+        if amount is not None and amount < 1:
+            raise commands.BadArgument("The number of messages must be positive.")
+        pattern = compile_regex(flags.regex) if flags.regex else None
+
+        await ctx.message.delete()
+
+        user_ids = {user.id for user in flags.users}
+
+        def matches(message: discord.Message) -> bool:
+            return (
+                (not user_ids or message.author.id in user_ids)
+                and (not flags.bots or message.author.bot)
+                and (
+                    not flags.contains
+                    or flags.contains.casefold() in message.content.casefold()
+                )
+                and (not pattern or pattern.search(message.content))
+                and (not flags.attachments or message.attachments)
+                and (not flags.links or LINK.search(message.content))
+            )
+
+        filtered = any(
+            (
+                user_ids,
+                flags.bots,
+                flags.contains,
+                pattern,
+                flags.attachments,
+                flags.links,
+            )
         )
+        progress: Optional[discord.Message] = None
+        last_progress = time.monotonic()
+        deleted = 0
+        scanned = 0
+        batch: List[discord.Message] = []
+        bulk_before = discord.utils.utcnow() - BULK_DELETE_AGE
+
+        # the snowflake bounds let Discord return only the messages in between, newest first
+        async for message in ctx.channel.history(
+            limit=None,
+            before=discord.Object(flags.before) if flags.before else ctx.message,
+            after=discord.Object(flags.after) if flags.after else None,
+            oldest_first=False,
+        ):
+            scanned += 1
+            if filtered and scanned > SCAN_LIMIT:
+                break
+            if not matches(message):
+                continue
+            if message.created_at < bulk_before:
+                deleted += await self._delete_batch(ctx.channel, batch)
+                batch = []
+                deleted += await self._delete_old(message)
+            else:
+                batch.append(message)
+                if len(batch) == 100:
+                    deleted += await self._delete_batch(ctx.channel, batch)
+                    batch = []
+            if amount is not None and deleted + len(batch) >= amount:
+                break
+
+            if time.monotonic() - last_progress > PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                status = f"Purging {ctx.channel.mention}: {deleted + len(batch)} messages so far."
+                if progress:
+                    await progress.edit(
+                        embed=discord.Embed(
+                            color=ctx.Color.AUTOMATIC_BLUE, description=status
+                        )
+                    )
+                else:
+                    progress = await ctx.reply(status, color=ctx.Color.AUTOMATIC_BLUE)
+        deleted += await self._delete_batch(ctx.channel, batch)
+
+        if progress:
+            await progress.delete()
         await ctx.reply(
-            f"Purged {len(deleted) - 1} messages from {ctx.channel.mention}.",
+            f"Purged {deleted} messages from {ctx.channel.mention}.",
             delete_after=5,
         )
 
+    async def _delete_batch(
+        self, channel: discord.TextChannel, messages: List[discord.Message]
+    ) -> int:
+        """Deletes up to 100 messages younger than 14 days in a single request."""
+        if not messages:
+            return 0
+        try:
+            await channel.delete_messages(messages)
+        except discord.NotFound:
+            # a message was deleted in the meantime, which fails the whole batch
+            return sum([await self._delete_old(message) for message in messages])
+        return len(messages)
+
+    @staticmethod
+    async def _delete_old(message: discord.Message) -> int:
+        """Messages older than 14 days can only be deleted one at a time."""
+        try:
+            await message.delete()
+        except discord.NotFound:
+            return 0
+        return 1
+
 
 async def setup(bot):
     await bot.add_cog(Purges(bot))
@@ -0,0 +1,142 @@
+import asyncio
+import csv
+import io
+import tempfile
+import time
+
+import discord
+from discord.ext import commands
+
+from fuzzy import Fuzzy
+from fuzzy.errors import UnableToComply
+from fuzzy.transfer import (
+    EXPORT_FORMATS,
+    ImportReport,
+    export_infractions,
+    guess_import_format,
+    import_infractions,
+)
+
+
+class Transfer(Fuzzy.Cog):
+    def __init__(self, *args):
+        super().__init__(*args)
+        # imports run one at a time, so they don't compete for the database
+        self.importing = asyncio.Lock()
+
+    @commands.command()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def export(self, ctx: Fuzzy.Context, export_format: str = "jsonl"):
+        """Exports every infraction on this server, including pardons and published messages,
+        as a gzip-compressed file.
+        `export_format` is either jsonl (the default) or csv."""
+        export_format = export_format.lower()
+        if export_format not in EXPORT_FORMATS:
+            raise commands.BadArgument(
+                f"`export_format` must be one of {', '.join(EXPORT_FORMATS)}."
+            )
+
+        start = time.perf_counter()
+        rows = 0
+        with tempfile.TemporaryFile() as out:
+            for rows in export_infractions(ctx.db, ctx.guild.id, out, export_format):
+                # let other commands run between chunks
+                await asyncio.sleep(0)
+
+            size = out.tell()
+            if size > ctx.guild.filesize_limit:
+                raise UnableToComply(
+                    f"The export is {size / 1024 / 1024:.1f} MiB, which is too large to upload here. "
+                    f"The bot owner can export it with `python -m fuzzy export {ctx.guild.id}`."
+                )
+            out.seek(0)
+            await ctx.send(
+                f"Exported {rows} infractions in {time.perf_counter() - start:.1f}s.",
+                file=discord.File(
+                    out, f"infractions-{ctx.guild.id}.{export_format}.gz"
+                ),
+            )
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} exported {rows} infractions",
+            color=ctx.Color.AUTOMATIC_BLUE,
+        )
+
+    @commands.command(name="import")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def import_(self, ctx: Fuzzy.Context):
+        """Imports infractions, for example from another moderation bot. Attach the dump to the
+        command message as a .jsonl, .json or .csv file, optionally gzip-compressed.
+        The columns are the same as those of `${pfx}export`; only `user_id`, `infraction_type` (warn,
+        mute or ban) and `infraction_on` (ISO 8601 or a unix timestamp) are required.
+        Importing the same file again resumes an interrupted import and skips rows already imported."""
+        if not ctx.message.attachments:
+            raise commands.BadArgument("Please attach the file to import.")
+        attachment = ctx.message.attachments[0]
+        try:
+            import_format = guess_import_format(attachment.filename)
+        except ValueError as ex:
+            raise UnableToComply(
+                "The file has to end in .jsonl, .json or .csv, optionally followed by .gz."
+            ) from ex
+
+        source = io.BytesIO(await attachment.read())
+        if self.importing.locked():
+            progress = await ctx.reply(
+                "Waiting for another import to finish…", color=ctx.Color.I_GUESS
+            )
+        else:
+            progress = await ctx.reply("Starting import…", color=ctx.Color.I_GUESS)
+        async with self.importing:
+            last_update = time.perf_counter()
+            report = ImportReport()
+            try:
+                for report in import_infractions(
+                    ctx.db,
+                    ctx.db.guilds.find_by_id(ctx.guild.id),
+                    source,
+                    import_format,
+                ):
+                    if time.perf_counter() - last_update > 5:
+                        last_update = time.perf_counter()
+                        await progress.edit(
+                            embed=self.import_embed(report, "Importing…")
+                        )
+                    # let other commands run between batches
+                    await asyncio.sleep(0)
+            except (csv.Error, ValueError) as ex:
+                await progress.edit(
+                    embed=self.import_embed(report, "Import failed", ctx.Color.BAD)
+                )
+                raise UnableToComply(f"Could not read the file: {ex}") from ex
+
+        await progress.edit(
+            embed=self.import_embed(report, "Import complete", ctx.Color.GOOD)
+        )
+        await self.bot.post_log(
+            ctx.guild,
+            msg=f"{ctx.author.name}#{ctx.author.discriminator} imported {report.imported} "
+            f"infractions from {attachment.filename}",
+            color=ctx.Color.AUTOMATIC_BLUE,
+        )
+
+    @staticmethod
+    def import_embed(
+        report: ImportReport,
+        title: str,
+        color: Fuzzy.Context.Color = Fuzzy.Context.Color.I_GUESS,
+    ) -> discord.Embed:
+        """Describes the progress of an import."""
+        msg = (
+            f"**Imported:** {report.imported} ({report.rows_per_second:.0f} rows/s)\n"
+            f"**Skipped:** {report.skipped}\n"
+        )
+        if report.resumed_from:
+            msg += f"**Resumed after row:** {report.resumed_from}\n"
+        if report.errors:
+            msg += "\n" + "\n".join(report.errors)
+        return discord.Embed(title=title, description=msg[:4096], color=color)
+
+
+async def setup(bot):
+    await bot.add_cog(Transfer(bot))
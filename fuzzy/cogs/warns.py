@@ -27,15 +27,15 @@ class Warns(Fuzzy.Cog):
             infraction = Infraction.create(ctx, who, reason, InfractionType.WARN)
             infraction = ctx.db.infractions.save(infraction)
             if infraction:
-                try:
-                    await self.bot.direct_message(
-                        who,
-                        title=f"Warning ID {infraction.id}",
-                        msg=f"You have been warned on {ctx.guild.name} "
-                        + (f'for "{reason}"' if reason else ""),
-                    )
-                except discord.Forbidden or discord.HTTPException:
-                    await ctx.reply(f"Could not send direct message to {who.mention}")
+                await self.bot.direct_messages.enqueue(
+                    who,
+                    lambda: ctx.reply(
+                        f"Could not send direct message to {who.mention}"
+                    ),
+                    title=f"Warning ID {infraction.id}",
+                    msg=f"You have been warned on {ctx.guild.name} "
+                    + (f'for "{reason}"' if reason else ""),
+                )
         else:
             await ctx.reply("You cant warn yourself.")
             return
@@ -54,6 +54,8 @@ class Warns(Fuzzy.Cog):
             + f"{warn_string} ",
             color=ctx.Color.I_GUESS,
         )
+        if escalations := self.bot.get_cog("Escalations"):
+            await escalations.escalate(ctx.guild, who, InfractionType.WARN)
 
 
 async def setup(bot):
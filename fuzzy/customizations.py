@@ -1,7 +1,9 @@
+import base64
 import enum
 import logging
 import random
 import re
+import time
 import typing
 from copy import copy
 from datetime import datetime, timedelta, timezone
@@ -12,10 +14,15 @@ import discord
 from discord import Activity, ActivityType
 from discord.ext import commands
 
+from fuzzy.cluster import ClusterClient
 from fuzzy.databases import Database
+from fuzzy.direct_messages import DirectMessages
+from fuzzy.log_webhooks import UNKNOWN_MESSAGE, LogWebhooks, batches, is_gone
+from fuzzy.metrics import Metrics, MetricsServer
+from fuzzy.profiling import Profiler
 
 
-class Fuzzy(commands.Bot):
+class Fuzzy(commands.AutoShardedBot):
     """
     This Class is mostly just a standard discord.py bot class but sets up additional configuration needed for this bot.
     """
@@ -33,14 +40,30 @@ class Fuzzy(commands.Bot):
             BAD = 0xD52D48
             AUTOMATIC_BLUE = 0x1C669B
 
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.started_at = time.perf_counter()
+
         @property
         def log(self) -> logging.Logger:
-            """Return a logger that's associated with the current cog and command."""
-            name = self.command.name.replace(self.bot.config["discord"]["prefix"], "")
-            if not self.cog:
-                return self.bot.log.getChild(name)
+            """Return the logger that was attached to the current command when it was loaded."""
+            if not self.command:
+                return self.bot.log
+            if "log" not in self.command.extras:
+                self.bot.attach_logger(self.command, self.cog.log if self.cog else None)
+            return self.command.extras["log"]
 
-            return self.cog.log.getChild(name)
+        @property
+        def error_id(self) -> str:
+            """Return the ID used to refer to this invocation in logs, error reports and profiles."""
+            error_int = int(self.author.id) + int(self.message.id)
+            error_bytes = error_int.to_bytes(
+                (error_int.bit_length() + 7) // 8, byteorder="little"
+            )
+            return str(
+                base64.urlsafe_b64encode(error_bytes),
+                encoding="utf-8",
+            ).replace("=", "")
 
         @property
         def db(self) -> Database:
@@ -77,35 +100,44 @@ class Fuzzy(commands.Bot):
         ):
             """Helper for sending embedded replies"""
             if not embed:
-                if not subtitle:
-                    subtitle = None
-
-                lines = str(msg).split("\n")
-                buf = ""
-                for line in lines:
-                    if len(buf + "\n" + line) > 2048:
-                        await self.send(
-                            "",
-                            embed=discord.Embed(
-                                color=color, description=buf, title=title
-                            ).set_footer(text=subtitle),
-                            delete_after=delete_after,
-                        )
-                        buf = ""
-                    else:
-                        buf += line + "\n"
-
-                if len(buf) > 0:
-                    return await self.send(
-                        "",
-                        embed=discord.Embed(
-                            color=color, description=buf, title=title
-                        ).set_footer(text=subtitle),
-                        delete_after=delete_after,
+                message = None
+                for embed in Fuzzy.Context.embeds(msg, title, subtitle, color):
+                    message = await self.send(
+                        "", embed=embed, delete_after=delete_after
                     )
+                return message
 
             return await self.send("", embed=embed, delete_after=delete_after)
 
+        @staticmethod
+        def embeds(
+            msg: str = None,
+            title: str = None,
+            subtitle: str = None,
+            color: Color = Color.GOOD,
+        ) -> typing.List[discord.Embed]:
+            """Splits a message into embeds that fit Discord's description limit, as `reply`
+            sends them."""
+            embeds = []
+            buf = ""
+            for line in str(msg).split("\n"):
+                if buf and len(buf + line) > 2048:
+                    embeds.append(
+                        discord.Embed(
+                            color=color, description=buf, title=title
+                        ).set_footer(text=subtitle or None)
+                    )
+                    buf = ""
+                buf += line + "\n"
+
+            if len(buf) > 0:
+                embeds.append(
+                    discord.Embed(color=color, description=buf, title=title).set_footer(
+                        text=subtitle or None
+                    )
+                )
+            return embeds
+
         def privileged_modify(
             self,
             subject: Union[
@@ -140,37 +172,148 @@ class Fuzzy(commands.Bot):
         def __init__(self, bot):
             self.bot: Fuzzy = bot
             self.log = bot.log.getChild(self.__class__.__name__)
+            for command in self.walk_commands():
+                bot.attach_logger(command, self.log)
 
     def __init__(self, config, database: Database, **kwargs):
         self.config = config
         self.log = logging.getLogger("Fuzzy")
         self.log.setLevel(logging.INFO)
         self.db: Database = database
+        self.metrics = Metrics()
+        self.db.instrument(self.metrics)
+        self.metrics_server = None
+        self.profiler = Profiler(config)
+        self.direct_messages = DirectMessages(config, self.direct_message, self.metrics)
+        self.log_webhooks = LogWebhooks(config, self.metrics)
         self.initial_extensions = [
             "fuzzy.cogs.admin",
+            "fuzzy.cogs.antiraid",
+            "fuzzy.cogs.antispam",
             "fuzzy.cogs.bans",
+            "fuzzy.cogs.escalations",
+            "fuzzy.cogs.filters",
             "fuzzy.cogs.infraction_admin",
             "fuzzy.cogs.locks",
             "fuzzy.cogs.logs",
+            "fuzzy.cogs.maintenance",
             "fuzzy.cogs.mutes",
+            "fuzzy.cogs.owner",
             "fuzzy.cogs.purge",
+            "fuzzy.cogs.transfer",
             "fuzzy.cogs.warns",
         ]
         self.session = None
+        self.cluster = ClusterClient.from_environment()
+        shard_count = config["discord"].get("shard_count")
+        kwargs.setdefault("shard_count", int(shard_count) if shard_count else None)
+        kwargs.setdefault(
+            "shard_ids", self.parse_shard_ids(config["discord"].get("shard_ids", ""))
+        )
         super().__init__(command_prefix=config["discord"]["prefix"], **kwargs)
 
     async def setup_hook(self):
         self.session = aiohttp.ClientSession()
+        self._count_rest_calls()
+        self.direct_messages.start()
+        self.log_webhooks.start(self.session)
+        port = self.config.get("metrics", "port", fallback=None)
+        if port:
+            # each worker of a cluster serves its metrics on its own port
+            self.metrics_server = MetricsServer(
+                self.metrics,
+                self.config.get("metrics", "host", fallback="127.0.0.1"),
+                int(port) + (self.cluster.worker if self.cluster else 0),
+            )
+            await self.metrics_server.start()
+        if self.cluster:
+            self.cluster.handlers["status"] = self.worker_status
+            await self.cluster.connect()
         for ext in self.initial_extensions:
             await self.load_extension(ext)
 
     async def close(self):
+        # pending logs may fall back to the channel, which needs the bot's connection
+        await self.log_webhooks.close()
         await super().close()
+        await self.direct_messages.close()
         await self.session.close()
+        if self.cluster:
+            await self.cluster.close()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+
+    def _count_rest_calls(self):
+        """Wrap the HTTP client so every REST call is counted by route."""
+        request = self.http.request
+
+        async def counted_request(route, **kwargs):
+            self.metrics.count(
+                "fuzzy_rest_requests_total", method=route.method, route=route.path
+            )
+            return await request(route, **kwargs)
+
+        self.http.request = counted_request
 
     async def get_context(self, message, *, cls=Context):
         return await super().get_context(message, cls=cls)
 
+    def add_command(self, command: commands.Command, /):
+        super().add_command(command)
+        if "log" not in command.extras:
+            self.attach_logger(command)
+            if isinstance(command, commands.Group):
+                for subcommand in command.walk_commands():
+                    self.attach_logger(subcommand)
+
+    def attach_logger(
+        self, command: commands.Command, parent: logging.Logger = None
+    ) -> logging.Logger:
+        """Resolve the logger for a command once and store it on the command."""
+        name = command.name.replace(self.config["discord"]["prefix"], "")
+        log = (parent or self.log).getChild(name)
+        command.extras["log"] = log
+        return log
+
+    @staticmethod
+    def parse_shard_ids(text: str) -> typing.Optional[typing.List[int]]:
+        """Parse a list of shard IDs and ranges like `0-3,6`. Empty means all shards."""
+        shard_ids = []
+        for part in filter(None, (part.strip() for part in text.split(","))):
+            first, _, last = part.partition("-")
+            shard_ids.extend(range(int(first), int(last or first) + 1))
+        return shard_ids or None
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether this process runs the shard a guild is on, and so is responsible for it."""
+        if self.shard_ids is None:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
+
+    @property
+    def runs_global_jobs(self) -> bool:
+        """Whether this process runs the jobs that aren't tied to a guild, such as backups.
+        Only one process does: the one running shard 0."""
+        return self.shard_ids is None or 0 in self.shard_ids
+
+    async def worker_status(self) -> typing.Dict:
+        """A summary of this process, which workers of a cluster ask each other for."""
+        return {
+            "worker": self.cluster.worker if self.cluster else 0,
+            "latencies": self.latencies,
+            "guilds": len(self.guilds),
+            "commands": sum(self.metrics.counters["fuzzy_commands_total"].values()),
+            "errors": sum(self.metrics.counters["fuzzy_command_errors_total"].values()),
+            "uptime": time.time() - self.metrics.started_at,
+        }
+
+    async def cluster_status(self) -> typing.List[typing.Dict]:
+        """The status of every worker of the cluster, or just this process if there is none."""
+        if not self.cluster:
+            return [await self.worker_status()]
+        statuses = await self.cluster.gather("status")
+        return sorted(statuses, key=lambda status: status["worker"])
+
     @staticmethod
     def random_status() -> Activity:
         """Return a silly status to show to the world"""
@@ -228,13 +371,115 @@ class Fuzzy(commands.Bot):
         return await to.send("", embed=embed, delete_after=delete_after)
 
     async def post_log(self, guild: discord.Guild, *args, **kwargs):
-        """Post a log entry to a guild, usage same as ctx.reply"""
+        """Post a log entry to a guild, usage same as ctx.reply. Guilds with a mod log webhook get
+        it through that, batched with the entries posted right after it."""
         configuration = self.db.guilds.find_by_id(guild.id)
         if not configuration:
             return
         channel = self.get_channel(configuration.mod_log)
-        if channel:
+        if not channel:
+            return
+        if not configuration.mod_log_webhook:
             await self.Context.reply(channel, *args, **kwargs)
+            self.metrics.count("fuzzy_log_messages_total", route="channel")
+            return
+
+        url = configuration.mod_log_webhook
+
+        async def fallback(embeds: typing.List[discord.Embed], gone: bool):
+            if gone:
+                self._forget_log_webhook(guild.id, "mod_log_webhook", url)
+            for batch in batches(embeds):
+                await channel.send(embeds=batch)
+                self.metrics.count("fuzzy_log_messages_total", route="channel")
+
+        await self.log_webhooks.post(
+            url, self.Context.embeds(*args, **kwargs), fallback
+        )
+
+    async def publish(
+        self, guild: discord.Guild, embed: discord.Embed
+    ) -> typing.Optional[discord.Message]:
+        """Posts an embed to a guild's public log, through its webhook if it has one, and returns
+        the message so it can be edited with `edit_published`."""
+        configuration = self.db.guilds.find_by_id(guild.id)
+        if not configuration or not configuration.public_log:
+            return None
+        url = configuration.public_log_webhook
+        if url:
+            try:
+                return await self.log_webhooks.send(url, embed)
+            except discord.HTTPException as ex:
+                self.log.warning("Could not publish through a webhook: %s", ex)
+                if is_gone(ex):
+                    self._forget_log_webhook(guild.id, "public_log_webhook", url)
+        channel = self.get_channel(configuration.public_log)
+        if not channel:
+            return None
+        message = await channel.send(embed=embed)
+        self.metrics.count("fuzzy_log_messages_total", route="channel")
+        return message
+
+    async def edit_published(
+        self, guild: discord.Guild, message_id: int, embed: discord.Embed
+    ) -> bool:
+        """Replaces the embed of a message posted with `publish`. Returns False if the message no
+        longer exists, or can't be edited anymore because the webhook that posted it was deleted."""
+        configuration = self.db.guilds.find_by_id(guild.id)
+        url = configuration.public_log_webhook
+        if url:
+            try:
+                await self.log_webhooks.edit(url, message_id, embed)
+                return True
+            except discord.HTTPException as ex:
+                if is_gone(ex):
+                    self.log.warning("Could not edit through a webhook: %s", ex)
+                    self._forget_log_webhook(guild.id, "public_log_webhook", url)
+                elif ex.status != 404 or ex.code != UNKNOWN_MESSAGE:
+                    raise
+                # else it was published by the bot itself, before the guild used this webhook
+        channel = self.get_channel(configuration.public_log)
+        if not channel:
+            return False
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.NotFound:
+            return False
+        if message.author.id != self.user.id:
+            return False
+        await message.edit(embed=embed)
+        return True
+
+    async def create_log_webhook(self, channel: discord.TextChannel) -> str:
+        """Creates a webhook that posts logs in a channel and returns its URL."""
+        webhook = await channel.create_webhook(
+            name=self.user.name,
+            avatar=await self.user.display_avatar.read(),
+            reason="Posting logs",
+        )
+        return webhook.url
+
+    def _forget_log_webhook(self, guild_id: int, attribute: str, url: str):
+        """Stops using a deleted webhook, unless the guild has set up another one in the meantime."""
+        self.log_webhooks.forget(url)
+        configuration = self.db.guilds.find_by_id(guild_id)
+        if configuration and getattr(configuration, attribute) == url:
+            setattr(configuration, attribute, None)
+            self.db.guilds.save(configuration)
+
+
+class FieldFormatter(logging.Formatter):
+    """
+    A formatter that appends structured key/value fields to the message. Pass them with
+    `log.info("...", extra={"fields": {"guild": 1234}})`; they are only rendered if the record is emitted.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
 
 
 class ParseableTimedelta(timedelta):
@@ -266,3 +511,18 @@ class ParseableTimedelta(timedelta):
             delta += cls(seconds=int(secsm[1]))
 
         return delta
+
+
+class ParseableDate(datetime):
+    """Just datetime but with support for the discordpy converter thing."""
+
+    @classmethod
+    async def convert(cls, _ctx: Fuzzy.Context, argument: str):
+        """Convert a date in the form YYYY-MM-DD into a UTC datetime at the start of that day."""
+        try:
+            date = datetime.strptime(argument, "%Y-%m-%d")
+        except ValueError as ex:
+            raise commands.BadArgument(
+                f"{argument} is not a date in the form YYYY-MM-DD."
+            ) from ex
+        return cls(date.year, date.month, date.day, tzinfo=timezone.utc)
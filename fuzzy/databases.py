@@ -1,4 +1,5 @@
 import logging
+import re
 import sqlite3
 from pathlib import Path
 
@@ -6,6 +7,58 @@ from fuzzy.interfaces import *
 from fuzzy.models import *
 
 
+FRACTION = re.compile(r"\.(\d+)")
+
+
+def convert_timestamp(value: bytes) -> datetime:
+    """
+    Read a timestamp column as a UTC datetime. Unlike sqlite3's default converter this also
+    accepts timestamps with an offset but without microseconds, which imports can produce.
+    """
+    text = value.decode()
+    # before Python 3.11, fromisoformat only takes fractions of 3 or 6 digits and no Z suffix
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    text = FRACTION.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), text)
+    timestamp = datetime.fromisoformat(text)
+    if not timestamp.tzinfo:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+# sqlite3 converters can't be registered per connection, so this replaces the default timestamp
+# converter for the whole process: any connection opened with PARSE_DECLTYPES now reads timestamp
+# columns as timezone-aware UTC datetimes instead of naive ones.
+sqlite3.register_converter("timestamp", convert_timestamp)
+
+
+def shard_condition(
+    column: str, shard_count: int, shard_ids: Optional[List[int]], modulo: str = "%"
+) -> str:
+    """
+    SQL that matches rows whose guild, in `column`, is on one of the given shards. Discord assigns
+    guilds to shards by `(guild_id >> 22) % shard_count`. Matches every row if shard_ids is None.
+    `modulo` is the operator as it has to be written in a query, i.e. escaped for psycopg.
+    """
+    if shard_ids is None:
+        return "1=1"
+    shards = ",".join(str(int(shard_id)) for shard_id in shard_ids)
+    return f"({column} >> 22) {modulo} {int(shard_count)} IN ({shards})"
+
+
+def open_database(config):
+    """Open the storage backend selected in the [database] section of the config."""
+    backend = config["database"].get("backend", "sqlite")
+    if backend == "postgres":
+        # psycopg is only installed for this backend
+        from fuzzy.postgres import PostgresDatabase
+
+        return PostgresDatabase(config)
+    if backend != "sqlite":
+        raise ValueError(f"unknown database backend {backend}")
+    return Database(config)
+
+
 class Database:
     def __init__(self, config):
         self.config = config
@@ -16,8 +69,17 @@ class Database:
             config["database"]["path"],
             isolation_level=None,
             detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            timeout=float(config["database"].get("busy_timeout", "5")),
         )
         self.conn.row_factory = sqlite3.Row
+        # in WAL mode, processes sharing the file can read while one of them writes
+        journal_mode = config["database"].get("journal_mode", "wal")
+        if (
+            self.conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()[0]
+            == "wal"
+        ):
+            # still durable in WAL mode, without syncing on every commit
+            self.conn.execute("PRAGMA synchronous=NORMAL")
         last_migration_number = 0
         try:
             last_migration_number = self.conn.execute(
@@ -46,6 +108,43 @@ class Database:
         self.locks = Locks(self.conn, self)
         self.published_messages = PublishedMessages(self.conn)
         self.thread_locks = ThreadLocks(self.conn, self)
+        self.imports = Imports(self.conn)
+        self.archives = Archives(self.conn)
+        self.raids = Raids(self.conn)
+        self.spam = Spam(self.conn)
+        self.filters = Filters(self.conn)
+        self.escalations = Escalations(self.conn)
+        self.temp_bans = TempBans(self.conn)
+        # indexes are left deferred if the bot stopped during an import
+        self.imports.restore_indexes()
+
+    def instrument(self, metrics):
+        """Record call counts and durations of every repository method."""
+        for name in (
+            "infractions",
+            "pardons",
+            "mutes",
+            "guilds",
+            "locks",
+            "published_messages",
+            "thread_locks",
+            "imports",
+            "archives",
+            "raids",
+            "spam",
+            "filters",
+            "escalations",
+            "temp_bans",
+        ):
+            metrics.instrument(getattr(self, name), name)
+
+
+# infractions.oid isn't AUTOINCREMENT, so SQLite would give the IDs of archived infractions out
+# again; new infractions get IDs above those of the archive as well
+NEXT_INFRACTION_ID = (
+    "SELECT MAX(COALESCE((SELECT MAX(oid) FROM infractions), 0), "
+    "COALESCE((SELECT MAX(id) FROM infractions_archive), 0)) + 1"
+)
 
 
 class Infractions(IInfractions):
@@ -140,8 +239,8 @@ class Infractions(IInfractions):
                 infraction.infraction_on,
                 infraction.infraction_type.value,
             )
-            sql = """INSERT INTO infractions (user_id, user_name, moderator_id, moderator_name, guild_id, reason, 
-            infraction_on, infraction_type) VALUES(?,?,?,?,?,?,?,?)"""
+            sql = f"""INSERT INTO infractions (oid, user_id, user_name, moderator_id, moderator_name, guild_id, 
+            reason, infraction_on, infraction_type) VALUES(({NEXT_INFRACTION_ID}),?,?,?,?,?,?,?,?)"""
             try:
                 infraction.id = self.conn.execute(sql, values).lastrowid
                 self.conn.commit()
@@ -391,6 +490,144 @@ class Infractions(IInfractions):
             )
         return objectified_infractions
 
+    def find_page_for_user(
+        self,
+        user_id: int,
+        guild_id: int,
+        infraction_type: Optional[InfractionType] = None,
+        after_id: int = 0,
+        limit: int = 10,
+    ) -> List[Infraction]:
+        guild = self.db.guilds.find_by_id(guild_id)
+        infractions = []
+        try:
+            infractions = self.conn.execute(
+                "SELECT * FROM infractions "
+                "WHERE guild_id=:guild_id AND user_id=:user_id AND oid > :after_id "
+                "AND DATETIME(infraction_on) > :expired_time "
+                "AND (:infraction_type IS NULL OR infraction_type=:infraction_type) "
+                "ORDER BY oid ASC LIMIT :limit",
+                {
+                    "user_id": user_id,
+                    "guild_id": guild_id,
+                    "after_id": after_id,
+                    "expired_time": guild.infraction_expired_time(),
+                    "infraction_type": infraction_type.value
+                    if infraction_type
+                    else None,
+                    "limit": limit,
+                },
+            )
+        except sqlite3.DatabaseError:
+            pass
+        return [self._from_row(infraction, guild) for infraction in infractions]
+
+    def search(
+        self, query: InfractionSearch, after_id: int = 0, limit: int = 10
+    ) -> List[Infraction]:
+        conditions = ["guild_id=:guild_id", "oid > :after_id"]
+        values = {"guild_id": query.guild_id, "after_id": after_id, "limit": limit}
+        if query.text:
+            # quote every word so FTS5 treats user input as plain terms
+            conditions.append(
+                "oid IN (SELECT rowid FROM infractions_fts WHERE infractions_fts MATCH :text)"
+            )
+            values["text"] = " ".join(
+                '"' + word.replace('"', '""') + '"' for word in query.text.split()
+            )
+        if query.user_id:
+            conditions.append("user_id=:user_id")
+            values["user_id"] = query.user_id
+        if query.moderator_id:
+            conditions.append("moderator_id=:moderator_id")
+            values["moderator_id"] = query.moderator_id
+        if query.infraction_type:
+            conditions.append("infraction_type=:infraction_type")
+            values["infraction_type"] = query.infraction_type.value
+        if query.since:
+            conditions.append("DATETIME(infraction_on) >= DATETIME(:since)")
+            values["since"] = query.since
+        if query.until:
+            conditions.append("DATETIME(infraction_on) < DATETIME(:until)")
+            values["until"] = query.until
+        if query.pardoned is not None:
+            conditions.append(
+                ("" if query.pardoned else "NOT ")
+                + "EXISTS (SELECT 1 FROM pardons WHERE infraction_id=infractions.oid)"
+            )
+
+        guild = self.db.guilds.find_by_id(query.guild_id)
+        infractions = []
+        try:
+            infractions = self.conn.execute(
+                "SELECT * FROM infractions WHERE "
+                + " AND ".join(conditions)
+                + " ORDER BY oid ASC LIMIT :limit",
+                values,
+            )
+        except sqlite3.DatabaseError:
+            pass
+        return [self._from_row(infraction, guild) for infraction in infractions]
+
+    def export(self, guild_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        # archived infractions first, then those still in the infractions table
+        archived = self.conn.execute(
+            "SELECT id, user_id, user_name, moderator_id, moderator_name, reason, "
+            "infraction_on, infraction_type, pardon_moderator_id, pardon_moderator_name, "
+            "pardon_on, pardon_reason, published_ban_message_id, published_unban_message_id "
+            "FROM infractions_archive WHERE guild_id=:guild_id ORDER BY id ASC",
+            {"guild_id": guild_id},
+        )
+        current = self.conn.execute(
+            "SELECT infractions.oid AS id, infractions.user_id, infractions.user_name, "
+            "infractions.moderator_id, infractions.moderator_name, infractions.reason, "
+            "infractions.infraction_on, infractions.infraction_type, "
+            "pardons.moderator_id AS pardon_moderator_id, "
+            "pardons.moderator_name AS pardon_moderator_name, "
+            "pardons.pardon_on, pardons.reason AS pardon_reason, "
+            "published_ban.message_id AS published_ban_message_id, "
+            "published_unban.message_id AS published_unban_message_id "
+            "FROM infractions "
+            "LEFT JOIN pardons ON pardons.infraction_id=infractions.oid "
+            "LEFT JOIN published_messages published_ban "
+            "ON published_ban.infraction_id=infractions.oid AND published_ban.publish_type=:ban "
+            "LEFT JOIN published_messages published_unban "
+            "ON published_unban.infraction_id=infractions.oid AND published_unban.publish_type=:unban "
+            "WHERE infractions.guild_id=:guild_id ORDER BY infractions.oid ASC",
+            {
+                "guild_id": guild_id,
+                "ban": PublishType.BAN.value,
+                "unban": PublishType.UNBAN.value,
+            },
+        )
+        for cursor in (archived, current):
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+            finally:
+                cursor.close()
+
+    def _from_row(self, infraction: sqlite3.Row, guild: GuildSettings) -> Infraction:
+        return Infraction(
+            infraction["oid"],
+            DBUser(infraction["user_id"], infraction["user_name"]),
+            DBUser(infraction["moderator_id"], infraction["moderator_name"]),
+            guild,
+            infraction["reason"],
+            infraction["infraction_on"].replace(tzinfo=timezone.utc),
+            InfractionType(infraction["infraction_type"]),
+            self.db.pardons.find_by_id(infraction["oid"]),
+            self.db.published_messages.find_by_id_and_type(
+                infraction["oid"], PublishType.BAN
+            ),
+            self.db.published_messages.find_by_id_and_type(
+                infraction["oid"], PublishType.UNBAN
+            ),
+        )
+
     def find_mod_actions(self, moderator_id, guild_id) -> Dict:
         warns = []
         mutes = []
@@ -430,6 +667,27 @@ class Infractions(IInfractions):
             pass
         return {"warns": len(warns), "mutes": len(mutes), "bans": len(bans)}
 
+    def count_active(
+        self, user_id: int, guild_id: int, infraction_type: InfractionType
+    ) -> int:
+        expired_time = self.db.guilds.find_by_id(guild_id).infraction_expired_time()
+        count = None
+        try:
+            count = self.conn.execute(
+                "SELECT COALESCE(SUM(count), 0) AS count FROM infraction_counts "
+                "WHERE guild_id=:guild_id AND user_id=:user_id "
+                "AND infraction_type=:infraction_type AND day > :expired_day",
+                {
+                    "guild_id": guild_id,
+                    "user_id": user_id,
+                    "infraction_type": infraction_type.value,
+                    "expired_day": expired_time.date().isoformat(),
+                },
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            pass
+        return count["count"] if count else 0
+
 
 class Pardons(IPardons):
     def __init__(self, conn: sqlite3.Connection):
@@ -513,16 +771,22 @@ class Mutes(IMutes):
                     self.db.infractions.find_by_id_only(mute["infraction_id"]),
                     mute["end_time"].replace(tzinfo=timezone.utc),
                     DBUser(mute["user_id"], mute["user_name"]),
+                    bool(mute["timeout"]),
                 )
                 if mute
                 else None
             )
 
-    def find_expired_mutes(self) -> List[Mute]:
+    def find_expired_mutes(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Mute]:
         mutes = []
         try:
             mutes = self.conn.execute(
-                "SELECT * FROM mutes WHERE DATETIME(end_time) < :time",
+                "SELECT mutes.* FROM mutes "
+                "JOIN infractions ON infractions.oid=mutes.infraction_id "
+                "WHERE DATETIME(mutes.end_time) < :time AND "
+                + shard_condition("infractions.guild_id", shard_count, shard_ids),
                 {"time": datetime.now(timezone.utc)},
             ).fetchall()
         except sqlite3.DatabaseError:
@@ -535,13 +799,20 @@ class Mutes(IMutes):
                         self.db.infractions.find_by_id_only(mute["infraction_id"]),
                         mute["end_time"].replace(tzinfo=timezone.utc),
                         DBUser(mute["user_id"], mute["user_name"]),
+                        bool(mute["timeout"]),
                     )
                 )
             return objectified_mutes
 
     def save(self, mute: Mute) -> Mute:
-        values = (mute.infraction.id, mute.end_time, mute.user.id, mute.user.name)
-        sql = """INSERT INTO mutes (infraction_id, end_time, user_id, user_name) VALUES(?,?,?,?)"""
+        values = (
+            mute.infraction.id,
+            mute.end_time,
+            mute.user.id,
+            mute.user.name,
+            mute.timeout,
+        )
+        sql = """INSERT INTO mutes (infraction_id, end_time, user_id, user_name, timeout) VALUES(?,?,?,?,?)"""
         try:
             self.conn.execute(sql, values)
             self.conn.commit()
@@ -560,8 +831,15 @@ class Mutes(IMutes):
         mute = None
         try:
             mute = self.conn.execute(
-                "SELECT * FROM mutes WHERE DATETIME(end_time) > :time AND user_id=:user_id",
-                {"time": datetime.now(timezone.utc), "user_id": user_id},
+                "SELECT mutes.* FROM mutes "
+                "JOIN infractions ON infractions.oid=mutes.infraction_id "
+                "WHERE DATETIME(mutes.end_time) > :time AND mutes.user_id=:user_id "
+                "AND infractions.guild_id=:guild_id",
+                {
+                    "time": datetime.now(timezone.utc),
+                    "user_id": user_id,
+                    "guild_id": guild_id,
+                },
             ).fetchone()
         except sqlite3.DatabaseError:
             pass
@@ -571,11 +849,94 @@ class Mutes(IMutes):
                     self.db.infractions.find_by_id_only(mute["infraction_id"]),
                     mute["end_time"].replace(tzinfo=timezone.utc),
                     DBUser(mute["user_id"], mute["user_name"]),
+                    bool(mute["timeout"]),
                 )
                 if mute
                 else None
             )
 
+    def find_active_mutes_for_guild(
+        self, guild_id: int, after_id: int = 0, limit: int = 100
+    ) -> List[ActiveMute]:
+        mutes = []
+        try:
+            mutes = self.conn.execute(
+                "SELECT mutes.infraction_id, mutes.end_time, mutes.user_id, mutes.user_name, "
+                "mutes.timeout FROM mutes "
+                "JOIN infractions ON infractions.oid=mutes.infraction_id "
+                "WHERE DATETIME(mutes.end_time) > :time AND infractions.guild_id=:guild_id "
+                "AND mutes.infraction_id > :after_id "
+                "ORDER BY mutes.infraction_id ASC LIMIT :limit",
+                {
+                    "time": datetime.now(timezone.utc),
+                    "guild_id": guild_id,
+                    "after_id": after_id,
+                    "limit": limit,
+                },
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return [
+            ActiveMute(
+                mute["infraction_id"],
+                mute["end_time"].replace(tzinfo=timezone.utc),
+                DBUser(mute["user_id"], mute["user_name"]),
+                bool(mute["timeout"]),
+            )
+            for mute in mutes
+        ]
+
+
+class TempBans(ITempBans):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def find_expired(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[TempBan]:
+        temp_bans = []
+        try:
+            temp_bans = self.conn.execute(
+                "SELECT * FROM temp_bans WHERE DATETIME(end_time) < :time AND "
+                + shard_condition("guild_id", shard_count, shard_ids),
+                {"time": datetime.now(timezone.utc)},
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return [
+            TempBan(
+                temp_ban["infraction_id"],
+                temp_ban["guild_id"],
+                DBUser(temp_ban["user_id"], temp_ban["user_name"]),
+                temp_ban["end_time"].replace(tzinfo=timezone.utc),
+            )
+            for temp_ban in temp_bans
+        ]
+
+    def save(self, temp_ban: TempBan) -> TempBan:
+        self.conn.execute(
+            "INSERT INTO temp_bans (guild_id, user_id, user_name, infraction_id, end_time) "
+            "VALUES(:guild_id, :user_id, :user_name, :infraction_id, :end_time) "
+            "ON CONFLICT(guild_id, user_id) DO UPDATE SET user_name=excluded.user_name, "
+            "infraction_id=excluded.infraction_id, end_time=excluded.end_time",
+            {
+                "guild_id": temp_ban.guild_id,
+                "user_id": temp_ban.user.id,
+                "user_name": temp_ban.user.name,
+                "infraction_id": temp_ban.infraction_id,
+                "end_time": temp_ban.end_time,
+            },
+        )
+        self.conn.commit()
+        return temp_ban
+
+    def delete_all(self, guild_id: int, user_ids: List[int]) -> None:
+        self.conn.executemany(
+            "DELETE FROM temp_bans WHERE guild_id=? AND user_id=?",
+            ((guild_id, user_id) for user_id in user_ids),
+        )
+        self.conn.commit()
+
 
 class Guilds(IGuilds):
     def __init__(self, conn: sqlite3.Connection):
@@ -600,6 +961,9 @@ class Guilds(IGuilds):
                     else None,
                     guild["duration"],
                     guild["mute_role"],
+                    MuteBackend(guild["mute_backend"]),
+                    guild["mod_log_webhook"],
+                    guild["public_log_webhook"],
                 )
                 if guild
                 else None
@@ -615,7 +979,10 @@ class Guilds(IGuilds):
                     "public_log=:public_log,"
                     "duration_type=:duration_type,"
                     "duration=:duration,"
-                    "mute_role=:mute_role "
+                    "mute_role=:mute_role,"
+                    "mute_backend=:mute_backend,"
+                    "mod_log_webhook=:mod_log_webhook,"
+                    "public_log_webhook=:public_log_webhook "
                     "WHERE id=:id",
                     {
                         "mod_log": guild.mod_log,
@@ -623,6 +990,9 @@ class Guilds(IGuilds):
                         "duration_type": guild.duration_type.value,
                         "duration": guild.duration,
                         "mute_role": guild.mute_role,
+                        "mute_backend": guild.mute_backend.value,
+                        "mod_log_webhook": guild.mod_log_webhook,
+                        "public_log_webhook": guild.public_log_webhook,
                         "id": guild.id,
                     },
                 )
@@ -638,10 +1008,13 @@ class Guilds(IGuilds):
                     guild.duration_type.value,
                     guild.duration,
                     guild.mute_role,
+                    guild.mute_backend.value,
+                    guild.mod_log_webhook,
+                    guild.public_log_webhook,
                 )
                 sql = (
-                    "INSERT INTO guilds (id, mod_log, public_log, duration_type, duration, mute_role) "
-                    "VALUES(?,?,?,?,?,?)"
+                    "INSERT INTO guilds (id, mod_log, public_log, duration_type, duration, mute_role, "
+                    "mute_backend, mod_log_webhook, public_log_webhook) VALUES(?,?,?,?,?,?,?,?,?)"
                 )
                 self.conn.execute(sql, values)
                 self.conn.commit()
@@ -654,6 +1027,242 @@ class Guilds(IGuilds):
         self.conn.commit()
 
 
+class Raids(IRaids):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def find_all(self) -> List[RaidSettings]:
+        settings = []
+        try:
+            settings = self.conn.execute("SELECT * FROM raid_settings").fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return [self._from_row(row) for row in settings]
+
+    def find_by_id(self, guild_id: int) -> Optional[RaidSettings]:
+        settings = None
+        try:
+            settings = self.conn.execute(
+                "SELECT * FROM raid_settings WHERE guild_id=:guild_id",
+                {"guild_id": guild_id},
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            pass
+        return self._from_row(settings) if settings else None
+
+    def save(self, settings: RaidSettings) -> RaidSettings:
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO raid_settings (guild_id, enabled, joins, seconds, "
+                "account_age, require_avatar, action, duration) "
+                "VALUES(:guild_id, :enabled, :joins, :seconds, :account_age, :require_avatar, "
+                ":action, :duration)",
+                {
+                    "guild_id": settings.guild_id,
+                    "enabled": settings.enabled,
+                    "joins": settings.joins,
+                    "seconds": settings.seconds,
+                    "account_age": int(settings.account_age.total_seconds()),
+                    "require_avatar": settings.require_avatar,
+                    "action": settings.action.value,
+                    "duration": int(settings.duration.total_seconds()),
+                },
+            )
+            self.conn.commit()
+        except sqlite3.DatabaseError:
+            pass
+        return self.find_by_id(settings.guild_id)
+
+    @staticmethod
+    def _from_row(settings: sqlite3.Row) -> RaidSettings:
+        return RaidSettings(
+            settings["guild_id"],
+            bool(settings["enabled"]),
+            settings["joins"],
+            settings["seconds"],
+            timedelta(seconds=settings["account_age"]),
+            bool(settings["require_avatar"]),
+            RaidAction(settings["action"]),
+            timedelta(seconds=settings["duration"]),
+        )
+
+
+class Spam(ISpam):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def find_all(self) -> List[SpamSettings]:
+        settings = []
+        try:
+            settings = self.conn.execute("SELECT * FROM spam_settings").fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return [self._from_row(row) for row in settings]
+
+    def find_by_id(self, guild_id: int) -> Optional[SpamSettings]:
+        settings = None
+        try:
+            settings = self.conn.execute(
+                "SELECT * FROM spam_settings WHERE guild_id=:guild_id",
+                {"guild_id": guild_id},
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            pass
+        return self._from_row(settings) if settings else None
+
+    def save(self, settings: SpamSettings) -> SpamSettings:
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO spam_settings (guild_id, enabled, messages, mentions, "
+                "seconds, duplicates, duration) "
+                "VALUES(:guild_id, :enabled, :messages, :mentions, :seconds, :duplicates, "
+                ":duration)",
+                {
+                    "guild_id": settings.guild_id,
+                    "enabled": settings.enabled,
+                    "messages": settings.messages,
+                    "mentions": settings.mentions,
+                    "seconds": settings.seconds,
+                    "duplicates": settings.duplicates,
+                    "duration": int(settings.duration.total_seconds()),
+                },
+            )
+            self.conn.commit()
+        except sqlite3.DatabaseError:
+            pass
+        return self.find_by_id(settings.guild_id)
+
+    @staticmethod
+    def _from_row(settings: sqlite3.Row) -> SpamSettings:
+        return SpamSettings(
+            settings["guild_id"],
+            bool(settings["enabled"]),
+            settings["messages"],
+            settings["mentions"],
+            settings["seconds"],
+            settings["duplicates"],
+            timedelta(seconds=settings["duration"]),
+        )
+
+
+class Filters(IFilters):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def find_words(self, guild_id: int) -> List[str]:
+        words = []
+        try:
+            words = self.conn.execute(
+                "SELECT word FROM filtered_words WHERE guild_id=:guild_id ORDER BY word",
+                {"guild_id": guild_id},
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return [word["word"] for word in words]
+
+    def add_words(self, guild_id: int, words: List[str]) -> None:
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO filtered_words (guild_id, word) VALUES(?,?)",
+            ((guild_id, word) for word in words),
+        )
+        self.conn.commit()
+
+    def remove_words(self, guild_id: int, words: List[str]) -> None:
+        self.conn.executemany(
+            "DELETE FROM filtered_words WHERE guild_id=? AND word=?",
+            ((guild_id, word) for word in words),
+        )
+        self.conn.commit()
+
+    def find_domains(self, guild_id: int) -> Dict[str, bool]:
+        domains = []
+        try:
+            domains = self.conn.execute(
+                "SELECT domain, allowed FROM filtered_domains WHERE guild_id=:guild_id "
+                "ORDER BY domain",
+                {"guild_id": guild_id},
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return {domain["domain"]: bool(domain["allowed"]) for domain in domains}
+
+    def save_domains(self, guild_id: int, domains: List[str], allowed: bool) -> None:
+        self.conn.executemany(
+            "INSERT INTO filtered_domains (guild_id, domain, allowed) VALUES(?,?,?) "
+            "ON CONFLICT(guild_id, domain) DO UPDATE SET allowed=excluded.allowed",
+            ((guild_id, domain, allowed) for domain in domains),
+        )
+        self.conn.commit()
+
+    def remove_domains(self, guild_id: int, domains: List[str]) -> None:
+        self.conn.executemany(
+            "DELETE FROM filtered_domains WHERE guild_id=? AND domain=?",
+            ((guild_id, domain) for domain in domains),
+        )
+        self.conn.commit()
+
+
+class Escalations(IEscalations):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def find_by_guild(self, guild_id: int) -> List[EscalationRule]:
+        rules = []
+        try:
+            rules = self.conn.execute(
+                "SELECT * FROM escalation_rules WHERE guild_id=:guild_id "
+                "ORDER BY infraction_type, count",
+                {"guild_id": guild_id},
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            pass
+        return [
+            EscalationRule(
+                rule["guild_id"],
+                InfractionType(rule["infraction_type"]),
+                rule["count"],
+                InfractionType(rule["action"]),
+                timedelta(seconds=rule["duration"])
+                if rule["duration"] is not None
+                else None,
+            )
+            for rule in rules
+        ]
+
+    def save(self, rule: EscalationRule) -> EscalationRule:
+        self.conn.execute(
+            "INSERT INTO escalation_rules (guild_id, infraction_type, count, action, duration) "
+            "VALUES(:guild_id, :infraction_type, :count, :action, :duration) "
+            "ON CONFLICT(guild_id, infraction_type, count) DO UPDATE SET "
+            "action=excluded.action, duration=excluded.duration",
+            {
+                "guild_id": rule.guild_id,
+                "infraction_type": rule.infraction_type.value,
+                "count": rule.count,
+                "action": rule.action.value,
+                "duration": int(rule.duration.total_seconds())
+                if rule.duration
+                else None,
+            },
+        )
+        self.conn.commit()
+        return rule
+
+    def delete(
+        self, guild_id: int, infraction_type: InfractionType, count: int
+    ) -> None:
+        self.conn.execute(
+            "DELETE FROM escalation_rules "
+            "WHERE guild_id=:guild_id AND infraction_type=:infraction_type AND count=:count",
+            {
+                "guild_id": guild_id,
+                "infraction_type": infraction_type.value,
+                "count": count,
+            },
+        )
+        self.conn.commit()
+
+
 class Locks(ILocks):
     def __init__(self, conn: sqlite3.Connection, db: Database):
         self.conn = conn
@@ -683,11 +1292,14 @@ class Locks(ILocks):
                 else None
             )
 
-    def find_expired_locks(self) -> List[Lock]:
+    def find_expired_locks(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Lock]:
         locks = []
         try:
             locks = self.conn.execute(
-                "SELECT * FROM locks WHERE DATETIME(end_time) < :time",
+                "SELECT * FROM locks WHERE DATETIME(end_time) < :time AND "
+                + shard_condition("guild_id", shard_count, shard_ids),
                 {"time": datetime.now(timezone.utc)},
             ).fetchall()
         except sqlite3.DatabaseError:
@@ -719,7 +1331,7 @@ class Locks(ILocks):
                     "moderator_name=:moderator_name,"
                     "reason=:reason,"
                     "end_time=:end_time "
-                    "WHERE channel_id=channel_id",
+                    "WHERE channel_id=:channel_id",
                     {
                         "moderator_id": lock.moderator.id,
                         "moderator_name": lock.moderator.name,
@@ -753,10 +1365,49 @@ class Locks(ILocks):
                 pass
         return self.find_by_id(lock.channel_id)
 
+    def save_all(self, locks: List[Lock]) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT INTO locks (channel_id, previous_value, moderator_id, moderator_name, "
+                "guild_id, reason, end_time) VALUES(?,?,?,?,?,?,?) "
+                "ON CONFLICT(channel_id) DO UPDATE SET moderator_id=excluded.moderator_id, "
+                "moderator_name=excluded.moderator_name, reason=excluded.reason, "
+                "end_time=excluded.end_time",
+                (
+                    (
+                        lock.channel_id,
+                        lock.previous_value,
+                        lock.moderator.id,
+                        lock.moderator.name,
+                        lock.guild.id,
+                        lock.reason,
+                        lock.end_time,
+                    )
+                    for lock in locks
+                ),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
     def delete(self, channel_id: int) -> None:
         self.conn.execute("DELETE FROM locks WHERE channel_id=:id", {"id": channel_id})
         self.conn.commit()
 
+    def delete_all(self, channel_ids: List[int]) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "DELETE FROM locks WHERE channel_id=?",
+                ((channel_id,) for channel_id in channel_ids),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
 
 class ThreadLocks(IThreadLocks):
     def __init__(self, conn: sqlite3.Connection, db: Database):
@@ -784,11 +1435,14 @@ class ThreadLocks(IThreadLocks):
                 else None
             )
 
-    def find_expired_locks(self) -> List[ThreadLock]:
+    def find_expired_locks(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[ThreadLock]:
         locks = []
         try:
             locks = self.conn.execute(
-                "SELECT * FROM thread_locks WHERE DATETIME(end_time) < :time",
+                "SELECT * FROM thread_locks WHERE DATETIME(end_time) < :time AND "
+                + shard_condition("guild_id", shard_count, shard_ids),
                 {"time": datetime.now(timezone.utc)},
             ).fetchall()
         except sqlite3.DatabaseError:
@@ -817,7 +1471,7 @@ class ThreadLocks(IThreadLocks):
                     "moderator_name=:moderator_name,"
                     "reason=:reason,"
                     "end_time=:end_time "
-                    "WHERE channel_id=channel_id",
+                    "WHERE channel_id=:channel_id",
                     {
                         "moderator_id": lock.moderator.id,
                         "moderator_name": lock.moderator.name,
@@ -916,3 +1570,173 @@ class PublishedMessages(IPublishedMessages):
             {"infraction_id": infraction_id},
         )
         self.conn.commit()
+
+
+class Imports(IImports):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def find_checkpoint(self, source: str, guild_id: int) -> int:
+        checkpoint = None
+        try:
+            checkpoint = self.conn.execute(
+                "SELECT rows_done FROM import_checkpoints "
+                "WHERE source=:source AND guild_id=:guild_id",
+                {"source": source, "guild_id": guild_id},
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            pass
+        return checkpoint["rows_done"] if checkpoint else 0
+
+    def save_batch(
+        self, source: str, guild_id: int, rows_done: int, infractions: List[Infraction]
+    ) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # rowids are handed out sequentially inside the transaction, so the new
+            # infractions get the IDs following the current maximum
+            first_id = self.conn.execute(NEXT_INFRACTION_ID).fetchone()[0]
+            self.conn.executemany(
+                "INSERT INTO infractions (oid, user_id, user_name, moderator_id, moderator_name, "
+                "guild_id, reason, infraction_on, infraction_type) VALUES(?,?,?,?,?,?,?,?,?)",
+                (
+                    (
+                        first_id + index,
+                        infraction.user.id,
+                        infraction.user.name,
+                        infraction.moderator.id,
+                        infraction.moderator.name,
+                        guild_id,
+                        infraction.reason,
+                        infraction.infraction_on,
+                        infraction.infraction_type.value,
+                    )
+                    for index, infraction in enumerate(infractions)
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO pardons (infraction_id, moderator_id, moderator_name, pardon_on, reason) "
+                "VALUES(?,?,?,?,?)",
+                (
+                    (
+                        first_id + index,
+                        infraction.pardon.moderator.id,
+                        infraction.pardon.moderator.name,
+                        infraction.pardon.pardon_on,
+                        infraction.pardon.reason,
+                    )
+                    for index, infraction in enumerate(infractions)
+                    if infraction.pardon
+                ),
+            )
+            self.conn.execute(
+                "INSERT INTO import_checkpoints (source, guild_id, rows_done) "
+                "VALUES(:source, :guild_id, :rows_done) "
+                "ON CONFLICT(source, guild_id) DO UPDATE SET rows_done=:rows_done",
+                {"source": source, "guild_id": guild_id, "rows_done": rows_done},
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def defer_indexes(self) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            indexes = self.conn.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type='index' AND tbl_name='infractions' AND sql IS NOT NULL"
+            ).fetchall()
+            for index in indexes:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO deferred_indexes (name, sql) VALUES(?,?)",
+                    (index["name"], index["sql"]),
+                )
+                self.conn.execute(f'DROP INDEX "{index["name"]}"')
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def restore_indexes(self) -> None:
+        try:
+            indexes = self.conn.execute(
+                "SELECT name, sql FROM deferred_indexes"
+            ).fetchall()
+        except sqlite3.DatabaseError:
+            return
+        for index in indexes:
+            self.conn.execute(index["sql"])
+            self.conn.execute(
+                "DELETE FROM deferred_indexes WHERE name=:name", {"name": index["name"]}
+            )
+
+
+class Archives(IArchives):
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def archive_batch(self, before: datetime, batch_size: int) -> int:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [
+                row["oid"]
+                for row in self.conn.execute(
+                    "SELECT oid FROM infractions "
+                    "WHERE DATETIME(infraction_on) < DATETIME(:before) "
+                    # mutes and bans that haven't been lifted yet stay until they are
+                    "AND oid NOT IN (SELECT infraction_id FROM mutes) "
+                    "AND oid NOT IN (SELECT infraction_id FROM temp_bans) LIMIT :limit",
+                    {"before": before, "limit": batch_size},
+                )
+            ]
+            if ids:
+                in_ids = f"({','.join('?' * len(ids))})"
+                self.conn.execute(
+                    "INSERT INTO infractions_archive "
+                    "SELECT infractions.oid, infractions.user_id, infractions.user_name, "
+                    "infractions.moderator_id, infractions.moderator_name, infractions.guild_id, "
+                    "infractions.reason, infractions.infraction_on, infractions.infraction_type, "
+                    "pardons.moderator_id, pardons.moderator_name, pardons.pardon_on, pardons.reason, "
+                    "published_ban.message_id, published_unban.message_id, ? "
+                    "FROM infractions "
+                    "LEFT JOIN pardons ON pardons.infraction_id=infractions.oid "
+                    "LEFT JOIN published_messages published_ban "
+                    "ON published_ban.infraction_id=infractions.oid AND published_ban.publish_type=? "
+                    "LEFT JOIN published_messages published_unban "
+                    "ON published_unban.infraction_id=infractions.oid AND published_unban.publish_type=? "
+                    f"WHERE infractions.oid IN {in_ids}",
+                    (
+                        datetime.now(timezone.utc),
+                        PublishType.BAN.value,
+                        PublishType.UNBAN.value,
+                        *ids,
+                    ),
+                )
+                for table in ("pardons", "published_messages"):
+                    self.conn.execute(
+                        f"DELETE FROM {table} WHERE infraction_id IN {in_ids}", ids
+                    )
+                self.conn.execute(f"DELETE FROM infractions WHERE oid IN {in_ids}", ids)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(ids)
+
+    def delete_orphans(self) -> int:
+        deleted = 0
+        for table in ("pardons", "published_messages", "mutes"):
+            deleted += self.conn.execute(
+                f"DELETE FROM {table} "
+                "WHERE infraction_id NOT IN (SELECT oid FROM infractions)"
+            ).rowcount
+        return deleted
+
+    def reclaim_space(self, pages: int) -> bool:
+        # incremental vacuum only works if auto_vacuum was set to incremental (2) before
+        # the tables were created, or a full VACUUM has been run since
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return False
+        self.conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return True
@@ -0,0 +1,90 @@
+"""
+Counters for detecting raids and spam. They sit on the gateway event path, so every update is O(1)
+and their memory doesn't grow with the number of events.
+"""
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SlidingWindowCounter:
+    """Counts events in the last `window` seconds, in one bucket per second."""
+
+    __slots__ = ("window", "counts", "total", "last")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.counts = [0] * window
+        self.total = 0
+        self.last = 0
+
+    def add(self, now: float, amount: int = 1) -> int:
+        """Count an event and return how many happened in the window, including it."""
+        second = int(now)
+        if second > self.last:
+            if second - self.last >= self.window:
+                self.counts = [0] * self.window
+                self.total = 0
+            else:
+                # empty the buckets of the seconds that left the window
+                for expired in range(self.last + 1, second + 1):
+                    self.total -= self.counts[expired % self.window]
+                    self.counts[expired % self.window] = 0
+            self.last = second
+        self.counts[second % self.window] += amount
+        self.total += amount
+        return self.total
+
+
+class TokenBucket:
+    """Allows `capacity` events at once, refilling at `rate` events per second."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float, amount: float = 1) -> bool:
+        """Use up tokens for an event. Returns False if there aren't enough left."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+class LRUDict(Generic[K, V]):
+    """A dict that forgets the least recently used keys once it holds `max_size` of them."""
+
+    __slots__ = ("max_size", "items")
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.items: "OrderedDict[K, V]" = OrderedDict()
+
+    def get_or_create(self, key: K, factory: Callable[[], V]) -> V:
+        value = self.items.get(key)
+        if value is None:
+            value = self.items[key] = factory()
+            if len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+        else:
+            self.items.move_to_end(key)
+        return value
+
+    def pop(self, key: K) -> None:
+        self.items.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[K], bool]) -> None:
+        """Forgets every key the predicate is true for."""
+        for key in [key for key in self.items if predicate(key)]:
+            del self.items[key]
+
+    def __len__(self) -> int:
+        return len(self.items)
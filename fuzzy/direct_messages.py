@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Union
+
+import aiohttp
+import discord
+
+from fuzzy.metrics import Metrics
+
+Recipient = Union[discord.Member, discord.User]
+
+
+class DirectMessages:
+    """
+    Delivers direct messages in the background, so commands don't wait on them. A few are sent at a
+    time; rate limits and server errors are retried with exponential backoff, and users who don't
+    accept direct messages are remembered for a while so they aren't tried again.
+    """
+
+    def __init__(self, config, send: Callable[..., Awaitable], metrics: Metrics):
+        self.log = logging.getLogger("Fuzzy").getChild("DirectMessages")
+        self.send = send
+        self.metrics = metrics
+        self.queue: asyncio.Queue = asyncio.Queue(
+            int(config.get("direct_messages", "queue_size", fallback="1000"))
+        )
+        self.concurrency = int(
+            config.get("direct_messages", "concurrency", fallback="4")
+        )
+        self.retries = int(config.get("direct_messages", "retries", fallback="3"))
+        self.backoff = float(config.get("direct_messages", "backoff", fallback="1"))
+        self.closed_ttl = 60 * float(
+            config.get("direct_messages", "closed_ttl_minutes", fallback="60")
+        )
+        # users with closed direct messages, oldest first, so expired entries are at the front
+        self.closed: "OrderedDict[int, float]" = OrderedDict()
+        self.workers: List[asyncio.Task] = []
+
+    def start(self):
+        self.workers = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def enqueue(
+        self,
+        to: Recipient,
+        on_failure: Optional[Callable[[], Awaitable]] = None,
+        **kwargs,
+    ):
+        """Queues a direct message, taking the arguments of `Fuzzy.direct_message`, and returns
+        right away. `on_failure` is awaited if the message can't be delivered."""
+        if self._is_closed(to.id):
+            self.metrics.count("fuzzy_direct_messages_total", result="closed")
+            if on_failure:
+                await on_failure()
+            return
+        try:
+            self.queue.put_nowait((to, on_failure, kwargs, time.monotonic()))
+        except asyncio.QueueFull:
+            self.log.warning("Dropped a direct message to %s, the queue is full", to.id)
+            self.metrics.count("fuzzy_direct_messages_total", result="dropped")
+            if on_failure:
+                await on_failure()
+
+    async def deliver(self, to: Recipient, timeout: float, **kwargs) -> bool:
+        """Sends a direct message right away and waits at most `timeout` seconds for it, for
+        messages that have to arrive before something else happens, such as a ban."""
+        try:
+            return await asyncio.wait_for(self._deliver(to, kwargs), timeout)
+        except asyncio.TimeoutError:
+            self.metrics.count("fuzzy_direct_messages_total", result="timeout")
+            return False
+
+    async def _work(self):
+        while True:
+            to, on_failure, kwargs, queued = await self.queue.get()
+            try:
+                self.metrics.observe(
+                    "fuzzy_direct_message_wait_seconds", time.monotonic() - queued
+                )
+                if not await self._deliver(to, kwargs) and on_failure:
+                    try:
+                        await on_failure()
+                    except Exception:
+                        self.log.exception(
+                            "Could not report a failed direct message to %s", to.id
+                        )
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, to: Recipient, kwargs) -> bool:
+        """Sends a direct message, retrying rate limits, server errors and connection errors.
+        Returns whether it was sent."""
+        if self._is_closed(to.id):
+            self.metrics.count("fuzzy_direct_messages_total", result="closed")
+            return False
+        for attempt in range(self.retries + 1):
+            try:
+                await self.send(to, **kwargs)
+                self.metrics.count("fuzzy_direct_messages_total", result="sent")
+                return True
+            except discord.Forbidden:
+                self._close(to.id)
+                self.metrics.count("fuzzy_direct_messages_total", result="closed")
+                return False
+            except discord.HTTPException as ex:
+                if (ex.status == 429 or ex.status >= 500) and attempt < self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    continue
+                self.log.warning("Could not send a direct message to %s: %s", to.id, ex)
+            except (aiohttp.ClientError, OSError) as ex:
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                    continue
+                self.log.warning("Could not send a direct message to %s: %s", to.id, ex)
+            except Exception:
+                self.log.exception("Could not send a direct message to %s", to.id)
+            self.metrics.count("fuzzy_direct_messages_total", result="failed")
+            return False
+        return False
+
+    def _is_closed(self, user_id: int) -> bool:
+        now = time.monotonic()
+        while self.closed and next(iter(self.closed.values())) < now:
+            self.closed.popitem(last=False)
+        return user_id in self.closed
+
+    def _close(self, user_id: int):
+        self.closed.pop(user_id, None)
+        self.closed[user_id] = time.monotonic() + self.closed_ttl
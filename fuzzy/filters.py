@@ -0,0 +1,135 @@
+"""
+Matchers for the message filters. They are built once per guild when its lists change, so checking
+a message only costs time linear in its length, however long the lists are.
+"""
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Discord invites, with or without a scheme, or the host of any other link. Invites match first, so
+# an invite is never also read as a link to discord.com. Hosts are only letters, digits, hyphens
+# and dots, so punctuation around a link, like in "(https://example.com)," isn't part of its host.
+LINK_PATTERN = re.compile(
+    r"(?:https?://)?(?:www\.)?(?:discord(?:app)?\.com/invite|discord\.gg)/[\w-]+"
+    r"|https?://(?:[^\s/?#<>@]*@)?([\w\-.\u3002\uff0e\uff61]+)",
+    re.IGNORECASE,
+)
+# the other characters that browsers read as dots in a host
+IDEOGRAPHIC_DOTS = str.maketrans("\u3002\uff0e\uff61", "...")
+# the domain every invite counts as, whichever of Discord's domains it uses
+INVITE_DOMAIN = "discord.gg"
+# the domain entry that matches every domain
+ANY_DOMAIN = "*"
+
+
+class WordFilter:
+    """
+    Finds filtered words and phrases in a message with an Aho-Corasick automaton: one pass over
+    the message finds every term. Matching ignores case, and only whole words count, so filtering
+    "ass" doesn't catch "class".
+    """
+
+    def __init__(self, words: Iterable[str]):
+        # per node: the transitions, the node of the longest proper suffix that is also a prefix,
+        # and the lengths of every term ending here
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.lengths: List[Tuple[int, ...]] = [()]
+        for word in words:
+            self._insert(word.strip().casefold())
+        self._link()
+
+    def __bool__(self) -> bool:
+        return len(self.transitions) > 1
+
+    def _insert(self, word: str):
+        if not word:
+            return
+        node = 0
+        for char in word:
+            if char not in self.transitions[node]:
+                self.transitions.append({})
+                self.fail.append(0)
+                self.lengths.append(())
+                self.transitions[node][char] = len(self.transitions) - 1
+            node = self.transitions[node][char]
+        self.lengths[node] += (len(word),)
+
+    def _link(self):
+        """Fill in the failure links breadth first, so every node's suffix is done before it."""
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.transitions[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.transitions[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.transitions[fail].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.lengths[child] += self.lengths[self.fail[child]]
+
+    def find(self, text: str) -> Optional[str]:
+        """Returns the first filtered word in the text, or None."""
+        text = text.casefold()
+        transitions, fail, lengths = self.transitions, self.fail, self.lengths
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in transitions[node]:
+                node = fail[node]
+            node = transitions[node].get(char, 0)
+            for length in lengths[node]:
+                start = end - length
+                if (start == 0 or not text[start - 1].isalnum()) and (
+                    end == len(text) or not text[end].isalnum()
+                ):
+                    return text[start:end]
+        return None
+
+
+class DomainFilter:
+    """
+    Finds links to denied domains in a message. The domains are kept in a trie of their labels in
+    reverse, so "evil.example.com" is com → example → evil, and looking up a domain takes one step
+    per label. The most specific entry wins: denying example.com and allowing good.example.com
+    allows only that subdomain. Denying "*" denies every domain that isn't allowed.
+    """
+
+    def __init__(self, domains: Dict[str, bool]):
+        # per node: the transitions, and whether its domain is allowed, if it is on either list
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.allowed: List[Optional[bool]] = [None]
+        for domain, allowed in domains.items():
+            node = 0
+            if domain != ANY_DOMAIN:
+                for label in reversed(domain.split(".")):
+                    if label not in self.transitions[node]:
+                        self.transitions.append({})
+                        self.allowed.append(None)
+                        self.transitions[node][label] = len(self.transitions) - 1
+                    node = self.transitions[node][label]
+            self.allowed[node] = allowed
+
+    def __bool__(self) -> bool:
+        return any(allowed is False for allowed in self.allowed)
+
+    def is_allowed(self, domain: str) -> bool:
+        node = 0
+        allowed = self.allowed[0]
+        for label in reversed(domain.split(".")):
+            node = self.transitions[node].get(label)
+            if node is None:
+                break
+            if self.allowed[node] is not None:
+                allowed = self.allowed[node]
+        return allowed is not False
+
+    def find(self, text: str) -> Optional[str]:
+        """Returns the domain of the first denied link or invite in the text, or None."""
+        for match in LINK_PATTERN.finditer(text):
+            domain = (match.group(1) or INVITE_DOMAIN).translate(IDEOGRAPHIC_DOTS)
+            domain = domain.lower().rstrip(".")
+            if not self.is_allowed(domain):
+                return domain
+        return None
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 
 from fuzzy.models import *
 
@@ -12,6 +12,11 @@ class IInfractions(ABC):
         """Finds an infraction when given an infraction_id and guild_id"""
         pass
 
+    @abstractmethod
+    def find_by_id_only(self, infraction_id: int) -> Infraction:
+        """Finds an infraction when given only its infraction_id, whichever guild it belongs to."""
+        pass
+
     @abstractmethod
     def save(self, infraction: Infraction) -> Infraction:
         """Saves an infraction into the database. If infraction already exists then updates the saved instance."""
@@ -26,6 +31,11 @@ class IInfractions(ABC):
     def find_recent_ban_by_id(self, user_id, guild_id) -> Infraction:
         pass
 
+    @abstractmethod
+    def find_recent_ban_by_id_time_limited(self, user_id, guild_id) -> Infraction:
+        """Finds an infraction of a user issued within the last minute."""
+        pass
+
     @abstractmethod
     def find_all_for_user(self, user_id: int, guild_id: int) -> List[Infraction]:
         pass
@@ -42,10 +52,42 @@ class IInfractions(ABC):
     def find_bans_for_user(self, user_id: int, guild_id: int) -> List[Infraction]:
         pass
 
+    @abstractmethod
+    def find_page_for_user(
+        self,
+        user_id: int,
+        guild_id: int,
+        infraction_type: Optional[InfractionType] = None,
+        after_id: int = 0,
+        limit: int = 10,
+    ) -> List[Infraction]:
+        """Finds up to `limit` non-expired infractions of a user with an ID greater than `after_id`."""
+        pass
+
+    @abstractmethod
+    def search(
+        self, query: InfractionSearch, after_id: int = 0, limit: int = 10
+    ) -> List[Infraction]:
+        """Finds up to `limit` infractions matching a search with an ID greater than `after_id`."""
+        pass
+
+    @abstractmethod
+    def export(self, guild_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """Streams all infractions of a guild, joined with their pardons and published messages, in chunks."""
+        pass
+
     @abstractmethod
     def find_mod_actions(self, moderator_id, guild_id) -> Dict:
         pass
 
+    @abstractmethod
+    def count_active(
+        self, user_id: int, guild_id: int, infraction_type: InfractionType
+    ) -> int:
+        """Counts a user's unpardoned infractions that haven't expired, to the day, from the
+        counters kept by the database instead of the infractions themselves."""
+        pass
+
 
 class IPardons(ABC):
     @abstractmethod
@@ -67,7 +109,10 @@ class IMutes(ABC):
         pass
 
     @abstractmethod
-    def find_expired_mutes(self) -> List[Mute]:
+    def find_expired_mutes(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Mute]:
+        """Finds expired mutes in guilds on the given shards, or in every guild if shard_ids is None."""
         pass
 
     @abstractmethod
@@ -82,6 +127,31 @@ class IMutes(ABC):
     def find_active_mute(self, user_id, guild_id) -> Mute:
         pass
 
+    @abstractmethod
+    def find_active_mutes_for_guild(
+        self, guild_id: int, after_id: int = 0, limit: int = 100
+    ) -> List[ActiveMute]:
+        """Finds up to `limit` mutes of a guild that haven't expired, with an infraction ID greater than `after_id`."""
+        pass
+
+
+class ITempBans(ABC):
+    @abstractmethod
+    def find_expired(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[TempBan]:
+        """Finds expired bans in guilds on the given shards, or in every guild if shard_ids is None."""
+        pass
+
+    @abstractmethod
+    def save(self, temp_ban: TempBan) -> TempBan:
+        """Saves a temporary ban, replacing the user's previous one in the guild."""
+        pass
+
+    @abstractmethod
+    def delete_all(self, guild_id: int, user_ids: List[int]) -> None:
+        pass
+
 
 class IGuilds(ABC):
     @abstractmethod
@@ -97,23 +167,112 @@ class IGuilds(ABC):
         pass
 
 
+class IRaids(ABC):
+    @abstractmethod
+    def find_all(self) -> List[RaidSettings]:
+        pass
+
+    @abstractmethod
+    def find_by_id(self, guild_id: int) -> Optional[RaidSettings]:
+        pass
+
+    @abstractmethod
+    def save(self, settings: RaidSettings) -> RaidSettings:
+        pass
+
+
+class ISpam(ABC):
+    @abstractmethod
+    def find_all(self) -> List[SpamSettings]:
+        pass
+
+    @abstractmethod
+    def find_by_id(self, guild_id: int) -> Optional[SpamSettings]:
+        pass
+
+    @abstractmethod
+    def save(self, settings: SpamSettings) -> SpamSettings:
+        pass
+
+
+class IFilters(ABC):
+    """The word and domain lists of the message filters."""
+
+    @abstractmethod
+    def find_words(self, guild_id: int) -> List[str]:
+        pass
+
+    @abstractmethod
+    def add_words(self, guild_id: int, words: List[str]) -> None:
+        """Adds words to the guild's filter, ignoring the ones it already has."""
+        pass
+
+    @abstractmethod
+    def remove_words(self, guild_id: int, words: List[str]) -> None:
+        pass
+
+    @abstractmethod
+    def find_domains(self, guild_id: int) -> Dict[str, bool]:
+        """Returns whether each of the guild's listed domains is allowed or denied."""
+        pass
+
+    @abstractmethod
+    def save_domains(self, guild_id: int, domains: List[str], allowed: bool) -> None:
+        """Allows or denies domains, moving them to the other list if they are on it."""
+        pass
+
+    @abstractmethod
+    def remove_domains(self, guild_id: int, domains: List[str]) -> None:
+        pass
+
+
+class IEscalations(ABC):
+    @abstractmethod
+    def find_by_guild(self, guild_id: int) -> List[EscalationRule]:
+        pass
+
+    @abstractmethod
+    def save(self, rule: EscalationRule) -> EscalationRule:
+        """Saves a rule, replacing the guild's rule for the same type and count."""
+        pass
+
+    @abstractmethod
+    def delete(
+        self, guild_id: int, infraction_type: InfractionType, count: int
+    ) -> None:
+        pass
+
+
 class ILocks(ABC):
     @abstractmethod
     def find_by_id(self, channel_id: int) -> Lock:
         pass
 
     @abstractmethod
-    def find_expired_locks(self) -> List[Lock]:
+    def find_expired_locks(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Lock]:
+        """Finds expired locks in guilds on the given shards, or in every guild if shard_ids is None."""
         pass
 
     @abstractmethod
     def save(self, lock: Lock) -> Lock:
         pass
 
+    @abstractmethod
+    def save_all(self, locks: List[Lock]) -> None:
+        """Saves several locks in one transaction. Channels that are already locked keep their
+        previous value."""
+        pass
+
     @abstractmethod
     def delete(self, channel_id: int) -> None:
         pass
 
+    @abstractmethod
+    def delete_all(self, channel_ids: List[int]) -> None:
+        pass
+
 
 class IThreadLocks(ABC):
     @abstractmethod
@@ -121,7 +280,10 @@ class IThreadLocks(ABC):
         pass
 
     @abstractmethod
-    def find_expired_locks(self) -> List[Lock]:
+    def find_expired_locks(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Lock]:
+        """Finds expired locks in guilds on the given shards, or in every guild if shard_ids is None."""
         pass
 
     @abstractmethod
@@ -151,3 +313,48 @@ class IPublishedMessages(ABC):
     @abstractmethod
     def delete_all_with_id(self, infraction_id: int):
         pass
+
+
+class IImports(ABC):
+    """Manages bulk imports of infractions."""
+
+    @abstractmethod
+    def find_checkpoint(self, source: str, guild_id: int) -> int:
+        """Finds how many rows of a source have already been imported into a guild."""
+        pass
+
+    @abstractmethod
+    def save_batch(
+        self, source: str, guild_id: int, rows_done: int, infractions: List[Infraction]
+    ) -> None:
+        """Inserts a batch of infractions and their pardons, and the checkpoint after it, in one transaction."""
+        pass
+
+    @abstractmethod
+    def defer_indexes(self) -> None:
+        """Drops the secondary indexes on infractions until restore_indexes is called."""
+        pass
+
+    @abstractmethod
+    def restore_indexes(self) -> None:
+        """Recreates any indexes dropped by defer_indexes."""
+        pass
+
+
+class IArchives(ABC):
+    """Moves old infractions out of the infractions table."""
+
+    @abstractmethod
+    def archive_batch(self, before: datetime, batch_size: int) -> int:
+        """Moves up to `batch_size` infractions issued before `before` to the archive. Returns how many were moved."""
+        pass
+
+    @abstractmethod
+    def delete_orphans(self) -> int:
+        """Deletes mutes, pardons and published messages whose infraction no longer exists."""
+        pass
+
+    @abstractmethod
+    def reclaim_space(self, pages: int) -> bool:
+        """Returns up to `pages` free pages to the file system, if the database supports it."""
+        pass
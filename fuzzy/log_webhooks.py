@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+import discord
+
+from fuzzy.metrics import Metrics
+
+# Discord's limits on the embeds of a single message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARACTERS = 6000
+
+UNKNOWN_MESSAGE = 10008
+UNKNOWN_WEBHOOK = 10015
+
+# awaited with the embeds that couldn't be sent and whether the webhook no longer exists
+Fallback = Callable[[List[discord.Embed], bool], Awaitable]
+
+
+def batches(embeds: Iterable[discord.Embed]) -> Iterable[List[discord.Embed]]:
+    """Groups embeds into as few messages as Discord allows, keeping their order."""
+    batch, size = [], 0
+    for embed in embeds:
+        if batch and (
+            len(batch) == MAX_EMBEDS or size + len(embed) > MAX_EMBED_CHARACTERS
+        ):
+            yield batch
+            batch, size = [], 0
+        batch.append(embed)
+        size += len(embed)
+    if batch:
+        yield batch
+
+
+def is_gone(ex: discord.HTTPException) -> bool:
+    """Whether a request failed because its webhook was deleted."""
+    return ex.status == 401 or (ex.status == 404 and ex.code == UNKNOWN_WEBHOOK)
+
+
+class LogWebhooks:
+    """
+    Posts logs through webhooks in the log channels, over the bot's pooled HTTP session. Webhooks
+    are rate limited apart from the bot, so a burst of logs doesn't hold up replies to moderators.
+    Logs posted shortly after each other are sent together, up to ten embeds per message.
+    """
+
+    def __init__(self, config, metrics: Metrics):
+        self.log = logging.getLogger("Fuzzy").getChild("LogWebhooks")
+        self.metrics = metrics
+        self.batch_delay = float(
+            config.get("log_webhooks", "batch_delay", fallback="1")
+        )
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.webhooks: Dict[str, discord.Webhook] = {}
+        # embeds waiting to be sent by webhook URL, with what to do if they can't be
+        self.pending: Dict[str, Tuple[List[discord.Embed], Fallback]] = {}
+        self.flushes: Dict[str, asyncio.Task] = {}
+
+    def start(self, session: aiohttp.ClientSession):
+        self.session = session
+
+    async def close(self):
+        """Waits for the logs that are still pending to be sent."""
+        await asyncio.gather(*self.flushes.values(), return_exceptions=True)
+
+    def webhook(self, url: str) -> discord.Webhook:
+        webhook = self.webhooks.get(url)
+        if not webhook:
+            webhook = self.webhooks[url] = discord.Webhook.from_url(
+                url, session=self.session
+            )
+        return webhook
+
+    def forget(self, url: str):
+        self.webhooks.pop(url, None)
+
+    async def post(self, url: str, embeds: List[discord.Embed], fallback: Fallback):
+        """Queues embeds to be sent through a webhook together with those posted after them
+        during the next `batch_delay` seconds, and returns right away."""
+        pending, _ = self.pending.get(url, ([], None))
+        pending.extend(embeds)
+        self.pending[url] = (pending, fallback)
+        if url not in self.flushes:
+            self.flushes[url] = asyncio.create_task(self._flush(url))
+
+    async def send(self, url: str, embed: discord.Embed) -> discord.WebhookMessage:
+        """Sends an embed through a webhook right away and returns the message, for messages that
+        are edited later."""
+        message = await self.webhook(url).send(embed=embed, wait=True)
+        self.metrics.count("fuzzy_log_messages_total", route="webhook")
+        return message
+
+    async def edit(self, url: str, message_id: int, embed: discord.Embed):
+        """Edits a message sent through a webhook."""
+        await self.webhook(url).edit_message(message_id, embed=embed)
+
+    async def delete(self, url: str):
+        """Deletes a webhook, ignoring ones that were already deleted."""
+        try:
+            await self.webhook(url).delete()
+        except discord.HTTPException as ex:
+            if not is_gone(ex):
+                raise
+        finally:
+            self.forget(url)
+
+    async def _flush(self, url: str):
+        await asyncio.sleep(self.batch_delay)
+        del self.flushes[url]
+        embeds, fallback = self.pending.pop(url)
+        sent = 0
+        for batch in batches(embeds):
+            try:
+                await self.webhook(url).send(embeds=batch)
+            except discord.HTTPException as ex:
+                gone = is_gone(ex)
+                if gone:
+                    self.forget(url)
+                self.log.warning("Could not post logs through a webhook: %s", ex)
+                try:
+                    await fallback(embeds[sent:], gone)
+                except Exception:
+                    self.log.exception("Could not post logs after a webhook failed")
+                return
+            self.metrics.count("fuzzy_log_messages_total", route="webhook")
+            sent += len(batch)
@@ -0,0 +1,179 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """A fixed-bucket histogram of durations in seconds."""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Record a single value."""
+        self.counts[bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def mean(self) -> float:
+        """The average of all recorded values."""
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls into."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    In-process counters and histograms. Everything is keyed by a metric name and a set of
+    labels so it can be rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger("Fuzzy").getChild("Metrics")
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(
+            lambda: defaultdict(Histogram)
+        )
+        self.counters: Dict[str, Dict[Labels, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        self.started_at = time.time()
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value in the histogram `name`."""
+        self.histograms[name][tuple(labels.items())].observe(value)
+
+    def count(self, name: str, amount: int = 1, **labels):
+        """Increase the counter `name`."""
+        self.counters[name][tuple(labels.items())] += amount
+
+    @contextmanager
+    def timed(self, name: str, **labels) -> Iterator[None]:
+        """Record how long the body of the with statement takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def instrument(self, repository, name: str):
+        """Wrap every public method of a repository to record its call count and duration."""
+        for attribute in dir(type(repository)):
+            if attribute.startswith("_"):
+                continue
+            method = getattr(repository, attribute)
+            if callable(method):
+                setattr(repository, attribute, self._timed_call(method, name))
+
+    def _timed_call(self, method, repository: str):
+        histogram = self.histograms["fuzzy_db_query_seconds"][
+            (("repository", repository), ("method", method.__name__))
+        ]
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    def top(self, name: str, limit: int = 10) -> List[Tuple[Dict, Histogram]]:
+        """Return the series of histogram `name` with the highest total time."""
+        series = sorted(
+            (item for item in self.histograms[name].items() if item[1].count),
+            key=lambda item: item[1].total,
+            reverse=True,
+        )
+        return [(dict(labels), histogram) for labels, histogram in series[:limit]]
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# TYPE fuzzy_uptime_seconds gauge",
+            f"fuzzy_uptime_seconds {time.time() - self.started_at:.3f}",
+        ]
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{self._labels(labels)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip((*Histogram.BUCKETS, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{self._labels(labels, le=bound)} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram.total:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels: Labels, **extra) -> str:
+        pairs = [*labels, *extra.items()]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{Metrics._escape(v)}"' for k, v in pairs) + "}"
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsServer:
+    """A tiny HTTP server exposing the metrics on /metrics for Prometheus to scrape."""
+
+    def __init__(self, metrics: Metrics, host: str, port: int):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """Start listening."""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.metrics.log.info(
+            f"Serving metrics on http://{self.host}:{self.port}/metrics"
+        )
+
+    async def stop(self):
+        """Stop listening."""
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def handle(self, _request: web.Request) -> web.Response:
+        """Serve the current metrics."""
+        return web.Response(
+            text=self.metrics.render_prometheus(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
@@ -0,0 +1,6 @@
+-- Keyset pagination of a user's infractions
+CREATE INDEX IF NOT EXISTS infractions_guild_user ON infractions (guild_id, user_id, oid);
+
+-- Hydrating infractions
+CREATE INDEX IF NOT EXISTS pardons_infraction ON pardons (infraction_id);
+CREATE INDEX IF NOT EXISTS published_messages_infraction ON published_messages (infraction_id);
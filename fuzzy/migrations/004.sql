@@ -0,0 +1,24 @@
+-- Full text search of infraction reasons, kept in sync with the infractions table
+CREATE VIRTUAL TABLE IF NOT EXISTS infractions_fts USING fts5 (
+    reason,
+    content='infractions',
+    content_rowid='oid'
+);
+
+CREATE TRIGGER IF NOT EXISTS infractions_fts_insert AFTER INSERT ON infractions BEGIN
+    INSERT INTO infractions_fts (rowid, reason) VALUES (new.oid, new.reason);
+END;
+
+CREATE TRIGGER IF NOT EXISTS infractions_fts_delete AFTER DELETE ON infractions BEGIN
+    INSERT INTO infractions_fts (infractions_fts, rowid, reason) VALUES ('delete', old.oid, old.reason);
+END;
+
+CREATE TRIGGER IF NOT EXISTS infractions_fts_update AFTER UPDATE OF reason ON infractions BEGIN
+    INSERT INTO infractions_fts (infractions_fts, rowid, reason) VALUES ('delete', old.oid, old.reason);
+    INSERT INTO infractions_fts (rowid, reason) VALUES (new.oid, new.reason);
+END;
+
+INSERT INTO infractions_fts (infractions_fts) VALUES ('rebuild');
+
+-- Searching by moderator
+CREATE INDEX IF NOT EXISTS infractions_guild_moderator ON infractions (guild_id, moderator_id, oid);
@@ -0,0 +1,15 @@
+-- Progress of bulk imports, so an interrupted import can be resumed
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source          TEXT        NOT NULL, -- SHA-256 of the imported file
+    guild_id        INTEGER     NOT NULL,
+    rows_done       INTEGER     NOT NULL,
+
+    PRIMARY KEY(source, guild_id),
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
+
+-- Indexes dropped for the duration of a bulk import, recreated once it's done
+CREATE TABLE IF NOT EXISTS deferred_indexes (
+    name            TEXT        PRIMARY KEY,
+    sql             TEXT        NOT NULL
+);
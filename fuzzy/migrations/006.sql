@@ -0,0 +1,25 @@
+-- Infractions moved out of the infractions table by the archival job, flattened together
+-- with their pardon and published messages
+CREATE TABLE IF NOT EXISTS infractions_archive (
+    id                          INTEGER     PRIMARY KEY, -- oid of the original infraction
+    user_id                     INTEGER     NOT NULL,
+    user_name                   TEXT        NOT NULL,
+    moderator_id                INTEGER     NOT NULL,
+    moderator_name              TEXT        NOT NULL,
+    guild_id                    INTEGER     NOT NULL,
+    reason                      TEXT,
+    infraction_on               timestamp   NOT NULL,
+    infraction_type             TEXT        NOT NULL,
+    pardon_moderator_id         INTEGER,
+    pardon_moderator_name       TEXT,
+    pardon_on                   timestamp,
+    pardon_reason               TEXT,
+    published_ban_message_id    INTEGER,
+    published_unban_message_id  INTEGER,
+    archived_on                 timestamp   NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS infractions_archive_guild ON infractions_archive (guild_id, id);
+
+-- Finding infractions past the archival horizon
+CREATE INDEX IF NOT EXISTS infractions_infraction_on ON infractions (DATETIME(infraction_on));
@@ -0,0 +1,3 @@
+-- Finding the mutes of an infraction, and the mutes that are still active
+CREATE INDEX IF NOT EXISTS mutes_infraction ON mutes (infraction_id);
+CREATE INDEX IF NOT EXISTS mutes_end_time ON mutes (DATETIME(end_time));
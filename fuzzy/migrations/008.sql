@@ -0,0 +1,3 @@
+-- Muting with Discord's timeouts instead of the mute role
+ALTER TABLE guilds ADD COLUMN mute_backend INTEGER NOT NULL DEFAULT 1 CHECK(mute_backend == 1 OR mute_backend == 2); -- ENUM
+ALTER TABLE mutes ADD COLUMN timeout INTEGER NOT NULL DEFAULT 0 CHECK(timeout == 1 OR timeout == 0); -- Bool
@@ -0,0 +1,13 @@
+-- Join raid detection settings
+CREATE TABLE IF NOT EXISTS raid_settings (
+    guild_id        INTEGER     PRIMARY KEY,
+    enabled         INTEGER     NOT NULL CHECK(enabled == 1 OR enabled == 0), -- Bool
+    joins           INTEGER     NOT NULL,
+    seconds         INTEGER     NOT NULL,
+    account_age     INTEGER     NOT NULL, -- Seconds
+    require_avatar  INTEGER     NOT NULL CHECK(require_avatar == 1 OR require_avatar == 0), -- Bool
+    action          INTEGER     NOT NULL CHECK(action IN (1, 2, 3)), -- ENUM
+    duration        INTEGER     NOT NULL, -- Seconds
+
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
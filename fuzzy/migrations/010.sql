@@ -0,0 +1,12 @@
+-- Automatic spam mute settings
+CREATE TABLE IF NOT EXISTS spam_settings (
+    guild_id        INTEGER     PRIMARY KEY,
+    enabled         INTEGER     NOT NULL CHECK(enabled == 1 OR enabled == 0), -- Bool
+    messages        INTEGER     NOT NULL,
+    mentions        INTEGER     NOT NULL,
+    seconds         INTEGER     NOT NULL,
+    duplicates      INTEGER     NOT NULL,
+    duration        INTEGER     NOT NULL, -- Seconds
+
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
@@ -0,0 +1,8 @@
+-- Words and phrases deleted by the message filter, stored in lower case
+CREATE TABLE IF NOT EXISTS filtered_words (
+    guild_id        INTEGER     NOT NULL,
+    word            TEXT        NOT NULL,
+
+    PRIMARY KEY(guild_id, word),
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
@@ -0,0 +1,9 @@
+-- Domains allowed or denied by the link filter, stored in lower case. '*' stands for every domain
+CREATE TABLE IF NOT EXISTS filtered_domains (
+    guild_id        INTEGER     NOT NULL,
+    domain          TEXT        NOT NULL,
+    allowed         INTEGER     NOT NULL CHECK(allowed == 1 OR allowed == 0), -- Bool
+
+    PRIMARY KEY(guild_id, domain),
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
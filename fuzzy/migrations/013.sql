@@ -0,0 +1,54 @@
+-- Unpardoned infractions per user, type and day, kept up to date by triggers so escalation rules
+-- can count active infractions without reading them
+CREATE TABLE IF NOT EXISTS infraction_counts (
+    guild_id        INTEGER     NOT NULL,
+    user_id         INTEGER     NOT NULL,
+    infraction_type TEXT        NOT NULL,
+    day             TEXT        NOT NULL, -- YYYY-MM-DD in UTC
+    count           INTEGER     NOT NULL,
+
+    PRIMARY KEY(guild_id, user_id, infraction_type, day)
+);
+
+INSERT INTO infraction_counts (guild_id, user_id, infraction_type, day, count)
+SELECT guild_id, user_id, infraction_type, DATE(infraction_on), COUNT(*) FROM infractions
+WHERE oid NOT IN (SELECT infraction_id FROM pardons)
+GROUP BY guild_id, user_id, infraction_type, DATE(infraction_on);
+
+CREATE TRIGGER IF NOT EXISTS infraction_counts_insert AFTER INSERT ON infractions BEGIN
+    INSERT INTO infraction_counts (guild_id, user_id, infraction_type, day, count)
+    VALUES (new.guild_id, new.user_id, new.infraction_type, DATE(new.infraction_on), 1)
+    ON CONFLICT(guild_id, user_id, infraction_type, day) DO UPDATE SET count=count + 1;
+END;
+
+-- Pardons are deleted before their infraction, so a pardoned infraction is counted again first
+CREATE TRIGGER IF NOT EXISTS infraction_counts_delete AFTER DELETE ON infractions
+WHEN NOT EXISTS (SELECT 1 FROM pardons WHERE infraction_id=old.oid) BEGIN
+    UPDATE infraction_counts SET count=count - 1
+    WHERE guild_id=old.guild_id AND user_id=old.user_id
+    AND infraction_type=old.infraction_type AND day=DATE(old.infraction_on);
+END;
+
+CREATE TRIGGER IF NOT EXISTS infraction_counts_pardon AFTER INSERT ON pardons BEGIN
+    UPDATE infraction_counts SET count=count - 1
+    WHERE (guild_id, user_id, infraction_type, day) =
+    (SELECT guild_id, user_id, infraction_type, DATE(infraction_on) FROM infractions WHERE oid=new.infraction_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS infraction_counts_unpardon AFTER DELETE ON pardons BEGIN
+    UPDATE infraction_counts SET count=count + 1
+    WHERE (guild_id, user_id, infraction_type, day) =
+    (SELECT guild_id, user_id, infraction_type, DATE(infraction_on) FROM infractions WHERE oid=old.infraction_id);
+END;
+
+-- What happens automatically once a user has `count` active infractions of a type
+CREATE TABLE IF NOT EXISTS escalation_rules (
+    guild_id        INTEGER     NOT NULL,
+    infraction_type TEXT        NOT NULL,
+    count           INTEGER     NOT NULL,
+    action          TEXT        NOT NULL,
+    duration        INTEGER, -- Seconds, for mutes
+
+    PRIMARY KEY(guild_id, infraction_type, count),
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
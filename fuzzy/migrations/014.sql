@@ -0,0 +1,14 @@
+-- Bans lifted automatically, at most one per user and guild. They don't reference their infraction,
+-- so archiving it doesn't cancel the ban
+CREATE TABLE IF NOT EXISTS temp_bans (
+    guild_id        INTEGER     NOT NULL,
+    user_id         INTEGER     NOT NULL,
+    user_name       TEXT        NOT NULL,
+    infraction_id   INTEGER     NOT NULL,
+    end_time        timestamp   NOT NULL,
+
+    PRIMARY KEY(guild_id, user_id),
+    FOREIGN KEY(guild_id) REFERENCES guilds(id)
+);
+
+CREATE INDEX IF NOT EXISTS temp_bans_end_time ON temp_bans (DATETIME(end_time));
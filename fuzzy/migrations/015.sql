@@ -0,0 +1,3 @@
+-- Delivering the mod log and public log through webhooks
+ALTER TABLE guilds ADD COLUMN mod_log_webhook TEXT;
+ALTER TABLE guilds ADD COLUMN public_log_webhook TEXT;
@@ -0,0 +1,124 @@
+-- Schema Version 1 of the PostgreSQL backend, equivalent to the SQLite migrations 001 to 006
+
+-- Database Metadata
+CREATE TABLE IF NOT EXISTS applied_migrations (
+    number INTEGER PRIMARY KEY
+);
+
+-- Guild Application Settings
+CREATE TABLE IF NOT EXISTS guilds (
+    id              BIGINT      PRIMARY KEY, -- Guild ID
+    mod_log         BIGINT,
+    public_log      BIGINT,
+    duration_type   INTEGER     CHECK(duration_type IN (1, 2, 3)), -- ENUM
+    duration        INTEGER,
+    mute_role       BIGINT
+);
+
+-- Saved Infractions
+CREATE TABLE IF NOT EXISTS infractions (
+    oid             BIGSERIAL   PRIMARY KEY,
+    user_id         BIGINT      NOT NULL,
+    user_name       TEXT        NOT NULL,
+    moderator_id    BIGINT      NOT NULL,
+    moderator_name  TEXT        NOT NULL,
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    reason          TEXT,
+    infraction_on   TIMESTAMPTZ NOT NULL,
+    infraction_type TEXT        NOT NULL,
+    -- Full text search of infraction reasons; 'simple' doesn't stem, like FTS5's default tokenizer
+    reason_search   TSVECTOR    GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(reason, ''))) STORED
+);
+
+CREATE INDEX IF NOT EXISTS infractions_guild_user ON infractions (guild_id, user_id, oid);
+CREATE INDEX IF NOT EXISTS infractions_guild_moderator ON infractions (guild_id, moderator_id, oid);
+CREATE INDEX IF NOT EXISTS infractions_infraction_on ON infractions (infraction_on);
+CREATE INDEX IF NOT EXISTS infractions_reason_search ON infractions USING GIN (reason_search);
+
+-- Saved Pardons
+CREATE TABLE IF NOT EXISTS pardons (
+    infraction_id   BIGINT      PRIMARY KEY REFERENCES infractions(oid) ON DELETE CASCADE,
+    moderator_id    BIGINT      NOT NULL,
+    moderator_name  TEXT        NOT NULL,
+    pardon_on       TIMESTAMPTZ NOT NULL,
+    reason          TEXT
+);
+
+-- SAVED MUTES
+CREATE TABLE IF NOT EXISTS mutes (
+    infraction_id   BIGINT      NOT NULL REFERENCES infractions(oid) ON DELETE CASCADE,
+    end_time        TIMESTAMPTZ NOT NULL,
+    user_id         BIGINT      NOT NULL,
+    user_name       TEXT        NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS mutes_infraction ON mutes (infraction_id);
+CREATE INDEX IF NOT EXISTS mutes_end_time ON mutes (end_time);
+
+-- Published Messages
+CREATE TABLE IF NOT EXISTS published_messages (
+    infraction_id   BIGINT      NOT NULL REFERENCES infractions(oid) ON DELETE CASCADE,
+    message_id      BIGINT      NOT NULL,
+    publish_type    INTEGER     NOT NULL CHECK(publish_type IN (1, 2)),
+
+    PRIMARY KEY(infraction_id, publish_type)
+);
+
+-- Locked Channels
+CREATE TABLE IF NOT EXISTS locks (
+    channel_id      BIGINT      PRIMARY KEY,
+    previous_value  BOOLEAN,
+    moderator_id    BIGINT      NOT NULL,
+    moderator_name  TEXT        NOT NULL,
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    reason          TEXT,
+    end_time        TIMESTAMPTZ NOT NULL
+);
+
+-- Locked Threads
+CREATE TABLE IF NOT EXISTS thread_locks (
+    channel_id      BIGINT      PRIMARY KEY,
+    moderator_id    BIGINT      NOT NULL,
+    moderator_name  TEXT        NOT NULL,
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    reason          TEXT,
+    end_time        TIMESTAMPTZ NOT NULL
+);
+
+-- Progress of bulk imports, so an interrupted import can be resumed
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source          TEXT        NOT NULL, -- SHA-256 of the imported file
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    rows_done       INTEGER     NOT NULL,
+
+    PRIMARY KEY(source, guild_id)
+);
+
+-- Indexes dropped for the duration of a bulk import, recreated once it's done
+CREATE TABLE IF NOT EXISTS deferred_indexes (
+    name            TEXT        PRIMARY KEY,
+    sql             TEXT        NOT NULL
+);
+
+-- Infractions moved out of the infractions table by the archival job, flattened together
+-- with their pardon and published messages
+CREATE TABLE IF NOT EXISTS infractions_archive (
+    id                          BIGINT      PRIMARY KEY, -- oid of the original infraction
+    user_id                     BIGINT      NOT NULL,
+    user_name                   TEXT        NOT NULL,
+    moderator_id                BIGINT      NOT NULL,
+    moderator_name              TEXT        NOT NULL,
+    guild_id                    BIGINT      NOT NULL,
+    reason                      TEXT,
+    infraction_on               TIMESTAMPTZ NOT NULL,
+    infraction_type             TEXT        NOT NULL,
+    pardon_moderator_id         BIGINT,
+    pardon_moderator_name       TEXT,
+    pardon_on                   TIMESTAMPTZ,
+    pardon_reason               TEXT,
+    published_ban_message_id    BIGINT,
+    published_unban_message_id  BIGINT,
+    archived_on                 TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS infractions_archive_guild ON infractions_archive (guild_id, id);
@@ -0,0 +1,3 @@
+-- Muting with Discord's timeouts instead of the mute role, equivalent to the SQLite migration 008
+ALTER TABLE guilds ADD COLUMN IF NOT EXISTS mute_backend INTEGER NOT NULL DEFAULT 1 CHECK(mute_backend IN (1, 2)); -- ENUM
+ALTER TABLE mutes ADD COLUMN IF NOT EXISTS timeout BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,11 @@
+-- Join raid detection settings, equivalent to the SQLite migration 009
+CREATE TABLE IF NOT EXISTS raid_settings (
+    guild_id        BIGINT      PRIMARY KEY REFERENCES guilds(id),
+    enabled         BOOLEAN     NOT NULL,
+    joins           INTEGER     NOT NULL,
+    seconds         INTEGER     NOT NULL,
+    account_age     INTEGER     NOT NULL, -- Seconds
+    require_avatar  BOOLEAN     NOT NULL,
+    action          INTEGER     NOT NULL CHECK(action IN (1, 2, 3)), -- ENUM
+    duration        INTEGER     NOT NULL -- Seconds
+);
@@ -0,0 +1,10 @@
+-- Automatic spam mute settings, equivalent to the SQLite migration 010
+CREATE TABLE IF NOT EXISTS spam_settings (
+    guild_id        BIGINT      PRIMARY KEY REFERENCES guilds(id),
+    enabled         BOOLEAN     NOT NULL,
+    messages        INTEGER     NOT NULL,
+    mentions        INTEGER     NOT NULL,
+    seconds         INTEGER     NOT NULL,
+    duplicates      INTEGER     NOT NULL,
+    duration        INTEGER     NOT NULL -- Seconds
+);
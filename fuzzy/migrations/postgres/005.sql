@@ -0,0 +1,7 @@
+-- Words and phrases deleted by the message filter, equivalent to the SQLite migration 011
+CREATE TABLE IF NOT EXISTS filtered_words (
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    word            TEXT        NOT NULL,
+
+    PRIMARY KEY(guild_id, word)
+);
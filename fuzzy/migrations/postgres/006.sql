@@ -0,0 +1,8 @@
+-- Domains allowed or denied by the link filter, equivalent to the SQLite migration 012
+CREATE TABLE IF NOT EXISTS filtered_domains (
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    domain          TEXT        NOT NULL,
+    allowed         BOOLEAN     NOT NULL,
+
+    PRIMARY KEY(guild_id, domain)
+);
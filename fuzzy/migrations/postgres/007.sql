@@ -0,0 +1,74 @@
+-- Unpardoned infractions per user, type and day, kept up to date by triggers, and escalation
+-- rules, equivalent to the SQLite migration 013
+CREATE TABLE IF NOT EXISTS infraction_counts (
+    guild_id        BIGINT      NOT NULL,
+    user_id         BIGINT      NOT NULL,
+    infraction_type TEXT        NOT NULL,
+    day             DATE        NOT NULL, -- in UTC
+    count           INTEGER     NOT NULL,
+
+    PRIMARY KEY(guild_id, user_id, infraction_type, day)
+);
+
+INSERT INTO infraction_counts (guild_id, user_id, infraction_type, day, count)
+SELECT guild_id, user_id, infraction_type, (infraction_on AT TIME ZONE 'UTC')::DATE, COUNT(*)
+FROM infractions
+WHERE oid NOT IN (SELECT infraction_id FROM pardons)
+GROUP BY guild_id, user_id, infraction_type, (infraction_on AT TIME ZONE 'UTC')::DATE
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION infraction_counts_add(infraction infractions, amount INTEGER)
+RETURNS VOID AS $$
+    INSERT INTO infraction_counts (guild_id, user_id, infraction_type, day, count)
+    VALUES (infraction.guild_id, infraction.user_id, infraction.infraction_type,
+            (infraction.infraction_on AT TIME ZONE 'UTC')::DATE, amount)
+    ON CONFLICT (guild_id, user_id, infraction_type, day)
+    DO UPDATE SET count=infraction_counts.count + amount;
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION infraction_counts_infraction() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM infraction_counts_add(NEW, 1);
+        RETURN NEW;
+    END IF;
+    -- runs before the pardon is deleted by the cascade, which then finds no infraction to count
+    IF NOT EXISTS (SELECT 1 FROM pardons WHERE infraction_id=OLD.oid) THEN
+        PERFORM infraction_counts_add(OLD, -1);
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION infraction_counts_pardon() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM infraction_counts_add(infractions, -1) FROM infractions WHERE oid=NEW.infraction_id;
+    ELSE
+        PERFORM infraction_counts_add(infractions, 1) FROM infractions WHERE oid=OLD.infraction_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS infraction_counts_insert ON infractions;
+CREATE TRIGGER infraction_counts_insert AFTER INSERT ON infractions
+FOR EACH ROW EXECUTE FUNCTION infraction_counts_infraction();
+
+DROP TRIGGER IF EXISTS infraction_counts_delete ON infractions;
+CREATE TRIGGER infraction_counts_delete BEFORE DELETE ON infractions
+FOR EACH ROW EXECUTE FUNCTION infraction_counts_infraction();
+
+DROP TRIGGER IF EXISTS infraction_counts_pardon ON pardons;
+CREATE TRIGGER infraction_counts_pardon AFTER INSERT OR DELETE ON pardons
+FOR EACH ROW EXECUTE FUNCTION infraction_counts_pardon();
+
+CREATE TABLE IF NOT EXISTS escalation_rules (
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    infraction_type TEXT        NOT NULL,
+    count           INTEGER     NOT NULL,
+    action          TEXT        NOT NULL,
+    duration        INTEGER, -- Seconds, for mutes
+
+    PRIMARY KEY(guild_id, infraction_type, count)
+);
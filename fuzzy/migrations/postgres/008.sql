@@ -0,0 +1,12 @@
+-- Bans lifted automatically, equivalent to the SQLite migration 014
+CREATE TABLE IF NOT EXISTS temp_bans (
+    guild_id        BIGINT      NOT NULL REFERENCES guilds(id),
+    user_id         BIGINT      NOT NULL,
+    user_name       TEXT        NOT NULL,
+    infraction_id   BIGINT      NOT NULL,
+    end_time        TIMESTAMPTZ NOT NULL,
+
+    PRIMARY KEY(guild_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS temp_bans_end_time ON temp_bans (end_time);
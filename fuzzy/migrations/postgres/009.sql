@@ -0,0 +1,3 @@
+-- Delivering the mod log and public log through webhooks, equivalent to the SQLite migration 015
+ALTER TABLE guilds ADD COLUMN IF NOT EXISTS mod_log_webhook TEXT;
+ALTER TABLE guilds ADD COLUMN IF NOT EXISTS public_log_webhook TEXT;
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from enum import Enum
+from typing import Optional
 
 import discord
 
@@ -22,6 +23,17 @@ class PublishType(Enum):
     UNBAN = 2
 
 
+class MuteBackend(Enum):
+    ROLE = 1
+    TIMEOUT = 2
+
+
+class RaidAction(Enum):
+    ALERT = 1
+    LOCK = 2
+    MUTE = 3
+
+
 @dataclass
 class GuildSettings(object):
     id: int
@@ -30,6 +42,10 @@ class GuildSettings(object):
     duration_type: DurationType
     duration: int
     mute_role: int
+    mute_backend: MuteBackend = MuteBackend.ROLE
+    # the URLs of the webhooks the logs are posted through, if the guild uses them
+    mod_log_webhook: Optional[str] = None
+    public_log_webhook: Optional[str] = None
 
     def infraction_expired_time(self) -> datetime:
         if self.duration_type.value == DurationType.DAYS.value:
@@ -99,11 +115,37 @@ class Infraction(object):
         )
 
 
+@dataclass()
+class InfractionSearch(object):
+    """Filters for searching the infractions of a guild. Filters left as None are ignored."""
+
+    guild_id: int
+    text: Optional[str] = None
+    user_id: Optional[int] = None
+    moderator_id: Optional[int] = None
+    infraction_type: Optional[InfractionType] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    pardoned: Optional[bool] = None
+
+
 @dataclass()
 class Mute(object):
     infraction: Infraction
     end_time: datetime
     user: DBUser
+    # whether the mute is a Discord timeout instead of the mute role
+    timeout: bool = False
+
+
+@dataclass()
+class ActiveMute(object):
+    """A mute without its infraction, for going through all mutes of a guild."""
+
+    infraction_id: int
+    end_time: datetime
+    user: DBUser
+    timeout: bool = False
 
 
 @dataclass()
@@ -116,6 +158,16 @@ class Lock(object):
     end_time: datetime
 
 
+@dataclass()
+class TempBan(object):
+    """A ban that is lifted at `end_time`."""
+
+    infraction_id: int
+    guild_id: int
+    user: DBUser
+    end_time: datetime
+
+
 @dataclass()
 class ThreadLock(object):
     channel_id: int
@@ -123,3 +175,47 @@ class ThreadLock(object):
     guild: GuildSettings
     reason: str
     end_time: datetime
+
+
+@dataclass()
+class RaidSettings(object):
+    """How a guild detects and responds to join raids."""
+
+    guild_id: int
+    enabled: bool = False
+    # a raid is this many joins within this many seconds
+    joins: int = 10
+    seconds: int = 10
+    # if set, only joins of accounts younger than this or without an avatar are counted
+    account_age: timedelta = timedelta()
+    require_avatar: bool = False
+    action: RaidAction = RaidAction.ALERT
+    # how long raid mode, and the locks or mutes it causes, lasts
+    duration: timedelta = timedelta(minutes=30)
+
+
+@dataclass()
+class SpamSettings(object):
+    """When a guild automatically mutes members for spamming."""
+
+    guild_id: int
+    enabled: bool = False
+    # more than this many messages, or mentions, within this many seconds is spam
+    messages: int = 8
+    mentions: int = 10
+    seconds: int = 5
+    # posting the same message this many times in a row is spam
+    duplicates: int = 4
+    duration: timedelta = timedelta(minutes=10)
+
+
+@dataclass()
+class EscalationRule(object):
+    """What happens automatically once a user has `count` active infractions of a type."""
+
+    guild_id: int
+    infraction_type: InfractionType
+    count: int
+    # a mute or a ban, for `duration` if there is one
+    action: InfractionType
+    duration: Optional[timedelta] = None
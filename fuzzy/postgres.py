@@ -0,0 +1,1144 @@
+"""
+The PostgreSQL backend. It implements the same interfaces as the SQLite one in fuzzy.databases,
+but several bot processes can share one database. psycopg and psycopg_pool are only needed for
+this backend: install them with `pip install "psycopg[binary]" psycopg_pool`.
+"""
+import logging
+from pathlib import Path
+
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+from fuzzy.databases import shard_condition
+from fuzzy.interfaces import *
+from fuzzy.models import *
+
+# every column needed to build an Infraction, so it takes a single query
+SELECT_INFRACTIONS = (
+    "SELECT infractions.*, "
+    "pardons.moderator_id AS pardon_moderator_id, "
+    "pardons.moderator_name AS pardon_moderator_name, "
+    "pardons.pardon_on, pardons.reason AS pardon_reason, "
+    "published_ban.message_id AS published_ban_message_id, "
+    "published_unban.message_id AS published_unban_message_id "
+    "FROM infractions "
+    "LEFT JOIN pardons ON pardons.infraction_id=infractions.oid "
+    "LEFT JOIN published_messages published_ban "
+    "ON published_ban.infraction_id=infractions.oid AND published_ban.publish_type=1 "
+    "LEFT JOIN published_messages published_unban "
+    "ON published_unban.infraction_id=infractions.oid AND published_unban.publish_type=2 "
+)
+
+
+class PostgresDatabase:
+    def __init__(self, config):
+        self.config = config
+        self.log = logging.getLogger("fuzzy")
+        self.log.setLevel(logging.INFO)
+
+        self.pool = ConnectionPool(
+            config["database"]["dsn"],
+            min_size=1,
+            max_size=int(config["database"].get("pool_size", "5")),
+            kwargs={"autocommit": True, "row_factory": dict_row},
+            configure=lambda conn: conn.execute("SET TIME ZONE 'UTC'"),
+            open=True,
+        )
+        self.migrate(Path(config["database"]["migrations"]) / "postgres")
+
+        self.infractions = Infractions(self.pool, self)
+        self.pardons = Pardons(self.pool)
+        self.mutes = Mutes(self.pool, self)
+        self.guilds = Guilds(self.pool)
+        self.locks = Locks(self.pool, self)
+        self.published_messages = PublishedMessages(self.pool)
+        self.thread_locks = ThreadLocks(self.pool, self)
+        self.imports = Imports(self.pool)
+        self.archives = Archives(self.pool)
+        self.raids = Raids(self.pool)
+        self.spam = Spam(self.pool)
+        self.filters = Filters(self.pool)
+        self.escalations = Escalations(self.pool)
+        self.temp_bans = TempBans(self.pool)
+        # indexes are left deferred if the bot stopped during an import
+        self.imports.restore_indexes()
+
+    def migrate(self, migrations: Path):
+        """Apply new migrations. Shards starting at the same time wait for each other."""
+        with self.pool.connection() as conn, conn.transaction():
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext('fuzzy_migrations'))")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS applied_migrations (number INTEGER PRIMARY KEY)"
+            )
+            last_migration_number = conn.execute(
+                "SELECT COALESCE(MAX(number), 0) AS number FROM applied_migrations"
+            ).fetchone()["number"]
+            for path in sorted(migrations.glob("*.sql")):
+                number = int(path.stem)
+                if number > last_migration_number:
+                    conn.execute(path.read_text())
+                    conn.execute("INSERT INTO applied_migrations VALUES(%s)", (number,))
+                    self.log.info(f"Applied migration {number}")
+
+    def instrument(self, metrics):
+        """Record call counts and durations of every repository method."""
+        for name in (
+            "infractions",
+            "pardons",
+            "mutes",
+            "guilds",
+            "locks",
+            "published_messages",
+            "thread_locks",
+            "imports",
+            "archives",
+            "raids",
+            "spam",
+            "filters",
+            "escalations",
+            "temp_bans",
+        ):
+            metrics.instrument(getattr(self, name), name)
+
+    def close(self):
+        self.pool.close()
+
+
+class Repository:
+    """Runs queries on a connection borrowed from the pool."""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    def fetchone(self, sql: str, values=None) -> Optional[Dict]:
+        with self.pool.connection() as conn:
+            return conn.execute(sql, values).fetchone()
+
+    def fetchall(self, sql: str, values=None) -> List[Dict]:
+        with self.pool.connection() as conn:
+            return conn.execute(sql, values).fetchall()
+
+    def execute(self, sql: str, values=None) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute(sql, values).rowcount
+
+
+class Infractions(Repository, IInfractions):
+    def __init__(self, pool: ConnectionPool, db: PostgresDatabase):
+        super().__init__(pool)
+        self.db = db
+
+    def find_by_id(self, infraction_id: int, guild_id: int) -> Infraction:
+        infraction = self.fetchone(
+            SELECT_INFRACTIONS
+            + "WHERE infractions.oid=%(id)s AND infractions.guild_id=%(guild_id)s",
+            {"id": infraction_id, "guild_id": guild_id},
+        )
+        return self._from_row(infraction) if infraction else None
+
+    def find_by_id_only(self, infraction_id: int) -> Infraction:
+        infraction = self.fetchone(
+            SELECT_INFRACTIONS + "WHERE infractions.oid=%(id)s", {"id": infraction_id}
+        )
+        return self._from_row(infraction) if infraction else None
+
+    def save(self, infraction: Infraction) -> Infraction:
+        if infraction.id:
+            self.execute(
+                "UPDATE infractions SET reason=%(reason)s, "
+                "moderator_id=%(moderator_id)s, "
+                "moderator_name=%(moderator_name)s WHERE oid=%(id)s",
+                {
+                    "reason": infraction.reason,
+                    "moderator_id": infraction.moderator.id,
+                    "moderator_name": infraction.moderator.name,
+                    "id": infraction.id,
+                },
+            )
+        else:
+            infraction.id = self.fetchone(
+                "INSERT INTO infractions (user_id, user_name, moderator_id, moderator_name, "
+                "guild_id, reason, infraction_on, infraction_type) "
+                "VALUES(%s,%s,%s,%s,%s,%s,%s,%s) RETURNING oid",
+                (
+                    infraction.user.id,
+                    infraction.user.name,
+                    infraction.moderator.id,
+                    infraction.moderator.name,
+                    infraction.guild.id,
+                    infraction.reason,
+                    infraction.infraction_on,
+                    infraction.infraction_type.value,
+                ),
+            )["oid"]
+        return self.find_by_id(infraction.id, infraction.guild.id)
+
+    def delete(self, infraction_id: int) -> None:
+        # pardons, published messages and mutes are deleted along with it
+        self.execute("DELETE FROM infractions WHERE oid=%(id)s", {"id": infraction_id})
+
+    def find_recent_ban_by_id(self, user_id, guild_id) -> Infraction:
+        infraction = self.fetchone(
+            SELECT_INFRACTIONS
+            + "WHERE infractions.user_id=%(user_id)s AND infractions.guild_id=%(guild_id)s "
+            "ORDER BY infractions.infraction_on DESC LIMIT 1",
+            {"user_id": user_id, "guild_id": guild_id},
+        )
+        return self._from_row(infraction) if infraction else None
+
+    def find_recent_ban_by_id_time_limited(self, user_id, guild_id) -> Infraction:
+        infraction = self.fetchone(
+            SELECT_INFRACTIONS
+            + "WHERE infractions.user_id=%(user_id)s AND infractions.guild_id=%(guild_id)s "
+            "AND infractions.infraction_on > %(infraction_on)s "
+            "ORDER BY infractions.oid DESC LIMIT 1",
+            {
+                "user_id": user_id,
+                "guild_id": guild_id,
+                "infraction_on": datetime.now(timezone.utc) - timedelta(minutes=1),
+            },
+        )
+        return self._from_row(infraction) if infraction else None
+
+    def find_all_for_user(self, user_id: int, guild_id: int) -> List[Infraction]:
+        return self._find_for_user(user_id, guild_id, None)
+
+    def find_warns_for_user(self, user_id: int, guild_id: int) -> List[Infraction]:
+        return self._find_for_user(user_id, guild_id, InfractionType.WARN)
+
+    def find_mutes_for_user(self, user_id: int, guild_id: int) -> List[Infraction]:
+        return self._find_for_user(user_id, guild_id, InfractionType.MUTE)
+
+    def find_bans_for_user(self, user_id: int, guild_id: int) -> List[Infraction]:
+        return self._find_for_user(user_id, guild_id, InfractionType.BAN)
+
+    def _find_for_user(
+        self,
+        user_id: int,
+        guild_id: int,
+        infraction_type: Optional[InfractionType],
+    ) -> List[Infraction]:
+        guild = self.db.guilds.find_by_id(guild_id)
+        infractions = self.fetchall(
+            SELECT_INFRACTIONS
+            + "WHERE infractions.user_id=%(user_id)s AND infractions.guild_id=%(guild_id)s "
+            "AND infractions.infraction_on > %(expired_time)s "
+            "AND (%(infraction_type)s::TEXT IS NULL "
+            "OR infractions.infraction_type=%(infraction_type)s) "
+            "ORDER BY infractions.infraction_on ASC",
+            {
+                "user_id": user_id,
+                "guild_id": guild_id,
+                "expired_time": guild.infraction_expired_time(),
+                "infraction_type": infraction_type.value if infraction_type else None,
+            },
+        )
+        return [self._from_row(infraction, guild) for infraction in infractions]
+
+    def find_page_for_user(
+        self,
+        user_id: int,
+        guild_id: int,
+        infraction_type: Optional[InfractionType] = None,
+        after_id: int = 0,
+        limit: int = 10,
+    ) -> List[Infraction]:
+        guild = self.db.guilds.find_by_id(guild_id)
+        infractions = self.fetchall(
+            SELECT_INFRACTIONS
+            + "WHERE infractions.guild_id=%(guild_id)s AND infractions.user_id=%(user_id)s "
+            "AND infractions.oid > %(after_id)s "
+            "AND infractions.infraction_on > %(expired_time)s "
+            "AND (%(infraction_type)s::TEXT IS NULL "
+            "OR infractions.infraction_type=%(infraction_type)s) "
+            "ORDER BY infractions.oid ASC LIMIT %(limit)s",
+            {
+                "user_id": user_id,
+                "guild_id": guild_id,
+                "after_id": after_id,
+                "expired_time": guild.infraction_expired_time(),
+                "infraction_type": infraction_type.value if infraction_type else None,
+                "limit": limit,
+            },
+        )
+        return [self._from_row(infraction, guild) for infraction in infractions]
+
+    def search(
+        self, query: InfractionSearch, after_id: int = 0, limit: int = 10
+    ) -> List[Infraction]:
+        conditions = [
+            "infractions.guild_id=%(guild_id)s",
+            "infractions.oid > %(after_id)s",
+        ]
+        values = {"guild_id": query.guild_id, "after_id": after_id, "limit": limit}
+        if query.text:
+            # plainto_tsquery ignores operators, so user input is treated as plain terms
+            conditions.append(
+                "infractions.reason_search @@ plainto_tsquery('simple', %(text)s)"
+            )
+            values["text"] = query.text
+        if query.user_id:
+            conditions.append("infractions.user_id=%(user_id)s")
+            values["user_id"] = query.user_id
+        if query.moderator_id:
+            conditions.append("infractions.moderator_id=%(moderator_id)s")
+            values["moderator_id"] = query.moderator_id
+        if query.infraction_type:
+            conditions.append("infractions.infraction_type=%(infraction_type)s")
+            values["infraction_type"] = query.infraction_type.value
+        if query.since:
+            conditions.append("infractions.infraction_on >= %(since)s")
+            values["since"] = query.since
+        if query.until:
+            conditions.append("infractions.infraction_on < %(until)s")
+            values["until"] = query.until
+        if query.pardoned is not None:
+            conditions.append(
+                "pardons.infraction_id IS " + ("NOT NULL" if query.pardoned else "NULL")
+            )
+
+        guild = self.db.guilds.find_by_id(query.guild_id)
+        infractions = self.fetchall(
+            SELECT_INFRACTIONS
+            + "WHERE "
+            + " AND ".join(conditions)
+            + " ORDER BY infractions.oid ASC LIMIT %(limit)s",
+            values,
+        )
+        return [self._from_row(infraction, guild) for infraction in infractions]
+
+    def export(self, guild_id: int, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        # archived infractions first, then those still in the infractions table
+        queries = (
+            "SELECT id, user_id, user_name, moderator_id, moderator_name, reason, "
+            "infraction_on, infraction_type, pardon_moderator_id, pardon_moderator_name, "
+            "pardon_on, pardon_reason, published_ban_message_id, published_unban_message_id "
+            "FROM infractions_archive WHERE guild_id=%(guild_id)s ORDER BY id ASC",
+            "SELECT infractions.oid AS id, infractions.user_id, infractions.user_name, "
+            "infractions.moderator_id, infractions.moderator_name, infractions.reason, "
+            "infractions.infraction_on, infractions.infraction_type, pardon_moderator_id, "
+            "pardon_moderator_name, pardon_on, pardon_reason, published_ban_message_id, "
+            "published_unban_message_id "
+            f"FROM ({SELECT_INFRACTIONS}) infractions "
+            "WHERE infractions.guild_id=%(guild_id)s ORDER BY infractions.oid ASC",
+        )
+        # server-side cursors only hold the current chunk in memory
+        with self.pool.connection() as conn, conn.transaction():
+            for index, sql in enumerate(queries):
+                with conn.cursor(name=f"export_{index}") as cursor:
+                    cursor.execute(sql, {"guild_id": guild_id})
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield rows
+
+    def _from_row(
+        self, infraction: Dict, guild: Optional[GuildSettings] = None
+    ) -> Infraction:
+        oid = infraction["oid"]
+        return Infraction(
+            oid,
+            DBUser(infraction["user_id"], infraction["user_name"]),
+            DBUser(infraction["moderator_id"], infraction["moderator_name"]),
+            guild or self.db.guilds.find_by_id(infraction["guild_id"]),
+            infraction["reason"],
+            infraction["infraction_on"],
+            InfractionType(infraction["infraction_type"]),
+            Pardon(
+                oid,
+                DBUser(
+                    infraction["pardon_moderator_id"],
+                    infraction["pardon_moderator_name"],
+                ),
+                infraction["pardon_on"],
+                infraction["pardon_reason"],
+            )
+            if infraction["pardon_on"]
+            else None,
+            PublishedMessage(
+                oid, infraction["published_ban_message_id"], PublishType.BAN
+            )
+            if infraction["published_ban_message_id"]
+            else None,
+            PublishedMessage(
+                oid, infraction["published_unban_message_id"], PublishType.UNBAN
+            )
+            if infraction["published_unban_message_id"]
+            else None,
+        )
+
+    def find_mod_actions(self, moderator_id, guild_id) -> Dict:
+        return self.fetchone(
+            "SELECT COUNT(*) FILTER (WHERE infraction_type=%(warn)s) AS warns, "
+            "COUNT(*) FILTER (WHERE infraction_type=%(mute)s) AS mutes, "
+            "COUNT(*) FILTER (WHERE infraction_type=%(ban)s) AS bans "
+            "FROM infractions WHERE moderator_id=%(moderator_id)s AND guild_id=%(guild_id)s",
+            {
+                "moderator_id": moderator_id,
+                "guild_id": guild_id,
+                "warn": InfractionType.WARN.value,
+                "mute": InfractionType.MUTE.value,
+                "ban": InfractionType.BAN.value,
+            },
+        )
+
+    def count_active(
+        self, user_id: int, guild_id: int, infraction_type: InfractionType
+    ) -> int:
+        expired_time = self.db.guilds.find_by_id(guild_id).infraction_expired_time()
+        return self.fetchone(
+            "SELECT COALESCE(SUM(count), 0) AS count FROM infraction_counts "
+            "WHERE guild_id=%(guild_id)s AND user_id=%(user_id)s "
+            "AND infraction_type=%(infraction_type)s AND day > %(expired_day)s",
+            {
+                "guild_id": guild_id,
+                "user_id": user_id,
+                "infraction_type": infraction_type.value,
+                "expired_day": expired_time.date(),
+            },
+        )["count"]
+
+
+class Pardons(Repository, IPardons):
+    def find_by_id(self, infraction_id: int) -> Pardon:
+        pardon = self.fetchone(
+            "SELECT * FROM pardons WHERE infraction_id=%(infraction_id)s",
+            {"infraction_id": infraction_id},
+        )
+        return (
+            Pardon(
+                pardon["infraction_id"],
+                DBUser(pardon["moderator_id"], pardon["moderator_name"]),
+                pardon["pardon_on"],
+                pardon["reason"],
+            )
+            if pardon
+            else None
+        )
+
+    def save(self, pardon: Pardon) -> Pardon:
+        # like the SQLite backend, saving an existing pardon only changes its reason
+        self.execute(
+            "INSERT INTO pardons (infraction_id, moderator_id, moderator_name, pardon_on, reason) "
+            "VALUES(%s,%s,%s,%s,%s) "
+            "ON CONFLICT (infraction_id) DO UPDATE SET reason=EXCLUDED.reason",
+            (
+                pardon.infraction_id,
+                pardon.moderator.id,
+                pardon.moderator.name,
+                pardon.pardon_on,
+                pardon.reason,
+            ),
+        )
+        return self.find_by_id(pardon.infraction_id)
+
+    def delete(self, infraction_id: int) -> None:
+        self.execute(
+            "DELETE FROM pardons WHERE infraction_id=%(id)s", {"id": infraction_id}
+        )
+
+
+class Mutes(Repository, IMutes):
+    def __init__(self, pool: ConnectionPool, db: PostgresDatabase):
+        super().__init__(pool)
+        self.db = db
+
+    def find_by_id(self, infraction_id: int) -> Mute:
+        mute = self.fetchone(
+            "SELECT * FROM mutes WHERE infraction_id=%(infraction_id)s",
+            {"infraction_id": infraction_id},
+        )
+        return self._from_row(mute) if mute else None
+
+    def find_expired_mutes(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Mute]:
+        mutes = self.fetchall(
+            "SELECT mutes.* FROM mutes "
+            "JOIN infractions ON infractions.oid=mutes.infraction_id "
+            "WHERE mutes.end_time < %(time)s AND "
+            + shard_condition("infractions.guild_id", shard_count, shard_ids, "%%"),
+            {"time": datetime.now(timezone.utc)},
+        )
+        return [self._from_row(mute) for mute in mutes]
+
+    def save(self, mute: Mute) -> Mute:
+        self.execute(
+            "INSERT INTO mutes (infraction_id, end_time, user_id, user_name, timeout) "
+            "VALUES(%s,%s,%s,%s,%s)",
+            (
+                mute.infraction.id,
+                mute.end_time,
+                mute.user.id,
+                mute.user.name,
+                mute.timeout,
+            ),
+        )
+        return self.find_by_id(mute.infraction.id)
+
+    def delete(self, infraction_id: int) -> None:
+        self.execute(
+            "DELETE FROM mutes WHERE infraction_id=%(id)s", {"id": infraction_id}
+        )
+
+    def find_active_mute(self, user_id, guild_id) -> Mute:
+        mute = self.fetchone(
+            "SELECT mutes.* FROM mutes "
+            "JOIN infractions ON infractions.oid=mutes.infraction_id "
+            "WHERE mutes.end_time > %(time)s AND mutes.user_id=%(user_id)s "
+            "AND infractions.guild_id=%(guild_id)s",
+            {
+                "time": datetime.now(timezone.utc),
+                "user_id": user_id,
+                "guild_id": guild_id,
+            },
+        )
+        return self._from_row(mute) if mute else None
+
+    def find_active_mutes_for_guild(
+        self, guild_id: int, after_id: int = 0, limit: int = 100
+    ) -> List[ActiveMute]:
+        mutes = self.fetchall(
+            "SELECT mutes.infraction_id, mutes.end_time, mutes.user_id, mutes.user_name, "
+            "mutes.timeout FROM mutes "
+            "JOIN infractions ON infractions.oid=mutes.infraction_id "
+            "WHERE mutes.end_time > %(time)s AND infractions.guild_id=%(guild_id)s "
+            "AND mutes.infraction_id > %(after_id)s "
+            "ORDER BY mutes.infraction_id ASC LIMIT %(limit)s",
+            {
+                "time": datetime.now(timezone.utc),
+                "guild_id": guild_id,
+                "after_id": after_id,
+                "limit": limit,
+            },
+        )
+        return [
+            ActiveMute(
+                mute["infraction_id"],
+                mute["end_time"],
+                DBUser(mute["user_id"], mute["user_name"]),
+                mute["timeout"],
+            )
+            for mute in mutes
+        ]
+
+    def _from_row(self, mute: Dict) -> Mute:
+        return Mute(
+            self.db.infractions.find_by_id_only(mute["infraction_id"]),
+            mute["end_time"],
+            DBUser(mute["user_id"], mute["user_name"]),
+            mute["timeout"],
+        )
+
+
+class TempBans(Repository, ITempBans):
+    def find_expired(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[TempBan]:
+        return [
+            TempBan(
+                temp_ban["infraction_id"],
+                temp_ban["guild_id"],
+                DBUser(temp_ban["user_id"], temp_ban["user_name"]),
+                temp_ban["end_time"],
+            )
+            for temp_ban in self.fetchall(
+                "SELECT * FROM temp_bans WHERE end_time < %(time)s AND "
+                + shard_condition("guild_id", shard_count, shard_ids, "%%"),
+                {"time": datetime.now(timezone.utc)},
+            )
+        ]
+
+    def save(self, temp_ban: TempBan) -> TempBan:
+        self.execute(
+            "INSERT INTO temp_bans (guild_id, user_id, user_name, infraction_id, end_time) "
+            "VALUES(%(guild_id)s, %(user_id)s, %(user_name)s, %(infraction_id)s, %(end_time)s) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET user_name=EXCLUDED.user_name, "
+            "infraction_id=EXCLUDED.infraction_id, end_time=EXCLUDED.end_time",
+            {
+                "guild_id": temp_ban.guild_id,
+                "user_id": temp_ban.user.id,
+                "user_name": temp_ban.user.name,
+                "infraction_id": temp_ban.infraction_id,
+                "end_time": temp_ban.end_time,
+            },
+        )
+        return temp_ban
+
+    def delete_all(self, guild_id: int, user_ids: List[int]) -> None:
+        self.execute(
+            "DELETE FROM temp_bans WHERE guild_id=%(guild_id)s AND user_id = ANY(%(ids)s)",
+            {"guild_id": guild_id, "ids": list(user_ids)},
+        )
+
+
+class Guilds(Repository, IGuilds):
+    def find_by_id(self, guild_id: int) -> GuildSettings:
+        guild = self.fetchone("SELECT * FROM guilds WHERE id=%(id)s", {"id": guild_id})
+        return (
+            GuildSettings(
+                guild["id"],
+                guild["mod_log"],
+                guild["public_log"],
+                DurationType(guild["duration_type"])
+                if guild["duration_type"]
+                else None,
+                guild["duration"],
+                guild["mute_role"],
+                MuteBackend(guild["mute_backend"]),
+                guild["mod_log_webhook"],
+                guild["public_log_webhook"],
+            )
+            if guild
+            else None
+        )
+
+    def save(self, guild: GuildSettings) -> GuildSettings:
+        self.execute(
+            "INSERT INTO guilds (id, mod_log, public_log, duration_type, duration, mute_role, "
+            "mute_backend, mod_log_webhook, public_log_webhook) "
+            "VALUES(%(id)s, %(mod_log)s, %(public_log)s, %(duration_type)s, %(duration)s, "
+            "%(mute_role)s, %(mute_backend)s, %(mod_log_webhook)s, %(public_log_webhook)s) "
+            "ON CONFLICT (id) DO UPDATE SET mod_log=EXCLUDED.mod_log, "
+            "public_log=EXCLUDED.public_log, duration_type=EXCLUDED.duration_type, "
+            "duration=EXCLUDED.duration, mute_role=EXCLUDED.mute_role, "
+            "mute_backend=EXCLUDED.mute_backend, mod_log_webhook=EXCLUDED.mod_log_webhook, "
+            "public_log_webhook=EXCLUDED.public_log_webhook",
+            {
+                "id": guild.id,
+                "mod_log": guild.mod_log,
+                "public_log": guild.public_log,
+                "duration_type": guild.duration_type.value,
+                "duration": guild.duration,
+                "mute_role": guild.mute_role,
+                "mute_backend": guild.mute_backend.value,
+                "mod_log_webhook": guild.mod_log_webhook,
+                "public_log_webhook": guild.public_log_webhook,
+            },
+        )
+        return self.find_by_id(guild.id)
+
+    def delete(self, guild_id: int) -> None:
+        self.execute("DELETE FROM guilds WHERE id=%(id)s", {"id": guild_id})
+
+
+class Raids(Repository, IRaids):
+    def find_all(self) -> List[RaidSettings]:
+        return [
+            self._from_row(settings)
+            for settings in self.fetchall("SELECT * FROM raid_settings")
+        ]
+
+    def find_by_id(self, guild_id: int) -> Optional[RaidSettings]:
+        settings = self.fetchone(
+            "SELECT * FROM raid_settings WHERE guild_id=%(guild_id)s",
+            {"guild_id": guild_id},
+        )
+        return self._from_row(settings) if settings else None
+
+    def save(self, settings: RaidSettings) -> RaidSettings:
+        self.execute(
+            "INSERT INTO raid_settings (guild_id, enabled, joins, seconds, account_age, "
+            "require_avatar, action, duration) "
+            "VALUES(%(guild_id)s, %(enabled)s, %(joins)s, %(seconds)s, %(account_age)s, "
+            "%(require_avatar)s, %(action)s, %(duration)s) "
+            "ON CONFLICT (guild_id) DO UPDATE SET enabled=EXCLUDED.enabled, "
+            "joins=EXCLUDED.joins, seconds=EXCLUDED.seconds, "
+            "account_age=EXCLUDED.account_age, require_avatar=EXCLUDED.require_avatar, "
+            "action=EXCLUDED.action, duration=EXCLUDED.duration",
+            {
+                "guild_id": settings.guild_id,
+                "enabled": settings.enabled,
+                "joins": settings.joins,
+                "seconds": settings.seconds,
+                "account_age": int(settings.account_age.total_seconds()),
+                "require_avatar": settings.require_avatar,
+                "action": settings.action.value,
+                "duration": int(settings.duration.total_seconds()),
+            },
+        )
+        return self.find_by_id(settings.guild_id)
+
+    @staticmethod
+    def _from_row(settings: Dict) -> RaidSettings:
+        return RaidSettings(
+            settings["guild_id"],
+            settings["enabled"],
+            settings["joins"],
+            settings["seconds"],
+            timedelta(seconds=settings["account_age"]),
+            settings["require_avatar"],
+            RaidAction(settings["action"]),
+            timedelta(seconds=settings["duration"]),
+        )
+
+
+class Spam(Repository, ISpam):
+    def find_all(self) -> List[SpamSettings]:
+        return [
+            self._from_row(settings)
+            for settings in self.fetchall("SELECT * FROM spam_settings")
+        ]
+
+    def find_by_id(self, guild_id: int) -> Optional[SpamSettings]:
+        settings = self.fetchone(
+            "SELECT * FROM spam_settings WHERE guild_id=%(guild_id)s",
+            {"guild_id": guild_id},
+        )
+        return self._from_row(settings) if settings else None
+
+    def save(self, settings: SpamSettings) -> SpamSettings:
+        self.execute(
+            "INSERT INTO spam_settings (guild_id, enabled, messages, mentions, seconds, "
+            "duplicates, duration) "
+            "VALUES(%(guild_id)s, %(enabled)s, %(messages)s, %(mentions)s, %(seconds)s, "
+            "%(duplicates)s, %(duration)s) "
+            "ON CONFLICT (guild_id) DO UPDATE SET enabled=EXCLUDED.enabled, "
+            "messages=EXCLUDED.messages, mentions=EXCLUDED.mentions, "
+            "seconds=EXCLUDED.seconds, duplicates=EXCLUDED.duplicates, "
+            "duration=EXCLUDED.duration",
+            {
+                "guild_id": settings.guild_id,
+                "enabled": settings.enabled,
+                "messages": settings.messages,
+                "mentions": settings.mentions,
+                "seconds": settings.seconds,
+                "duplicates": settings.duplicates,
+                "duration": int(settings.duration.total_seconds()),
+            },
+        )
+        return self.find_by_id(settings.guild_id)
+
+    @staticmethod
+    def _from_row(settings: Dict) -> SpamSettings:
+        return SpamSettings(
+            settings["guild_id"],
+            settings["enabled"],
+            settings["messages"],
+            settings["mentions"],
+            settings["seconds"],
+            settings["duplicates"],
+            timedelta(seconds=settings["duration"]),
+        )
+
+
+class Filters(Repository, IFilters):
+    def find_words(self, guild_id: int) -> List[str]:
+        return [
+            word["word"]
+            for word in self.fetchall(
+                "SELECT word FROM filtered_words WHERE guild_id=%(guild_id)s ORDER BY word",
+                {"guild_id": guild_id},
+            )
+        ]
+
+    def add_words(self, guild_id: int, words: List[str]) -> None:
+        self.execute(
+            "INSERT INTO filtered_words (guild_id, word) "
+            "SELECT %(guild_id)s, UNNEST(%(words)s::TEXT[]) ON CONFLICT DO NOTHING",
+            {"guild_id": guild_id, "words": list(words)},
+        )
+
+    def remove_words(self, guild_id: int, words: List[str]) -> None:
+        self.execute(
+            "DELETE FROM filtered_words WHERE guild_id=%(guild_id)s AND word = ANY(%(words)s)",
+            {"guild_id": guild_id, "words": list(words)},
+        )
+
+    def find_domains(self, guild_id: int) -> Dict[str, bool]:
+        return {
+            domain["domain"]: domain["allowed"]
+            for domain in self.fetchall(
+                "SELECT domain, allowed FROM filtered_domains WHERE guild_id=%(guild_id)s "
+                "ORDER BY domain",
+                {"guild_id": guild_id},
+            )
+        }
+
+    def save_domains(self, guild_id: int, domains: List[str], allowed: bool) -> None:
+        self.execute(
+            "INSERT INTO filtered_domains (guild_id, domain, allowed) "
+            "SELECT %(guild_id)s, UNNEST(%(domains)s::TEXT[]), %(allowed)s "
+            "ON CONFLICT (guild_id, domain) DO UPDATE SET allowed=EXCLUDED.allowed",
+            {"guild_id": guild_id, "domains": list(domains), "allowed": allowed},
+        )
+
+    def remove_domains(self, guild_id: int, domains: List[str]) -> None:
+        self.execute(
+            "DELETE FROM filtered_domains "
+            "WHERE guild_id=%(guild_id)s AND domain = ANY(%(domains)s)",
+            {"guild_id": guild_id, "domains": list(domains)},
+        )
+
+
+class Escalations(Repository, IEscalations):
+    def find_by_guild(self, guild_id: int) -> List[EscalationRule]:
+        return [
+            EscalationRule(
+                rule["guild_id"],
+                InfractionType(rule["infraction_type"]),
+                rule["count"],
+                InfractionType(rule["action"]),
+                timedelta(seconds=rule["duration"])
+                if rule["duration"] is not None
+                else None,
+            )
+            for rule in self.fetchall(
+                "SELECT * FROM escalation_rules WHERE guild_id=%(guild_id)s "
+                "ORDER BY infraction_type, count",
+                {"guild_id": guild_id},
+            )
+        ]
+
+    def save(self, rule: EscalationRule) -> EscalationRule:
+        self.execute(
+            "INSERT INTO escalation_rules (guild_id, infraction_type, count, action, duration) "
+            "VALUES(%(guild_id)s, %(infraction_type)s, %(count)s, %(action)s, %(duration)s) "
+            "ON CONFLICT (guild_id, infraction_type, count) DO UPDATE SET "
+            "action=EXCLUDED.action, duration=EXCLUDED.duration",
+            {
+                "guild_id": rule.guild_id,
+                "infraction_type": rule.infraction_type.value,
+                "count": rule.count,
+                "action": rule.action.value,
+                "duration": int(rule.duration.total_seconds())
+                if rule.duration
+                else None,
+            },
+        )
+        return rule
+
+    def delete(
+        self, guild_id: int, infraction_type: InfractionType, count: int
+    ) -> None:
+        self.execute(
+            "DELETE FROM escalation_rules WHERE guild_id=%(guild_id)s "
+            "AND infraction_type=%(infraction_type)s AND count=%(count)s",
+            {
+                "guild_id": guild_id,
+                "infraction_type": infraction_type.value,
+                "count": count,
+            },
+        )
+
+
+class Locks(Repository, ILocks):
+    def __init__(self, pool: ConnectionPool, db: PostgresDatabase):
+        super().__init__(pool)
+        self.db = db
+
+    def find_by_id(self, channel_id: int) -> Lock:
+        lock = self.fetchone(
+            "SELECT * FROM locks WHERE channel_id=%(id)s", {"id": channel_id}
+        )
+        return self._from_row(lock) if lock else None
+
+    def find_expired_locks(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[Lock]:
+        locks = self.fetchall(
+            "SELECT * FROM locks WHERE end_time < %(time)s AND "
+            + shard_condition("guild_id", shard_count, shard_ids, "%%"),
+            {"time": datetime.now(timezone.utc)},
+        )
+        return [self._from_row(lock) for lock in locks]
+
+    def save(self, lock: Lock) -> Lock:
+        self.execute(
+            "INSERT INTO locks (channel_id, previous_value, moderator_id, moderator_name, "
+            "guild_id, reason, end_time) VALUES(%s,%s,%s,%s,%s,%s,%s) "
+            "ON CONFLICT (channel_id) DO UPDATE SET moderator_id=EXCLUDED.moderator_id, "
+            "moderator_name=EXCLUDED.moderator_name, reason=EXCLUDED.reason, "
+            "end_time=EXCLUDED.end_time",
+            (
+                lock.channel_id,
+                lock.previous_value,
+                lock.moderator.id,
+                lock.moderator.name,
+                lock.guild.id,
+                lock.reason,
+                lock.end_time,
+            ),
+        )
+        return self.find_by_id(lock.channel_id)
+
+    def save_all(self, locks: List[Lock]) -> None:
+        with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO locks (channel_id, previous_value, moderator_id, moderator_name, "
+                "guild_id, reason, end_time) VALUES(%s,%s,%s,%s,%s,%s,%s) "
+                "ON CONFLICT (channel_id) DO UPDATE SET moderator_id=EXCLUDED.moderator_id, "
+                "moderator_name=EXCLUDED.moderator_name, reason=EXCLUDED.reason, "
+                "end_time=EXCLUDED.end_time",
+                [
+                    (
+                        lock.channel_id,
+                        lock.previous_value,
+                        lock.moderator.id,
+                        lock.moderator.name,
+                        lock.guild.id,
+                        lock.reason,
+                        lock.end_time,
+                    )
+                    for lock in locks
+                ],
+            )
+
+    def delete(self, channel_id: int) -> None:
+        self.execute("DELETE FROM locks WHERE channel_id=%(id)s", {"id": channel_id})
+
+    def delete_all(self, channel_ids: List[int]) -> None:
+        self.execute(
+            "DELETE FROM locks WHERE channel_id = ANY(%(ids)s)",
+            {"ids": list(channel_ids)},
+        )
+
+    def _from_row(self, lock: Dict) -> Lock:
+        return Lock(
+            lock["channel_id"],
+            lock["previous_value"],
+            DBUser(lock["moderator_id"], lock["moderator_name"]),
+            self.db.guilds.find_by_id(lock["guild_id"]),
+            lock["reason"],
+            lock["end_time"],
+        )
+
+
+class ThreadLocks(Repository, IThreadLocks):
+    def __init__(self, pool: ConnectionPool, db: PostgresDatabase):
+        super().__init__(pool)
+        self.db = db
+
+    def find_by_id(self, channel_id: int) -> ThreadLock:
+        lock = self.fetchone(
+            "SELECT * FROM thread_locks WHERE channel_id=%(id)s", {"id": channel_id}
+        )
+        return self._from_row(lock) if lock else None
+
+    def find_expired_locks(
+        self, shard_count: int = 1, shard_ids: Optional[List[int]] = None
+    ) -> List[ThreadLock]:
+        locks = self.fetchall(
+            "SELECT * FROM thread_locks WHERE end_time < %(time)s AND "
+            + shard_condition("guild_id", shard_count, shard_ids, "%%"),
+            {"time": datetime.now(timezone.utc)},
+        )
+        return [self._from_row(lock) for lock in locks]
+
+    def save(self, lock: ThreadLock) -> ThreadLock:
+        self.execute(
+            "INSERT INTO thread_locks (channel_id, moderator_id, moderator_name, guild_id, "
+            "reason, end_time) VALUES(%s,%s,%s,%s,%s,%s) "
+            "ON CONFLICT (channel_id) DO UPDATE SET moderator_id=EXCLUDED.moderator_id, "
+            "moderator_name=EXCLUDED.moderator_name, reason=EXCLUDED.reason, "
+            "end_time=EXCLUDED.end_time",
+            (
+                lock.channel_id,
+                lock.moderator.id,
+                lock.moderator.name,
+                lock.guild.id,
+                lock.reason,
+                lock.end_time,
+            ),
+        )
+        return self.find_by_id(lock.channel_id)
+
+    def delete(self, channel_id: int) -> None:
+        self.execute(
+            "DELETE FROM thread_locks WHERE channel_id=%(id)s", {"id": channel_id}
+        )
+
+    def _from_row(self, lock: Dict) -> ThreadLock:
+        return ThreadLock(
+            lock["channel_id"],
+            DBUser(lock["moderator_id"], lock["moderator_name"]),
+            self.db.guilds.find_by_id(lock["guild_id"]),
+            lock["reason"],
+            lock["end_time"],
+        )
+
+
+class PublishedMessages(Repository, IPublishedMessages):
+    def find_by_id_and_type(
+        self, infraction_id: int, publish_type: PublishType
+    ) -> PublishedMessage:
+        publish = self.fetchone(
+            "SELECT * FROM published_messages WHERE infraction_id=%(infraction_id)s "
+            "AND publish_type=%(publish_type)s",
+            {"infraction_id": infraction_id, "publish_type": publish_type.value},
+        )
+        return (
+            PublishedMessage(
+                publish["infraction_id"],
+                publish["message_id"],
+                PublishType(publish["publish_type"]),
+            )
+            if publish
+            else None
+        )
+
+    def save(self, published_ban: PublishedMessage) -> PublishedMessage:
+        self.execute(
+            "INSERT INTO published_messages (infraction_id, message_id, publish_type) "
+            "VALUES(%s,%s,%s) "
+            "ON CONFLICT (infraction_id, publish_type) DO UPDATE SET message_id=EXCLUDED.message_id",
+            (
+                published_ban.infraction_id,
+                published_ban.message_id,
+                published_ban.publish_type.value,
+            ),
+        )
+        return self.find_by_id_and_type(
+            published_ban.infraction_id, published_ban.publish_type
+        )
+
+    def delete_with_type(self, infraction_id: int, publish_type: PublishType) -> None:
+        self.execute(
+            "DELETE FROM published_messages WHERE infraction_id=%(infraction_id)s "
+            "AND publish_type=%(publish_type)s",
+            {"infraction_id": infraction_id, "publish_type": publish_type.value},
+        )
+
+    def delete_all_with_id(self, infraction_id: int) -> None:
+        self.execute(
+            "DELETE FROM published_messages WHERE infraction_id=%(infraction_id)s",
+            {"infraction_id": infraction_id},
+        )
+
+
+class Imports(Repository, IImports):
+    def find_checkpoint(self, source: str, guild_id: int) -> int:
+        checkpoint = self.fetchone(
+            "SELECT rows_done FROM import_checkpoints "
+            "WHERE source=%(source)s AND guild_id=%(guild_id)s",
+            {"source": source, "guild_id": guild_id},
+        )
+        return checkpoint["rows_done"] if checkpoint else 0
+
+    def save_batch(
+        self, source: str, guild_id: int, rows_done: int, infractions: List[Infraction]
+    ) -> None:
+        with self.pool.connection() as conn, conn.transaction():
+            # reserve the IDs up front so pardons can refer to them
+            ids = [
+                row["oid"]
+                for row in conn.execute(
+                    "SELECT nextval(pg_get_serial_sequence('infractions', 'oid')) AS oid "
+                    "FROM generate_series(1, %s)",
+                    (len(infractions),),
+                )
+            ]
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    "INSERT INTO infractions (oid, user_id, user_name, moderator_id, "
+                    "moderator_name, guild_id, reason, infraction_on, infraction_type) "
+                    "VALUES(%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                    [
+                        (
+                            oid,
+                            infraction.user.id,
+                            infraction.user.name,
+                            infraction.moderator.id,
+                            infraction.moderator.name,
+                            guild_id,
+                            infraction.reason,
+                            infraction.infraction_on,
+                            infraction.infraction_type.value,
+                        )
+                        for oid, infraction in zip(ids, infractions)
+                    ],
+                )
+                cursor.executemany(
+                    "INSERT INTO pardons (infraction_id, moderator_id, moderator_name, "
+                    "pardon_on, reason) VALUES(%s,%s,%s,%s,%s)",
+                    [
+                        (
+                            oid,
+                            infraction.pardon.moderator.id,
+                            infraction.pardon.moderator.name,
+                            infraction.pardon.pardon_on,
+                            infraction.pardon.reason,
+                        )
+                        for oid, infraction in zip(ids, infractions)
+                        if infraction.pardon
+                    ],
+                )
+            conn.execute(
+                "INSERT INTO import_checkpoints (source, guild_id, rows_done) "
+                "VALUES(%(source)s, %(guild_id)s, %(rows_done)s) "
+                "ON CONFLICT (source, guild_id) DO UPDATE SET rows_done=EXCLUDED.rows_done",
+                {"source": source, "guild_id": guild_id, "rows_done": rows_done},
+            )
+
+    def defer_indexes(self) -> None:
+        with self.pool.connection() as conn, conn.transaction():
+            indexes = conn.execute(
+                "SELECT indexname AS name, indexdef AS sql FROM pg_indexes "
+                "WHERE schemaname=current_schema() AND tablename='infractions' "
+                "AND indexname NOT IN (SELECT conname FROM pg_constraint)"
+            ).fetchall()
+            for index in indexes:
+                conn.execute(
+                    "INSERT INTO deferred_indexes (name, sql) VALUES(%(name)s, %(sql)s) "
+                    "ON CONFLICT (name) DO UPDATE SET sql=EXCLUDED.sql",
+                    index,
+                )
+                conn.execute(f'DROP INDEX "{index["name"]}"')
+
+    def restore_indexes(self) -> None:
+        with self.pool.connection() as conn, conn.transaction():
+            for index in conn.execute(
+                "SELECT name, sql FROM deferred_indexes"
+            ).fetchall():
+                conn.execute(index["sql"])
+                conn.execute("DELETE FROM deferred_indexes WHERE name=%(name)s", index)
+
+
+class Archives(Repository, IArchives):
+    def archive_batch(self, before: datetime, batch_size: int) -> int:
+        with self.pool.connection() as conn, conn.transaction():
+            # rows another shard is archiving right now are left to it
+            ids = [
+                row["oid"]
+                for row in conn.execute(
+                    "SELECT oid FROM infractions WHERE infraction_on < %(before)s "
+                    # mutes and bans that haven't been lifted yet stay until they are
+                    "AND NOT EXISTS (SELECT 1 FROM mutes WHERE infraction_id=oid) "
+                    "AND NOT EXISTS (SELECT 1 FROM temp_bans WHERE infraction_id=oid) "
+                    "LIMIT %(limit)s FOR UPDATE SKIP LOCKED",
+                    {"before": before, "limit": batch_size},
+                )
+            ]
+            if ids:
+                conn.execute(
+                    "INSERT INTO infractions_archive "
+                    "SELECT oid, user_id, user_name, moderator_id, moderator_name, guild_id, "
+                    "reason, infraction_on, infraction_type, pardon_moderator_id, "
+                    "pardon_moderator_name, pardon_on, pardon_reason, published_ban_message_id, "
+                    "published_unban_message_id, %(archived_on)s "
+                    f"FROM ({SELECT_INFRACTIONS}) infractions WHERE oid = ANY(%(ids)s)",
+                    {"archived_on": datetime.now(timezone.utc), "ids": ids},
+                )
+                # pardons and published messages are deleted along with them
+                conn.execute(
+                    "DELETE FROM infractions WHERE oid = ANY(%(ids)s)", {"ids": ids}
+                )
+        return len(ids)
+
+    def delete_orphans(self) -> int:
+        # foreign keys keep these from piling up, but rows older than them may exist
+        deleted = 0
+        for table in ("pardons", "published_messages", "mutes"):
+            deleted += self.execute(
+                f"DELETE FROM {table} WHERE NOT EXISTS "
+                f"(SELECT 1 FROM infractions WHERE oid={table}.infraction_id)"
+            )
+        return deleted
+
+    def reclaim_space(self, pages: int) -> bool:
+        # autovacuum makes freed space reusable on its own; a plain VACUUM additionally
+        # returns empty pages at the end of the table to the file system
+        with self.pool.connection() as conn:
+            conn.execute("VACUUM infractions")
+        return True
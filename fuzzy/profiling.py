@@ -0,0 +1,82 @@
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+class Profiler:
+    """
+    Opt-in profiling of slow commands. A sample of commands is run under cProfile; if one takes
+    longer than the configured threshold its stats are written to the profile directory, named
+    after the command's log ID. cProfile sees everything the event loop runs in the meantime, so
+    only one command is profiled at a time.
+    """
+
+    def __init__(self, config):
+        self.log = logging.getLogger("Fuzzy").getChild("Profiler")
+        threshold = config["log"].get("profile_threshold")
+        self.threshold: Optional[float] = float(threshold) if threshold else None
+        self.sample_rate = float(config["log"].get("profile_sample_rate", "1"))
+        self.directory = Path(config["log"].get("profile_dir", "./profiles"))
+        self.keep = int(config["log"].get("profile_keep", "50"))
+        self.active = None
+        self.profile: Optional[cProfile.Profile] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether profiling has been configured."""
+        return self.threshold is not None
+
+    def start(self, ctx):
+        """Start profiling a command, if it is sampled and nothing else is being profiled."""
+        if not self.enabled or self.active or random.random() >= self.sample_rate:
+            return
+        self.active = ctx
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self, ctx) -> Optional[Path]:
+        """Stop profiling a command and save the result if it was slow."""
+        if self.active is not ctx:
+            return None
+        self.profile.disable()
+        profile, self.profile, self.active = self.profile, None, None
+
+        elapsed = time.perf_counter() - ctx.started_at
+        if elapsed < self.threshold:
+            return None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{ctx.error_id}.prof"
+        profile.dump_stats(path)
+        self.log.info("Saved profile %s of %s (%.2fs)", path.stem, ctx.command, elapsed)
+        for old in self.profiles()[self.keep :]:
+            old.unlink(missing_ok=True)
+        return path
+
+    def profiles(self) -> List[Path]:
+        """All saved profiles, newest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            self.directory.glob("*.prof"),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+
+    def find(self, profile_id: str) -> Optional[Path]:
+        """Find a saved profile by its log ID."""
+        path = self.directory / f"{Path(profile_id).name}.prof"
+        return path if path.is_file() else None
+
+    @staticmethod
+    def summary(path: Path, limit: int = 25) -> str:
+        """Render the most expensive calls of a saved profile as text."""
+        out = io.StringIO()
+        stats = pstats.Stats(str(path), stream=out)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,215 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, List
+
+from fuzzy.models import DBUser, GuildSettings, Infraction, InfractionType, Pardon
+
+EXPORT_FORMATS = ("jsonl", "csv")
+IMPORT_FORMATS = ("jsonl", "json", "csv")
+
+EXPORT_COLUMNS = (
+    "id",
+    "user_id",
+    "user_name",
+    "moderator_id",
+    "moderator_name",
+    "reason",
+    "infraction_on",
+    "infraction_type",
+    "pardon_moderator_id",
+    "pardon_moderator_name",
+    "pardon_on",
+    "pardon_reason",
+    "published_ban_message_id",
+    "published_unban_message_id",
+)
+
+
+def export_infractions(
+    db, guild_id: int, out: BinaryIO, export_format: str = "jsonl"
+) -> Iterator[int]:
+    """
+    Stream all infractions of a guild into `out` as gzip-compressed JSON lines or CSV. Rows are
+    read and written one chunk at a time; after every chunk this yields the number of rows
+    written so far, so callers can report progress or hand control back to the event loop.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"unsupported export format {export_format}")
+
+    with io.TextIOWrapper(
+        gzip.GzipFile(fileobj=out, mode="wb"), encoding="utf-8", newline=""
+    ) as text:
+        writer = None
+        if export_format == "csv":
+            writer = csv.DictWriter(text, EXPORT_COLUMNS)
+            writer.writeheader()
+
+        rows = 0
+        for chunk in db.infractions.export(guild_id):
+            for row in chunk:
+                for column, value in row.items():
+                    if isinstance(value, datetime):
+                        # timestamps are stored in UTC but read back without a timezone
+                        row[column] = value.replace(tzinfo=timezone.utc).isoformat()
+                if writer:
+                    writer.writerow(row)
+                else:
+                    text.write(json.dumps(row) + "\n")
+            rows += len(chunk)
+            yield rows
+
+
+@dataclass()
+class ImportReport(object):
+    """The progress of an import."""
+
+    rows: int = 0
+    imported: int = 0
+    skipped: int = 0
+    resumed_from: int = 0
+    errors: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def rows_per_second(self) -> float:
+        """How many rows were imported per second so far."""
+        elapsed = time.perf_counter() - self.started_at
+        return self.imported / elapsed if elapsed else 0.0
+
+
+def guess_import_format(filename: str) -> str:
+    """Guess the format of a dump from its file name, i.e. `warns.csv.gz` is csv."""
+    name = filename.lower().removesuffix(".gz")
+    for import_format in IMPORT_FORMATS:
+        if name.endswith(f".{import_format}"):
+            return import_format
+    raise ValueError(f"can't tell the format of {filename}")
+
+
+def read_rows(source: BinaryIO, import_format: str) -> Iterator[Dict]:
+    """Read the rows of a JSON, JSON lines or CSV dump, which may be gzip-compressed."""
+    if source.read(2) == b"\x1f\x8b":
+        source.seek(0)
+        source = gzip.GzipFile(fileobj=source, mode="rb")
+    else:
+        source.seek(0)
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+
+    if import_format == "csv":
+        yield from csv.DictReader(text)
+    elif import_format == "jsonl":
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    elif import_format == "json":
+        data = json.load(text)
+        yield from data["infractions"] if isinstance(data, dict) else data
+    else:
+        raise ValueError(f"unsupported import format {import_format}")
+
+
+def parse_time(value) -> datetime:
+    """Parse an ISO 8601 timestamp or a unix timestamp in seconds, assuming UTC."""
+    if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if not parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def parse_infraction(row: Dict, guild: GuildSettings) -> Infraction:
+    """
+    Validate a row of a dump and turn it into an Infraction. The columns are the same as those
+    written by export_infractions; only user_id, infraction_type and infraction_on are required.
+    """
+    types = {member.value.casefold(): member for member in InfractionType}
+    infraction_type = types.get(str(row["infraction_type"]).casefold())
+    if not infraction_type:
+        raise ValueError(f"unknown infraction type {row['infraction_type']}")
+
+    pardon = None
+    if row.get("pardon_on"):
+        # noinspection PyTypeChecker
+        pardon = Pardon(
+            None,
+            DBUser(
+                int(row.get("pardon_moderator_id") or 0),
+                row.get("pardon_moderator_name") or "Unknown#????",
+            ),
+            parse_time(row["pardon_on"]),
+            row.get("pardon_reason") or None,
+        )
+
+    # noinspection PyTypeChecker
+    return Infraction(
+        None,
+        DBUser(int(row["user_id"]), row.get("user_name") or "Unknown#????"),
+        DBUser(
+            int(row.get("moderator_id") or 0),
+            row.get("moderator_name") or "Unknown#????",
+        ),
+        guild,
+        row.get("reason") or None,
+        parse_time(row["infraction_on"]),
+        infraction_type,
+        pardon,
+        None,
+        None,
+    )
+
+
+def import_infractions(
+    db,
+    guild: GuildSettings,
+    source: BinaryIO,
+    import_format: str,
+    batch_size: int = 1000,
+    defer_indexes: bool = False,
+) -> Iterator[ImportReport]:
+    """
+    Import a dump of infractions into a guild. Rows are validated and inserted in batches, each
+    in a single transaction together with a checkpoint, so importing the same file again resumes
+    where the last attempt stopped. After every batch this yields the progress so far.
+    With `defer_indexes`, the indexes on infractions are dropped for the duration and rebuilt at
+    the end. Every query on infractions is slow until then, so only do that while the bot is
+    stopped.
+    """
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(1 << 20), b""):
+        digest.update(block)
+    source_hash = digest.hexdigest()
+    source.seek(0)
+
+    report = ImportReport()
+    report.resumed_from = db.imports.find_checkpoint(source_hash, guild.id)
+    batch = []
+    if defer_indexes:
+        db.imports.defer_indexes()
+    try:
+        for report.rows, row in enumerate(read_rows(source, import_format), 1):
+            if report.rows <= report.resumed_from:
+                continue
+            try:
+                batch.append(parse_infraction(row, guild))
+            except (KeyError, TypeError, ValueError) as ex:
+                report.skipped += 1
+                if len(report.errors) < 10:
+                    report.errors.append(f"Row {report.rows}: {ex!r}")
+            if len(batch) >= batch_size:
+                db.imports.save_batch(source_hash, guild.id, report.rows, batch)
+                report.imported += len(batch)
+                batch = []
+                yield report
+        db.imports.save_batch(source_hash, guild.id, report.rows, batch)
+        report.imported += len(batch)
+    finally:
+        if defer_indexes:
+            db.imports.restore_indexes()
+    yield report